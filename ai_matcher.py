@@ -1,17 +1,401 @@
-import pandas as pd
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from models import Event, SponsorProfile
+from sqlalchemy import event as orm_event, insert
+from sqlalchemy.exc import IntegrityError
+from app import db
+from flask import current_app
+from metrics import timed
+from replica import replica_reads
+from query_budget import unbudgeted
+from models import Event, SponsorProfile, MatchScore, MatchJob
+from datetime import datetime
+from collections import OrderedDict, namedtuple
 import logging
+import os
+import threading
+
+# numpy, scipy and scikit-learn live in matcher_engine, imported on first use
+
+# Theme keywords that signal relevance to each sponsor industry
+INDUSTRY_KEYWORDS = {
+    'technology': ['tech', 'innovation', 'startup', 'coding', 'hackathon', 'ai', 'software'],
+    'finance': ['business', 'finance', 'investment', 'entrepreneur', 'economics'],
+    'healthcare': ['health', 'medical', 'wellness', 'fitness', 'nutrition'],
+    'education': ['academic', 'research', 'scholarship', 'learning', 'study'],
+    'entertainment': ['music', 'arts', 'cultural', 'festival', 'concert', 'performance'],
+    'food_beverage': ['food', 'cooking', 'culinary', 'restaurant', 'dining'],
+    'automotive': ['automotive', 'racing', 'cars', 'vehicles', 'transportation'],
+    'retail': ['fashion', 'shopping', 'retail', 'consumer', 'lifestyle'],
+    'sports': ['sports', 'athletic', 'fitness', 'competition', 'tournament', 'game']
+}
+INDUSTRIES = list(INDUSTRY_KEYWORDS)
+
+
+def event_text(event):
+    """Text used for an event's TF-IDF document"""
+    return f"{event.tags} {event.theme} {event.description}"
+
+
+def sponsor_text(sponsor):
+    """Text used for a sponsor's TF-IDF document"""
+    return f"{sponsor.target_demographics} {sponsor.industry} {sponsor.description}"
+
+
+def theme_industries(theme):
+    """Bitmask of the industries whose keywords appear in an event theme"""
+    if not theme:
+        return 0
+    theme = ' '.join(theme.lower().split())
+    mask = 0
+    for bit, industry in enumerate(INDUSTRIES):
+        if any(keyword in theme for keyword in INDUSTRY_KEYWORDS[industry]):
+            mask |= 1 << bit
+    return mask
+
+
+def industry_bit(industry):
+    """Bit of a sponsor industry in theme_industries masks, 0 if unknown"""
+    return 1 << INDUSTRIES.index(industry) if industry in INDUSTRY_KEYWORDS else 0
+
+
+def _tokens(text):
+    return set(text.lower().split()) if text else set()
+
+
+# Per-entity inputs of the scorer, derived once from the row
+EventFeatures = namedtuple('EventFeatures', 'has_tags audience location industries footfall')
+SponsorFeatures = namedtuple('SponsorFeatures', 'has_demographics audience location industry')
+
+
+def footfall_bonus(footfall):
+    """Engagement bonus of an expected footfall bucket"""
+    if (footfall or 0) >= 500:
+        return 0.1
+    if (footfall or 0) >= 100:
+        return 0.05
+    return 0.0
+
+
+def extract_event_features(event):
+    return EventFeatures(
+        has_tags=bool(event.tags),
+        audience=frozenset(_tokens(event.target_audience)),
+        location=event.location.lower() if event.location else None,
+        industries=theme_industries(event.theme),
+        footfall=footfall_bonus(event.expected_footfall),
+    )
+
+
+def extract_sponsor_features(sponsor):
+    return SponsorFeatures(
+        has_demographics=bool(sponsor.target_demographics),
+        audience=frozenset(_tokens(sponsor.target_demographics)),
+        location=sponsor.location.lower() if sponsor.location else None,
+        industry=industry_bit(sponsor.industry),
+    )
+
+
+class FeatureStore:
+    """Cache of each entity's derived features, keyed by kind, id and row version.
+
+    Tokenising, lowercasing and keyword scans happen once per row version.
+    An entity loaded at a newer version, for example after another process
+    committed an edit, misses and replaces its old entry.
+    """
+
+    EXTRACT = {'event': extract_event_features, 'sponsor': extract_sponsor_features}
 
-class AIMatchmaker:
     def __init__(self):
-        self.vectorizer = TfidfVectorizer(stop_words='english', max_features=1000)
-    
+        self.features = {'event': {}, 'sponsor': {}}
+
+    def get(self, kind, entity):
+        entry = self.features[kind].get(entity.id)
+        if entry is not None and entry[0] == entity.version:
+            return entry[1]
+        features = self.EXTRACT[kind](entity)
+        if entity.id is not None:
+            self.features[kind][entity.id] = (entity.version, features)
+        return features
+
+    def invalidate(self, kind, entity_id):
+        self.features[kind].pop(entity_id, None)
+
+    def clear(self):
+        self.features = {'event': {}, 'sponsor': {}}
+
+
+class ScoreMemo:
+    """Bounded LRU of pair breakdowns keyed by (event id, version, sponsor id, version).
+
+    Row versions change on every update, so an edited entity simply stops
+    hitting its old entries, which age out of the LRU.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(event, sponsor):
+        """Cache key of a pair, or None while either row is unsaved"""
+        key = (event.id, event.version, sponsor.id, sponsor.version)
+        return None if None in key else key
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+def location_matches(event_loc, sponsor_loc):
+    return event_loc == sponsor_loc or event_loc in sponsor_loc or sponsor_loc in event_loc
+
+
+# Location component when the locations match, and when both are known but differ
+LOCATION_MATCH = 0.2
+LOCATION_KNOWN = 0.05
+
+COMPONENTS = ('text', 'audience', 'location', 'industry', 'footfall', 'total')
+
+
+class MatchBreakdown:
+    """Weighted components of one pair's score, named as in COMPONENTS.
+
+    ``total`` is what calculate_match_score returns, and ``explain`` reads the
+    same components, so explanations always agree with the score.
+    """
+
+    __slots__ = COMPONENTS
+
+    def __init__(self, text=0.0, audience=0.0, location=0.0, industry=0.0, footfall=0.0, total=None):
+        self.text = text
+        self.audience = audience
+        self.location = location
+        self.industry = industry
+        self.footfall = footfall
+        self.total = min(text + audience + location + industry + footfall, 1.0) if total is None else total
+
+    @classmethod
+    def from_components(cls, components, i, j):
+        """The breakdown of pair (i, j) in score_components' arrays"""
+        return cls(**{name: float(components[name][i, j]) for name in COMPONENTS})
+
+    @classmethod
+    def from_stored(cls, match_score):
+        """The breakdown saved with a MatchScore row"""
+        return cls(match_score.text_score, match_score.audience_score, match_score.location_score,
+                   match_score.industry_score, match_score.footfall_score, total=match_score.score)
+
+    def explain(self, industry):
+        """Why the pair scored what it did; ``industry`` is the sponsor's"""
+        explanations = []
+        if self.text > 0:
+            explanations.append("Relevant tags and demographics match")
+        if self.audience > 0:
+            explanations.append("Shared target audience")
+        if self.location >= LOCATION_MATCH:
+            explanations.append("Geographic proximity")
+        if self.industry > 0:
+            explanations.append(f"Event theme aligns with {industry} industry")
+        if self.footfall >= footfall_bonus(500):
+            explanations.append("High expected engagement")
+        elif self.footfall > 0:
+            explanations.append("Good expected engagement")
+        return explanations if explanations else ["Basic compatibility factors"]
+
+    def __repr__(self):
+        return 'MatchBreakdown(' + ', '.join(f'{name}={getattr(self, name):.3f}' for name in COMPONENTS) + ')'
+
+
+class AIMatchmaker:
+    def __init__(self, candidate_budget=None, snapshot=None, memo_size=10000):
+        # Created on first use so importing the matcher stays cheap
+        self._index = None
+        self._candidates = None
+        # Directory of a saved MatcherIndex to start from instead of fitting
+        self.snapshot = snapshot
+        self.features = FeatureStore()
+        self.memo = ScoreMemo(memo_size)
+        # Two-stage retrieval: only score this many candidates per row/column
+        self.candidate_budget = candidate_budget
+        self._scores_checked = False
+
+    @property
+    def index(self):
+        """Corpus TF-IDF index; the first access loads the numeric engine"""
+        if self._index is None:
+            from matcher_engine import MatcherIndex
+            self._index = MatcherIndex()
+        return self._index
+
+    @index.setter
+    def index(self, index):
+        self._index = index
+
+    @property
+    def candidates(self):
+        """Inverted index for two-stage retrieval"""
+        if self._candidates is None:
+            from matcher_engine import CandidateIndex
+            self._candidates = CandidateIndex()
+        return self._candidates
+
+    def ensure_index(self):
+        """Build the corpus index on first use, or rebuild it once outgrown"""
+        if not self.index.ready and self.snapshot:
+            self.load_snapshot()
+        if not self.index.needs_refit() and (self.candidates.built or not self.candidate_budget):
+            return
+        events, sponsors = self._catalog()
+        if self.candidate_budget:
+            self.candidates.build(events, sponsors)
+        try:
+            self.index.fit(events, sponsors)
+            # Text similarities change with the corpus
+            self.memo.clear()
+        except ValueError as e:
+            # Empty corpus or a vocabulary made only of stop words
+            logging.warning(f"Could not build matcher index: {e}")
+
+    def load_snapshot(self, directory=None):
+        """Swap in a saved index without touching the database; False if there is none"""
+        from matcher_engine import MatcherIndex
+        directory = directory or self.snapshot
+        try:
+            self.index = MatcherIndex.load(directory)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not load matcher snapshot from {directory}: {e}")
+            return False
+        self.memo.clear()
+        logging.info(f"Loaded matcher snapshot from {directory} ({self.index.fitted_size} documents)")
+        return True
+
+    def save_snapshot(self, directory=None):
+        """Fit the index over the current catalog and save it for other processes"""
+        self.index.fit(*self._catalog())
+        self.memo.clear()
+        self.index.save(directory or self.snapshot)
+
+    def _catalog(self):
+        """Every event and sponsor profile for fitting; a replica a few seconds behind is good enough"""
+        with replica_reads():
+            return Event.query.all(), SponsorProfile.query.all()
+
+    def forget(self, kind, entity_id):
+        """Drop the cached features and vector of an entity whose row changed"""
+        self.features.invalidate(kind, entity_id)
+        if self._index is not None:
+            self._index.invalidate(kind, entity_id)
+
+    @timed('matcher')
+    def refresh_events(self, events):
+        """Re-vectorize and rescore events after they were created or edited"""
+        for event in events:
+            self.forget('event', event.id)
+            if self.candidates.built:
+                self.candidates.add('event', event)
+        if self.candidate_budget:
+            for event in events:
+                self.rescore_event(event)
+        elif events:
+            self._store_scores(events, SponsorProfile.query.all(),
+                               MatchScore.event_id.in_([e.id for e in events]))
+
+    @timed('matcher')
+    def refresh_sponsors(self, sponsors):
+        """Re-vectorize and rescore sponsor profiles after they were created or edited"""
+        for sponsor in sponsors:
+            self.forget('sponsor', sponsor.id)
+            if self.candidates.built:
+                self.candidates.add('sponsor', sponsor)
+        if self.candidate_budget:
+            for sponsor in sponsors:
+                self.rescore_sponsor(sponsor)
+        elif sponsors:
+            self._store_scores(Event.query.all(), sponsors,
+                               MatchScore.sponsor_id.in_([s.id for s in sponsors]))
+
+    def refresh_event(self, event):
+        """Re-vectorize and rescore an event after it was created or edited"""
+        self.refresh_events([event])
+
+    def refresh_sponsor(self, sponsor):
+        """Re-vectorize and rescore a sponsor profile after it was created or edited"""
+        self.refresh_sponsors([sponsor])
+
+    def candidate_events(self, sponsor, budget=None):
+        """Stage one for a sponsor: ids of the events worth fully scoring"""
+        from matcher_engine import sponsor_terms
+        self.ensure_index()
+        if not self.candidates.built:
+            self.candidates.build(*self._catalog())
+        return self.candidates.search('event', sponsor_terms(sponsor), budget or self.candidate_budget)
+
+    def candidate_sponsors(self, event, budget=None):
+        """Stage one for an event: ids of the sponsors worth fully scoring"""
+        from matcher_engine import event_terms
+        self.ensure_index()
+        if not self.candidates.built:
+            self.candidates.build(*self._catalog())
+        return self.candidates.search('sponsor', event_terms(event), budget or self.candidate_budget)
+
+    @timed('matcher')
     def calculate_match_score(self, event, sponsor):
-        """Calculate match score between an event and a sponsor"""
+        """Calculate match score between an event and a sponsor, memoized per row version"""
+        return self.score_breakdown(event, sponsor).total
+
+    @timed('matcher')
+    def score_breakdown(self, event, sponsor):
+        """The MatchBreakdown of a pair, memoized per row version"""
+        key = self.memo.key(event, sponsor)
+        breakdown = self.memo.get(key) if key else None
+        if breakdown is None:
+            breakdown = self._score_breakdown(event, sponsor)
+            if key:
+                self.memo.set(key, breakdown)
+        return breakdown
+
+    @timed('matcher')
+    def stored_breakdown(self, event, sponsor):
+        """The pair's breakdown from the score table the dashboards rank by, scored live if not stored yet"""
+        stored = MatchScore.query.filter_by(event_id=event.id, sponsor_id=sponsor.id).first()
+        if stored is None:
+            return self.score_breakdown(event, sponsor)
+        return MatchBreakdown.from_stored(stored)
+
+    def _score_breakdown(self, event, sponsor):
         try:
+            event_features = self.features.get('event', event)
+            sponsor_features = self.features.get('sponsor', sponsor)
+
             # Initialize scores
             tag_score = 0
             audience_score = 0
@@ -19,131 +403,214 @@ class AIMatchmaker:
             industry_score = 0
             
             # Tag similarity score (40% weight)
-            if event.tags and sponsor.target_demographics:
-                event_text = f"{event.tags} {event.theme} {event.description}"
-                sponsor_text = f"{sponsor.target_demographics} {sponsor.industry} {sponsor.description}"
-                
+            if event_features.has_tags and sponsor_features.has_demographics:
                 try:
-                    vectors = self.vectorizer.fit_transform([event_text, sponsor_text])
-                    similarity = cosine_similarity(vectors[0:1], vectors[1:2])[0][0]
+                    self.ensure_index()
+                    similarity = self.index.similarity(event, sponsor)
                     tag_score = similarity * 0.4
                 except Exception as e:
                     logging.warning(f"Error calculating text similarity: {e}")
                     tag_score = 0.1
             
-            # Audience overlap score (25% weight)
-            if event.target_audience and sponsor.target_demographics:
-                event_audience = event.target_audience.lower()
-                sponsor_audience = sponsor.target_demographics.lower()
-                
-                # Simple keyword matching
-                common_words = set(event_audience.split()) & set(sponsor_audience.split())
-                audience_score = min(len(common_words) / 5, 1) * 0.25
+            # Audience overlap score (25% weight): shared audience tokens
+            common_words = event_features.audience & sponsor_features.audience
+            audience_score = min(len(common_words) / 5, 1) * 0.25
             
             # Location relevance score (20% weight)
-            if event.location and sponsor.location:
-                event_loc = event.location.lower()
-                sponsor_loc = sponsor.location.lower()
-                
+            if event_features.location and sponsor_features.location:
                 # Exact match or contains check
-                if event_loc == sponsor_loc or event_loc in sponsor_loc or sponsor_loc in event_loc:
-                    location_score = 0.2
+                if location_matches(event_features.location, sponsor_features.location):
+                    location_score = LOCATION_MATCH
                 else:
-                    location_score = 0.05  # Small bonus for any location data
+                    location_score = LOCATION_KNOWN  # Small bonus for any location data
             
-            # Industry relevance score (15% weight)
-            if event.theme and sponsor.industry:
-                industry_keywords = {
-                    'technology': ['tech', 'innovation', 'startup', 'coding', 'hackathon', 'ai', 'software'],
-                    'finance': ['business', 'finance', 'investment', 'entrepreneur', 'economics'],
-                    'healthcare': ['health', 'medical', 'wellness', 'fitness', 'nutrition'],
-                    'education': ['academic', 'research', 'scholarship', 'learning', 'study'],
-                    'entertainment': ['music', 'arts', 'cultural', 'festival', 'concert', 'performance'],
-                    'food_beverage': ['food', 'cooking', 'culinary', 'restaurant', 'dining'],
-                    'automotive': ['automotive', 'racing', 'cars', 'vehicles', 'transportation'],
-                    'retail': ['fashion', 'shopping', 'retail', 'consumer', 'lifestyle'],
-                    'sports': ['sports', 'athletic', 'fitness', 'competition', 'tournament', 'game']
-                }
-                
-                theme_words = event.theme.lower().split()
-                if sponsor.industry in industry_keywords:
-                    keywords = industry_keywords[sponsor.industry]
-                    matches = any(keyword in ' '.join(theme_words) for keyword in keywords)
-                    if matches:
-                        industry_score = 0.15
+            # Industry relevance score (15% weight): theme keywords of the sponsor's industry
+            if event_features.industries & sponsor_features.industry:
+                industry_score = 0.15
             
-            # Calculate total score
-            total_score = tag_score + audience_score + location_score + industry_score
-            
-            # Add bonus for event metrics
-            if event.expected_footfall:
-                if event.expected_footfall >= 500:
-                    total_score += 0.1  # High engagement bonus
-                elif event.expected_footfall >= 100:
-                    total_score += 0.05  # Medium engagement bonus
-            
-            return min(total_score, 1.0)  # Cap at 1.0
+            # Total plus the event metrics bonus, capped at 1.0
+            return MatchBreakdown(tag_score, audience_score, location_score, industry_score,
+                                  event_features.footfall)
             
         except Exception as e:
             logging.error(f"Error calculating match score: {e}")
-            return 0.1  # Default low score
+            return MatchBreakdown(total=0.1)  # Default low score
     
-    def get_sponsor_recommendations(self, event, limit=5):
-        """Get recommended sponsors for an event"""
+    def score_components(self, events, sponsors):
+        """Score every event x sponsor pair at once.
+
+        Returns a dict of (len(events), len(sponsors)) arrays, one per
+        component plus 'total'. Each entry equals what calculate_match_score
+        computes for that pair.
+        """
+        import numpy as np
+        from matcher_engine import MatchFeatures
+        if not events or not sponsors:
+            zeros = np.zeros((len(events), len(sponsors)))
+            return {name: zeros for name in COMPONENTS}
+        self.ensure_index()
+        return MatchFeatures.build(self.index, events, sponsors, self.features).score()
+
+    def score_matrix(self, events, sponsors):
+        """Match scores of every event x sponsor pair as one array"""
+        return self.score_components(events, sponsors)['total']
+
+    # Pairs scored and inserted at a time, so rescoring a wide row or column keeps memory flat
+    STORE_BLOCK = 50000
+
+    def _score_rows(self, events, sponsors):
+        """MatchScore rows of every event x sponsor pair, in lists of at most STORE_BLOCK"""
+        from matcher_engine import MatchFeatures
+        if not events or not sponsors:
+            return
+        self.ensure_index()
+        features = MatchFeatures.build(self.index, events, sponsors, self.features)
+        step = max(1, self.STORE_BLOCK // len(sponsors))
+        now = datetime.utcnow()
+        for start in range(0, len(events), step):
+            components = features.score(start, start + step)
+            yield [{
+                'event_id': event.id,
+                'sponsor_id': sponsor.id,
+                'score': float(components['total'][i, j]),
+                'text_score': float(components['text'][i, j]),
+                'audience_score': float(components['audience'][i, j]),
+                'location_score': float(components['location'][i, j]),
+                'industry_score': float(components['industry'][i, j]),
+                'footfall_score': float(components['footfall'][i, j]),
+                'updated_at': now,
+            } for i, event in enumerate(events[start:start + step]) for j, sponsor in enumerate(sponsors)]
+
+    def _store_scores(self, events, sponsors, stale=None):
+        """Replace the stored scores matched by ``stale`` with fresh ones, in one transaction"""
+        for attempt in range(2):
+            try:
+                if stale is not None:
+                    MatchScore.query.filter(stale).delete(synchronize_session=False)
+                for rows in self._score_rows(events, sponsors):
+                    db.session.execute(insert(MatchScore), rows)
+                db.session.commit()
+                return
+            except IntegrityError as e:
+                # A concurrent rescore of the crossing row/column stored the same pair
+                db.session.rollback()
+                if stale is None or attempt:
+                    raise
+                logging.warning(f"Retrying match score update: {e}")
+
+    @timed('matcher')
+    def rescore_event(self, event):
+        """Recompute the stored scores of one event against every (candidate) sponsor"""
+        if self.candidate_budget:
+            ids = self.candidate_sponsors(event)
+            sponsors = SponsorProfile.query.filter(SponsorProfile.id.in_(ids)).all() if ids else []
+        else:
+            sponsors = SponsorProfile.query.all()
+        self._store_scores([event], sponsors, MatchScore.event_id == event.id)
+
+    @timed('matcher')
+    def rescore_sponsor(self, sponsor):
+        """Recompute the stored scores of one sponsor against every (candidate) event"""
+        if self.candidate_budget:
+            ids = self.candidate_events(sponsor)
+            events = Event.query.filter(Event.id.in_(ids)).all() if ids else []
+        else:
+            events = Event.query.all()
+        self._store_scores(events, [sponsor], MatchScore.sponsor_id == sponsor.id)
+
+    @timed('matcher')
+    def rescore_all(self, chunk_size=500):
+        """Rebuild the whole score table, a chunk of events at a time"""
+        events = Event.query.all()
         sponsors = SponsorProfile.query.all()
-        recommendations = []
-        
-        for sponsor in sponsors:
-            score = self.calculate_match_score(event, sponsor)
-            recommendations.append({
-                'sponsor': sponsor,
-                'score': score,
-                'percentage': int(score * 100)
-            })
-        
-        # Sort by score and return top recommendations
-        recommendations.sort(key=lambda x: x['score'], reverse=True)
-        return recommendations[:limit]
+        if self.candidate_budget:
+            MatchScore.query.delete()
+            db.session.commit()
+            for sponsor in sponsors:
+                self.rescore_sponsor(sponsor)
+            return
+        # Replace row chunks in place so concurrent row/column rescores stay consistent
+        for start in range(0, len(events), chunk_size):
+            chunk = events[start:start + chunk_size]
+            self._store_scores(chunk, sponsors, MatchScore.event_id.in_([e.id for e in chunk]))
+
+    @timed('matcher')
+    def ensure_scores(self):
+        """Backfill the score table once per process if it is incomplete"""
+        if self._scores_checked:
+            return
+        # On the primary: a lagging replica would look incomplete and trigger a rebuild
+        with replica_reads(False):
+            if self.candidate_budget:
+                # Only candidate pairs are stored, so an empty table is the only tell
+                incomplete = MatchScore.query.first() is None and Event.query.first() is not None
+            else:
+                incomplete = MatchScore.query.count() != Event.query.count() * SponsorProfile.query.count()
+        if incomplete and current_app.config.get('MATCHER_ASYNC'):
+            # Never rebuild inside a request; queued jobs may explain the gap
+            from match_jobs import enqueue
+            if MatchJob.query.first() is None:
+                logging.info("Match score table is incomplete, queueing a rebuild")
+                enqueue('all', 0)
+        elif incomplete:
+            logging.info("Match score table is incomplete, rebuilding it")
+            # A one-off per process that grows with the catalog: not the calling view's budget
+            with unbudgeted():
+                self.rescore_all()
+        self._scores_checked = True
+
+    @timed('matcher')
+    def get_sponsor_recommendations(self, event, limit=5, options=()):
+        """Get recommended sponsors for an event; ``options`` are loader options for the sponsors"""
+        self.ensure_scores()
+        top = self._top_scores(MatchScore.event_id == event.id, SponsorProfile, limit, options)
+
+        return [{
+            'sponsor': sponsor,
+            'score': score,
+            'percentage': int(score * 100)
+        } for score, sponsor in top]
     
-    def get_event_recommendations(self, sponsor, limit=5):
-        """Get recommended events for a sponsor"""
-        events = Event.query.all()
-        recommendations = []
-        
-        for event in events:
-            score = self.calculate_match_score(event, sponsor)
-            recommendations.append({
-                'event': event,
-                'score': score,
-                'percentage': int(score * 100)
-            })
-        
-        # Sort by score and return top recommendations
-        recommendations.sort(key=lambda x: x['score'], reverse=True)
-        return recommendations[:limit]
+    @timed('matcher')
+    def get_event_recommendations(self, sponsor, limit=5, options=()):
+        """Get recommended events for a sponsor; ``options`` are loader options for the events"""
+        self.ensure_scores()
+        top = self._top_scores(MatchScore.sponsor_id == sponsor.id, Event, limit, options)
+
+        return [{
+            'event': event,
+            'score': score,
+            'percentage': int(score * 100)
+        } for score, event in top]
+
+    def _top_scores(self, criterion, model, limit, options=()):
+        """Read the best stored scores of one row/column with the matched entity"""
+        target = MatchScore.sponsor_id if model is SponsorProfile else MatchScore.event_id
+        return (db.session.query(MatchScore.score, model)
+                .join(model, model.id == target)
+                .options(*options)
+                .filter(criterion)
+                .order_by(MatchScore.score.desc(), model.id)
+                .limit(limit)
+                .all())
     
+    @timed('matcher')
     def get_match_explanation(self, event, sponsor):
-        """Get explanation for why an event and sponsor are matched"""
-        explanations = []
-        
-        # Check tag similarity
-        if event.tags and sponsor.target_demographics:
-            explanations.append("Relevant tags and demographics match")
-        
-        # Check location
-        if event.location and sponsor.location:
-            if event.location.lower() in sponsor.location.lower() or sponsor.location.lower() in event.location.lower():
-                explanations.append("Geographic proximity")
-        
-        # Check industry relevance
-        if event.theme and sponsor.industry:
-            explanations.append(f"Event theme aligns with {sponsor.industry} industry")
-        
-        # Check audience size
-        if event.expected_footfall and event.expected_footfall >= 200:
-            explanations.append("High expected engagement")
-        
-        return explanations if explanations else ["Basic compatibility factors"]
+        """Get explanation for why an event and sponsor are matched, from the memoized breakdown"""
+        return self.score_breakdown(event, sponsor).explain(sponsor.industry)
 
 # Global instance
-ai_matcher = AIMatchmaker()
+ai_matcher = AIMatchmaker(candidate_budget=int(os.environ.get('MATCHER_CANDIDATE_BUDGET', 0)) or None,
+                          snapshot=os.environ.get('MATCHER_SNAPSHOT'))
+
+
+@orm_event.listens_for(Event, 'after_update')
+@orm_event.listens_for(Event, 'after_delete')
+def _forget_event(mapper, connection, target):
+    ai_matcher.forget('event', target.id)
+
+
+@orm_event.listens_for(SponsorProfile, 'after_update')
+@orm_event.listens_for(SponsorProfile, 'after_delete')
+def _forget_sponsor(mapper, connection, target):
+    ai_matcher.forget('sponsor', target.id)
@@ -3,64 +3,161 @@ import logging
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-# Configure logging for debugging
-logging.basicConfig(level=logging.DEBUG)
+from metrics import TimedQueuePool
+from replica import RoutingSession
+
+# INFO by default; DEBUG logs every SQLAlchemy and Werkzeug detail and costs throughput
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
+login_manager = LoginManager()
 
-# Create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+def engine_options(url):
+    """Pool settings from the environment; in-memory SQLite keeps Flask-SQLAlchemy's single shared connection"""
+    options = {
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 300)),
+        "pool_pre_ping": True,
+    }
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return options
+    options.update({
+        "poolclass": TimedQueuePool,
+        # Connections kept open per process, and extra ones opened under bursts then closed again
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 20)),
+        # Seconds a request waits for a free connection before failing instead of queueing forever
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+    })
+    return options
 
-# Initialize extensions
-db.init_app(app)
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-login_manager.login_message = 'Please log in to access this page.'
 
-@login_manager.user_loader
-def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
+def configure(app):
+    """Read the app's settings from the environment"""
+    app.secret_key = os.environ.get("SESSION_SECRET")
+
+    # Configure the database
+    database_url = os.environ.get("DATABASE_URL") or os.environ.get("SQLALCHEMY_DATABASE_URI")
+    if not database_url:
+        raise RuntimeError("Missing DATABASE_URL env variable")
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_url)
+
+    # Optional read replica for read-only views (see replica.py)
+    replica_url = os.environ.get("DATABASE_REPLICA_URL")
+    if replica_url:
+        app.config["SQLALCHEMY_BINDS"] = {"replica": {"url": replica_url, **engine_options(replica_url)}}
+    # Seconds the replica may trail the primary, and a writer reads from the primary after a commit
+    app.config["REPLICA_STALENESS"] = float(os.environ.get("REPLICA_STALENESS", 5))
+    app.config["REPLICA_LAG_CHECK_INTERVAL"] = float(os.environ.get("REPLICA_LAG_CHECK_INTERVAL", 1))
+
+    # Rescore matches in worker.py instead of inside write requests
+    app.config["MATCHER_ASYNC"] = os.environ.get("MATCHER_ASYNC", "").lower() in ("1", "true", "yes")
 
-with app.app_context():
+    # Rendered-page cache for read-mostly views: filesystem (shared by the host's workers), memory or none
+    app.config["RESPONSE_CACHE"] = os.environ.get("RESPONSE_CACHE", "filesystem")
+    app.config["RESPONSE_CACHE_TTL"] = int(os.environ.get("RESPONSE_CACHE_TTL", 300))
+
+    # New-message notifications: long-poll timeout and how often other processes' sends are checked
+    app.config["NOTIFY_TIMEOUT"] = int(os.environ.get("NOTIFY_TIMEOUT", 25))
+    app.config["NOTIFY_CHECK_INTERVAL"] = float(os.environ.get("NOTIFY_CHECK_INTERVAL", 5))
+    # Requests per process that may hold a thread waiting for notifications; the rest short-poll
+    app.config["NOTIFY_MAX_WAITERS"] = int(os.environ.get("NOTIFY_MAX_WAITERS", 2))
+
+    # Seconds a process may reuse the logged-in user and profiles on GET requests; 0 loads them every time
+    app.config["USER_CACHE_TTL"] = float(os.environ.get("USER_CACHE_TTL", 0))
+
+    # /metrics bearer token, and cProfile sampling: a share of requests, or any request sending X-Profile: <token>
+    app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+    app.config["PROFILE_SAMPLE_RATE"] = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+    app.config["PROFILE_TOKEN"] = os.environ.get("PROFILE_TOKEN")
+
+
+def bootstrap(app):
+    """Create and upgrade the schema and wire the extensions to the engines; runs in an app context"""
     # Import models to ensure tables are created
     import models
     db.create_all()
 
-# Import routes after app initialization
-import routes
-import os
+    # Indexes added to tables that already existed
+    import migrations
+    migrations.upgrade(db.engine, db.metadata)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SQLALCHEMY_DATABASE_URI')
+    # Thread messages written before conversations existed
+    import messaging
+    messaging.backfill()
 
-if not app.config['SQLALCHEMY_DATABASE_URI']:
-    raise RuntimeError("Missing SQLALCHEMY_DATABASE_URI env variable")
-    
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-import os
+    # Full-text search index for /search/events
+    import search
+    search.install(db.engine)
+
+    # Count queries per view so N+1 regressions trip their budget
+    import query_budget
+    for engine in db.engines.values():
+        query_budget.init_app(app, engine)
+
+    # Per-request DB/matcher/template timing, pool waits, /metrics and the sampling profiler
+    import metrics
+    from ai_matcher import ai_matcher
+    metrics.init_app(app, db.engines)
+    metrics.register_collector(lambda: metrics.gauges('matcher_memo', ai_matcher.memo.stats()))
+
+    # Route reads to the replica while it is fresh enough, and writers back to the primary
+    import replica
+    replica.init_app(app)
+    if replica.REPLICA in db.engines:
+        metrics.register_collector(lambda: metrics.gauges('replica', {'lag_seconds': app.extensions['replica'].lag}))
+
+    # Drop cached pages when the rows they show are committed
+    import response_cache
+    response_cache.init_app(app)
+    response_cache.invalidate_on_commit(models.Event, lambda e: [f'event:{e.id}'])
+    response_cache.invalidate_on_commit(models.SponsorProfile,
+                                        lambda s: ['sponsors', f'sponsor:{s.id}', f'user:{s.user_id}'])
+    response_cache.invalidate_on_commit(models.ClubProfile, lambda c: ['events', f'user:{c.user_id}'])
+
+    # Wake long-poll and event-stream requests when their user's messages are committed
+    import notifications
+    notifications.init_app(app)
+
+    # Logged-in user and profiles in one query, optionally cached per process
+    import user_cache
+    user_cache.init_app(app)
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SQLALCHEMY_DATABASE_URI')
 
-db = SQLAlchemy()
-db.init_app(app)
+def create_app():
+    """Build, configure and bootstrap the application"""
+    app = Flask(__name__)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+    configure(app)
+
+    # Initialize extensions
+    db.init_app(app)
+    login_manager.init_app(app)
+    login_manager.login_view = 'login'
+    login_manager.login_message = 'Please log in to access this page.'
+
+    with app.app_context():
+        bootstrap(app)
+    return app
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    import user_cache
+    return user_cache.load_user(int(user_id))
+
 
-db.init_app(app)
+app = create_app()
 
+# Views and CLI commands register on the module-level app
+import routes  # noqa: E402,F401
+import commands  # noqa: E402,F401
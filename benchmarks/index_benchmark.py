@@ -0,0 +1,111 @@
+"""Query plans and latency of the hot filters without and with their indexes.
+
+Seeds a scratch SQLite database (or --database-url) with synthetic users,
+clubs, sponsors, events, interests and messages, drops the indexes declared
+on the models, runs every hot query, then creates the indexes through
+migrations.create_indexes and runs them again.
+
+    python -m benchmarks.index_benchmark --events 100000 --messages 100000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+QUERIES = [
+    ('inbox', "SELECT * FROM message WHERE recipient_id = :user ORDER BY created_at DESC LIMIT 5"),
+    ('sent messages', "SELECT * FROM message WHERE sender_id = :user ORDER BY created_at DESC LIMIT 5"),
+    ('club events', "SELECT * FROM event WHERE club_id = :club"),
+    ('newest events', "SELECT * FROM event ORDER BY created_at DESC, id DESC LIMIT 20"),
+    ('interest exists', "SELECT id FROM sponsor_interest WHERE sponsor_id = :sponsor AND event_id = :event LIMIT 1"),
+    ('recent interests', "SELECT * FROM sponsor_interest WHERE sponsor_id = :sponsor ORDER BY created_at DESC LIMIT 5"),
+    ('club profile', "SELECT * FROM club_profile WHERE user_id = :user"),
+    ('sponsor profile', "SELECT * FROM sponsor_profile WHERE user_id = :user"),
+]
+
+
+def run_queries(db, args, rng):
+    from sqlalchemy import text
+
+    explain = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    results = {}
+    with db.engine.connect() as conn:
+        for name, sql in QUERIES:
+            def params():
+                return {
+                    'user': rng.randint(1, args.clubs + args.sponsors),
+                    'club': rng.randint(1, args.clubs),
+                    'sponsor': rng.randint(1, args.sponsors),
+                    'event': rng.randint(1, args.events),
+                }
+
+            plan = [' '.join(str(v) for v in row) for row in conn.execute(text(explain + sql), params())]
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                conn.execute(text(sql), params()).fetchall()
+            results[name] = {
+                'ms': (time.perf_counter() - started) * 1000 / args.repeat,
+                'plan': plan,
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='defaults to a scratch SQLite file')
+    parser.add_argument('--clubs', type=int, default=500)
+    parser.add_argument('--sponsors', type=int, default=500)
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--interests', type=int, default=100000)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=50, help='executions per query')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    scratch = None
+    if not args.database_url:
+        scratch = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        args.database_url = f"sqlite:///{scratch.name}"
+    os.environ['DATABASE_URL'] = os.environ['SQLALCHEMY_DATABASE_URI'] = args.database_url
+
+    from app import app, db
+    import migrations
+    from benchmarks.synthetic import SyntheticData, seed_database
+
+    try:
+        with app.app_context():
+            started = time.perf_counter()
+            seed_database(db.engine, SyntheticData(args.seed), args.clubs, args.sponsors, args.events,
+                          args.interests, args.messages)
+            print(f"seeded in {time.perf_counter() - started:.1f}s")
+
+            indexes = [index for table in db.metadata.sorted_tables for index in table.indexes
+                       if table.name != 'match_score']
+            with db.engine.begin() as conn:
+                for index in indexes:
+                    index.drop(conn, checkfirst=True)
+            before = run_queries(db, args, random.Random(args.seed))
+
+            migrations.create_indexes(db.engine, db.metadata)
+            after = run_queries(db, args, random.Random(args.seed))
+    finally:
+        if scratch:
+            os.unlink(scratch.name)
+
+    print(f"{'query':<18} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name, _ in QUERIES:
+        speedup = before[name]['ms'] / max(after[name]['ms'], 1e-9)
+        print(f"{name:<18} {before[name]['ms']:>10.3f} {after[name]['ms']:>10.3f} {speedup:>7.1f}x")
+        print(f"    before: {' | '.join(before[name]['plan'])}")
+        print(f"    after:  {' | '.join(after[name]['plan'])}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'before': before, 'after': after}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Requests per second and latency of a running server under concurrent load.
+
+Logs in as one user and has --concurrency threads fetch the given paths
+round-robin for --duration seconds. To compare serving modes, run it
+against each in turn on the same database:
+
+    python main.py                                # Flask dev server
+    gunicorn -c gunicorn.conf.py main:app         # production mode
+    python -m benchmarks.load --url http://localhost:5000 --username club1 --password secret \\
+        --paths /club/dashboard,/sponsors --json load-gunicorn.json
+"""
+import argparse
+import http.cookiejar
+import json
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+def login(url, username, password):
+    """An opener holding the session cookie of a logged-in user"""
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    page = opener.open(f"{url}/login").read().decode()
+    token = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', page)
+    form = {'username': username, 'password': password, 'submit': 'Login'}
+    if token:
+        form['csrf_token'] = token.group(1)
+    opener.open(f"{url}/login", urllib.parse.urlencode(form).encode()).read()
+    if not any(cookie.name == 'session' for cookie in jar):
+        raise SystemExit(f"could not log in as {username}")
+    return opener
+
+
+def worker(opener, url, paths, deadline, offset, latencies, errors, lock):
+    sent = offset
+    while time.monotonic() < deadline:
+        path = paths[sent % len(paths)]
+        sent += 1
+        started = time.perf_counter()
+        try:
+            with opener.open(f"{url}{path}", timeout=30) as response:
+                response.read()
+        except (urllib.error.URLError, OSError) as e:
+            with lock:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            continue
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.setdefault(path, []).append(elapsed)
+
+
+def percentile(ms, fraction):
+    return ms[min(len(ms) - 1, int(len(ms) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--paths', default='/dashboard', help='comma-separated paths, fetched round-robin')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds of load before measuring')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    url = args.url.rstrip('/')
+    paths = args.paths.split(',')
+    opener = login(url, args.username, args.password)
+
+    results = {}
+    for phase, duration in (('warmup', args.warmup), ('measure', args.duration)):
+        latencies, errors, lock = {}, {}, threading.Lock()
+        deadline = time.monotonic() + duration
+        threads = [threading.Thread(target=worker, args=(opener, url, paths, deadline, i, latencies, errors, lock))
+                   for i in range(args.concurrency)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        if phase == 'warmup':
+            continue
+
+        total = sum(len(samples) for samples in latencies.values())
+        results = {'requests': total, 'seconds': elapsed, 'rps': total / elapsed, 'errors': errors, 'paths': {}}
+        print(f"{url} x{args.concurrency}: {total / elapsed:.1f} req/s over {elapsed:.1f}s, "
+              f"{sum(errors.values())} errors")
+        for path, samples in latencies.items():
+            ms = sorted(sample * 1000 for sample in samples)
+            results['paths'][path] = {
+                'n': len(ms), 'rps': len(ms) / elapsed, 'mean_ms': statistics.fmean(ms),
+                'p50_ms': percentile(ms, 0.5), 'p95_ms': percentile(ms, 0.95), 'p99_ms': percentile(ms, 0.99),
+            }
+            print(f"    {path:<30} {len(ms) / elapsed:>8.1f} req/s  p50 {percentile(ms, 0.5):>8.1f} ms  "
+                  f"p95 {percentile(ms, 0.95):>8.1f} ms  p99 {percentile(ms, 0.99):>8.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), **results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
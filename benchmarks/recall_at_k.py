@@ -0,0 +1,74 @@
+"""Recall@k of two-stage candidate retrieval against exhaustive scoring.
+
+For each query sponsor the exhaustive top-k comes from scoring every event;
+the two-stage top-k scores only the candidates returned by the inverted
+index. Recall counts two-stage results scoring at least the exhaustive k-th
+best, so ties do not count as misses. Everything runs in memory.
+
+    python -m benchmarks.recall_at_k --events 20000 --sponsors 300 --budgets 50,100,200,500
+    python -m benchmarks.recall_at_k --max-df 1.0
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('SQLALCHEMY_DATABASE_URI', os.environ['DATABASE_URL'])
+
+# The app first: importing ai_matcher on its own would build the app halfway through ai_matcher's import
+from app import app  # noqa: E402,F401
+from ai_matcher import AIMatchmaker  # noqa: E402
+from matcher_engine import sponsor_terms, top_k  # noqa: E402
+from benchmarks.synthetic import SyntheticData  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--sponsors', type=int, default=300)
+    parser.add_argument('--queries', type=int, default=100, help='sponsors used as queries')
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--budgets', default='50,100,200,500')
+    parser.add_argument('--max-df', type=float, default=None,
+                        help="skip terms in more than this share of events (default: CandidateIndex's)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    data = SyntheticData(args.seed)
+    events = data.events(args.events)
+    sponsors = data.sponsors(args.sponsors)
+    events_by_id = {e.id: e for e in events}
+    queries = sponsors[:args.queries]
+
+    matcher = AIMatchmaker()
+    if args.max_df is not None:
+        matcher.candidates.max_df = args.max_df
+    matcher.index.fit(events, sponsors)
+    matcher.candidates.build(events, sponsors)
+
+    started = time.perf_counter()
+    exhaustive = matcher.score_matrix(events, queries)
+    exhaustive_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    thresholds = [exhaustive[top_k(exhaustive[:, j], args.k), j][-1] for j in range(len(queries))]
+    print(f"exhaustive: {exhaustive_ms:.2f} ms/query over {len(events)} events")
+
+    print(f"{'budget':>8} {'recall@' + str(args.k):>10} {'ms/query':>10} {'candidates':>11}")
+    for budget in [int(b) for b in args.budgets.split(',')]:
+        found = 0
+        retrieved = 0
+        started = time.perf_counter()
+        for j, sponsor in enumerate(queries):
+            ids = matcher.candidates.search('event', sponsor_terms(sponsor), budget)
+            retrieved += len(ids)
+            if not ids:
+                continue
+            scores = matcher.score_matrix([events_by_id[i] for i in ids], [sponsor])[:, 0]
+            best = scores[top_k(scores, args.k)]
+            found += min(int((best >= thresholds[j] - 1e-12).sum()), args.k)
+        elapsed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        recall = found / (args.k * len(queries))
+        print(f"{budget:>8} {recall:>10.3f} {elapsed_ms:>10.2f} {retrieved / len(queries):>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Import time and memory of a fresh process after ``import app``.
+
+Imports the modules in a child interpreter started with ``-X importtime``
+and exits with status 1 when the import time or peak RSS exceed their
+budgets, or when a module meant to load lazily (numpy, scikit-learn...)
+was imported at startup. The best of --repeat runs is reported.
+
+    python -m benchmarks.startup --max-import-ms 800 --max-rss-mb 90
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+CHILD = """
+import importlib, json, resource, sys
+for name in sys.argv[1].split(','):
+    importlib.import_module(name)
+# ru_maxrss is in KiB on Linux and in bytes on macOS
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'rss_mb': rss / 2**20 if sys.platform == 'darwin' else rss / 2**10,
+    'modules': sorted(sys.modules),
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """Cumulative microseconds of each top-level import from ``-X importtime`` output"""
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit() and not name[1:].startswith(' '):
+            imports[name.strip()] = imports.get(name.strip(), 0) + int(cumulative)
+    return imports
+
+
+def measure(modules):
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite://')
+    env.setdefault('SQLALCHEMY_DATABASE_URI', env['DATABASE_URL'])
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD, modules],
+                            capture_output=True, text=True, env=env)
+    if result.returncode:
+        sys.exit(f"importing {modules} failed:\n{result.stderr[-2000:]}")
+    imports = parse_importtime(result.stderr)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['import_ms'] = sum(imports.values()) / 1000
+    report['slowest'] = sorted(imports.items(), key=lambda item: -item[1])[:10]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modules', default='app', help='comma-separated modules to import')
+    parser.add_argument('--max-import-ms', type=float, default=800)
+    parser.add_argument('--max-rss-mb', type=float, default=90)
+    parser.add_argument('--forbid', default='numpy,scipy,sklearn,pandas',
+                        help='modules that must not be imported at startup')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    runs = [measure(args.modules) for _ in range(args.repeat)]
+    best = min(runs, key=lambda run: run['import_ms'])
+    rss_mb = min(run['rss_mb'] for run in runs)
+    forbidden = [name for name in args.forbid.split(',') if name and name in best['modules']]
+
+    print(f"import {args.modules}: {best['import_ms']:.0f} ms (budget {args.max_import_ms:.0f}), "
+          f"peak RSS {rss_mb:.1f} MB (budget {args.max_rss_mb:.0f}), {len(best['modules'])} modules")
+    for name, us in best['slowest']:
+        print(f"    {us / 1000:>8.1f} ms  {name}")
+
+    failures = []
+    if best['import_ms'] > args.max_import_ms:
+        failures.append(f"import time {best['import_ms']:.0f} ms exceeds {args.max_import_ms:.0f} ms")
+    if rss_mb > args.max_rss_mb:
+        failures.append(f"peak RSS {rss_mb:.1f} MB exceeds {args.max_rss_mb:.0f} MB")
+    if forbidden:
+        failures.append(f"imported at startup: {', '.join(forbidden)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'import_ms': best['import_ms'], 'rss_mb': rss_mb,
+                       'slowest': best['slowest'], 'forbidden': forbidden, 'failures': failures}, f, indent=2)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""Matcher, search and dashboard benchmarks on a synthetic site, as JSON.
+
+Seeds a scratch SQLite database at --scale (1k to 1m events), builds the
+match score table, then times:
+
+- micro: ``calculate_match_score`` cold and memoized, sponsor and event
+  recommendations
+- routes: every dashboard, the inbox, the sponsor showcase, event pages and
+  the event search filters, through the Flask test client
+
+Each benchmark records latency percentiles (and SQL statements per request
+for routes). --json writes them with the commit and scale they were measured
+at; --compare reads an earlier file and exits with status 1 when a p50 got
+slower than --tolerance allows.
+
+    python -m benchmarks.suite --scale 10k --json bench-$(git rev-parse --short HEAD).json
+    python -m benchmarks.suite --scale 10k --compare bench-1a2b3c4.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# Entity counts per scale; the candidate budget keeps the score table linear in the event count
+SCALES = {
+    '1k': dict(clubs=50, sponsors=50, events=1000, interests=1000, messages=1000, candidate_budget=None),
+    '10k': dict(clubs=200, sponsors=200, events=10000, interests=10000, messages=10000, candidate_budget=None),
+    '100k': dict(clubs=1000, sponsors=500, events=100000, interests=100000, messages=100000,
+                 candidate_budget=200),
+    '1m': dict(clubs=5000, sponsors=1000, events=1000000, interests=1000000, messages=1000000,
+               candidate_budget=200),
+}
+
+SEARCHES = {
+    'keyword': {'keyword': 'hackathon'},
+    'location': {'location': 'Boston'},
+    'theme': {'theme': 'music'},
+    'min_footfall': {'min_footfall': '500'},
+    'combined': {'keyword': 'ai', 'location': 'MA', 'min_footfall': '100'},
+}
+
+
+def summarize(samples):
+    """Latency percentiles in milliseconds of a list of durations in seconds"""
+    ms = sorted(sample * 1000 for sample in samples)
+    return {
+        'n': len(ms),
+        'mean_ms': statistics.fmean(ms),
+        'p50_ms': ms[len(ms) // 2],
+        'p95_ms': ms[min(len(ms) - 1, int(len(ms) * 0.95))],
+        'min_ms': ms[0],
+        'max_ms': ms[-1],
+    }
+
+
+def timed(calls):
+    """Duration of each call in ``calls``"""
+    samples = []
+    for call in calls:
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def micro_benchmarks(args, rng):
+    from ai_matcher import ai_matcher
+    from models import Event, SponsorProfile
+
+    events = Event.query.order_by(Event.id).limit(args.sample).all()
+    sponsors = SponsorProfile.query.order_by(SponsorProfile.id).limit(args.sample).all()
+    pairs = [(rng.choice(events), rng.choice(sponsors)) for _ in range(args.pairs)]
+    results = {}
+
+    ai_matcher.memo.clear()
+    ai_matcher.features.clear()
+    results['calculate_match_score.cold'] = summarize(
+        timed(lambda e=e, s=s: ai_matcher.calculate_match_score(e, s) for e, s in pairs))
+    results['calculate_match_score.memoized'] = summarize(
+        timed(lambda e=e, s=s: ai_matcher.calculate_match_score(e, s) for e, s in pairs))
+
+    results['get_sponsor_recommendations'] = summarize(
+        timed(lambda e=rng.choice(events): ai_matcher.get_sponsor_recommendations(e, limit=5)
+              for _ in range(args.repeat)))
+    results['get_event_recommendations'] = summarize(
+        timed(lambda s=rng.choice(sponsors): ai_matcher.get_event_recommendations(s, limit=5)
+              for _ in range(args.repeat)))
+    return results
+
+
+def route_benchmarks(app, engine, args, rng, counts):
+    from sqlalchemy import event
+
+    statements = []
+
+    def count(*_):
+        statements[-1] += 1
+
+    def client_for(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return client
+
+    # Users 1..clubs are clubs, the next ``sponsors`` are sponsors with a profile each
+    club_user = lambda: rng.randint(1, counts['clubs'])  # noqa: E731
+    sponsor_user = lambda: counts['clubs'] + rng.randint(1, counts['sponsors'])  # noqa: E731
+    routes = {
+        'club_dashboard': (club_user, lambda: ('/club/dashboard', None)),
+        'sponsor_dashboard': (sponsor_user, lambda: ('/sponsor/dashboard', None)),
+        'messages': (sponsor_user, lambda: ('/messages', None)),
+        'sponsors_showcase': (club_user, lambda: ('/sponsors', None)),
+        'event_details': (sponsor_user, lambda: (f"/event/{rng.randint(1, counts['events'])}", None)),
+        'sponsor_details': (club_user, lambda: (f"/sponsor/{rng.randint(1, counts['sponsors'])}", None)),
+    }
+    for name, params in SEARCHES.items():
+        routes[f'search_events.{name}'] = (sponsor_user,
+                                           lambda params=params: ('/search/events', {**params, 'submit': 'Search'}))
+
+    results = {}
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        for name, (user, target) in routes.items():
+            samples, queries, statuses = [], [], set()
+            for _ in range(args.repeat):
+                client = client_for(user())
+                path, query_string = target()
+                statements.append(0)
+                started = time.perf_counter()
+                response = client.get(path, query_string=query_string)
+                samples.append(time.perf_counter() - started)
+                queries.append(statements[-1])
+                statuses.add(response.status_code)
+            results[f'route.{name}'] = {**summarize(samples), 'queries': statistics.fmean(queries),
+                                        'statuses': sorted(statuses)}
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    return results
+
+
+def compare(results, baseline_path, tolerance):
+    """Print p50 changes against a baseline file; returns the names that regressed"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    print(f"\nagainst {baseline['meta'].get('commit')} ({baseline['meta']['scale']}):")
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        change = result['p50_ms'] / max(before['p50_ms'], 1e-9) - 1
+        flag = ' REGRESSION' if change > tolerance else ''
+        print(f"    {name:<40} {before['p50_ms']:>10.3f} -> {result['p50_ms']:>10.3f} ms {change:>+8.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='1k')
+    parser.add_argument('--repeat', type=int, default=50, help='samples per recommendation/route benchmark')
+    parser.add_argument('--pairs', type=int, default=2000, help='pairs scored by the match score benchmarks')
+    parser.add_argument('--sample', type=int, default=500, help='events/sponsors the pairs are drawn from')
+    parser.add_argument('--candidate-budget', type=int, default=None,
+                        help="override the scale's MATCHER_CANDIDATE_BUDGET (0 scores every pair)")
+    parser.add_argument('--response-cache', default='none', help='RESPONSE_CACHE backend for the routes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='earlier --json file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p50 slowdown, 0.25 = 25%%')
+    args = parser.parse_args()
+
+    counts = dict(SCALES[args.scale])
+    if args.candidate_budget is not None:
+        counts['candidate_budget'] = args.candidate_budget or None
+
+    scratch = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    os.environ['DATABASE_URL'] = os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{scratch.name}"
+    os.environ['RESPONSE_CACHE'] = args.response_cache
+    os.environ.setdefault('SESSION_SECRET', 'benchmark')
+
+    from app import app, db
+    from ai_matcher import ai_matcher
+    import messaging
+    from benchmarks.synthetic import SyntheticData, seed_database
+
+    setup = {}
+    try:
+        with app.app_context():
+            started = time.perf_counter()
+            seed_database(db.engine, SyntheticData(args.seed), counts['clubs'], counts['sponsors'],
+                          counts['events'], counts['interests'], counts['messages'])
+            messaging.backfill()
+            setup['seed_s'] = time.perf_counter() - started
+            print(f"seeded {args.scale} in {setup['seed_s']:.1f}s")
+
+            ai_matcher.candidate_budget = counts['candidate_budget']
+            started = time.perf_counter()
+            ai_matcher.rescore_all()
+            setup['rescore_all_s'] = time.perf_counter() - started
+            print(f"scored in {setup['rescore_all_s']:.1f}s")
+
+            rng = random.Random(args.seed)
+            results = micro_benchmarks(args, rng)
+            engine = db.engine
+        # Outside the app context, so every request gets its own session like in production
+        results.update(route_benchmarks(app, engine, args, rng, counts))
+    finally:
+        os.unlink(scratch.name)
+
+    print(f"{'benchmark':<40} {'p50 ms':>10} {'p95 ms':>10} {'queries':>8}")
+    for name, result in results.items():
+        queries = f"{result['queries']:.1f}" if 'queries' in result else ''
+        print(f"{name:<40} {result['p50_ms']:>10.3f} {result['p95_ms']:>10.3f} {queries:>8}")
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'scale': args.scale,
+            'counts': counts,
+            'args': vars(args),
+            **setup,
+        },
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    regressions = compare(results, args.compare, args.tolerance) if args.compare else []
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
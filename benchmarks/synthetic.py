@@ -0,0 +1,161 @@
+"""Seeded synthetic entities for benchmarks.
+
+Entities are built as transient model instances with explicit ids, so they
+can be scored in memory or added to a session as-is. ``seed_database``
+bulk-inserts a whole synthetic site.
+"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from models import User, ClubProfile, SponsorProfile, Event, SponsorInterest, Message
+
+EPOCH = datetime(2024, 1, 1)
+
+WORDS = [
+    'tech', 'innovation', 'startup', 'coding', 'hackathon', 'ai', 'software', 'business', 'finance',
+    'investment', 'entrepreneur', 'health', 'medical', 'wellness', 'fitness', 'research', 'learning',
+    'music', 'arts', 'cultural', 'festival', 'concert', 'food', 'culinary', 'racing', 'cars', 'fashion',
+    'retail', 'sports', 'tournament', 'game', 'robotics', 'design', 'sustainability', 'climate', 'film',
+    'photography', 'debate', 'career', 'networking', 'workshop', 'summit', 'conference', 'community',
+]
+AUDIENCE = [
+    'students', 'undergraduates', 'graduates', 'engineering', 'computer', 'science', 'business', 'arts',
+    'medical', 'athletes', 'developers', 'designers', 'founders', 'researchers', 'alumni', 'faculty',
+]
+LOCATIONS = [
+    'Boston, MA', 'Cambridge, MA', 'New York, NY', 'Austin, TX', 'Seattle, WA', 'Denver, CO',
+    'San Francisco, CA', 'Chicago, IL', 'Atlanta, GA', 'Los Angeles, CA', 'Online',
+]
+INDUSTRIES = [
+    'technology', 'finance', 'healthcare', 'education', 'entertainment', 'food_beverage',
+    'automotive', 'retail', 'sports', 'other',
+]
+FOOTFALLS = [None, 30, 80, 150, 300, 600, 1200]
+
+
+class SyntheticData:
+    """Deterministic generator: the same seed always yields the same entities"""
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+
+    def _words(self, vocabulary, low, high):
+        return ' '.join(self.rng.sample(vocabulary, self.rng.randint(low, high)))
+
+    def _timestamp(self):
+        return EPOCH + timedelta(seconds=self.rng.randint(0, 365 * 24 * 3600))
+
+    def user(self, user_id, user_type):
+        # No password hash: hashing is deliberately slow and benchmarks never log in with it
+        return User(
+            id=user_id,
+            username=f"{user_type}{user_id}",
+            email=f"{user_type}{user_id}@example.com",
+            user_type=user_type,
+            created_at=self._timestamp(),
+        )
+
+    def club(self, club_id, user_id):
+        return ClubProfile(
+            id=club_id,
+            user_id=user_id,
+            club_name=f"{self._words(WORDS, 1, 2).title()} Club {club_id}",
+            university=f"University {club_id % 97}",
+            location=self.rng.choice(LOCATIONS),
+            description=self._words(WORDS, 4, 10),
+            version=1,
+        )
+
+    def interest(self, interest_id, sponsor_id, event_id):
+        return SponsorInterest(
+            id=interest_id,
+            sponsor_id=sponsor_id,
+            event_id=event_id,
+            interest_level=self.rng.choice(['low', 'medium', 'high']),
+            created_at=self._timestamp(),
+        )
+
+    def message(self, message_id, sender_id, recipient_id):
+        return Message(
+            id=message_id,
+            sender_id=sender_id,
+            recipient_id=recipient_id,
+            subject=self._words(WORDS, 2, 5).capitalize(),
+            content=self._words(WORDS, 10, 30),
+            read=self.rng.random() < 0.5,
+            created_at=self._timestamp(),
+        )
+
+    def event(self, event_id, club_id=1):
+        rng = self.rng
+        return Event(
+            id=event_id,
+            club_id=club_id,
+            name=f"{self._words(WORDS, 1, 3).title()} {event_id}",
+            description=self._words(WORDS, 6, 14),
+            theme=self._words(WORDS, 1, 2),
+            location=rng.choice(LOCATIONS) if rng.random() < 0.9 else None,
+            expected_footfall=rng.choice(FOOTFALLS),
+            target_audience=self._words(AUDIENCE, 2, 5) if rng.random() < 0.9 else None,
+            tags=','.join(rng.sample(WORDS, rng.randint(2, 5))) if rng.random() < 0.9 else None,
+            created_at=self._timestamp(),
+            version=1,
+        )
+
+    def sponsor(self, sponsor_id, user_id=1):
+        rng = self.rng
+        return SponsorProfile(
+            id=sponsor_id,
+            user_id=user_id,
+            company_name=f"{self._words(WORDS, 1, 2).title()} Corp {sponsor_id}",
+            industry=rng.choice(INDUSTRIES),
+            location=rng.choice(LOCATIONS),
+            description=self._words(WORDS, 6, 14),
+            target_demographics=self._words(AUDIENCE, 2, 5) if rng.random() < 0.9 else None,
+            version=1,
+        )
+
+    def events(self, count, start_id=1, club_ids=(1,)):
+        return [self.event(start_id + i, self.rng.choice(club_ids)) for i in range(count)]
+
+    def sponsors(self, count, start_id=1, user_ids=(1,)):
+        return [self.sponsor(start_id + i, self.rng.choice(user_ids)) for i in range(count)]
+
+
+def as_rows(entities):
+    """Column dicts of transient entities, for bulk Core inserts"""
+    if not entities:
+        return []
+    columns = [c.key for c in entities[0].__table__.columns]
+    return [{key: getattr(entity, key) for key in columns} for entity in entities]
+
+
+CHUNK = 10000
+
+
+def seed_database(engine, data, clubs, sponsors, events, interests, messages):
+    """Bulk-insert a synthetic site, CHUNK rows at a time"""
+    # Users 1..clubs own a club profile each, the rest one sponsor profile each
+    users = [data.user(i, 'club' if i <= clubs else 'sponsor') for i in range(1, clubs + sponsors + 1)]
+    tables = [
+        (User, users),
+        (ClubProfile, [data.club(i, i) for i in range(1, clubs + 1)]),
+        (SponsorProfile, [data.sponsor(i, clubs + i) for i in range(1, sponsors + 1)]),
+    ]
+    with engine.begin() as conn:
+        for model, entities in tables:
+            conn.execute(insert(model), as_rows(entities))
+
+        generators = [
+            (Event, events, lambda i: data.event(i, data.rng.randint(1, clubs))),
+            (SponsorInterest, interests,
+             lambda i: data.interest(i, data.rng.randint(1, sponsors), data.rng.randint(1, events))),
+            (Message, messages,
+             lambda i: data.message(i, data.rng.randint(1, len(users)), data.rng.randint(1, len(users)))),
+        ]
+        for model, count, make in generators:
+            for start in range(1, count + 1, CHUNK):
+                chunk = [make(i) for i in range(start, min(start + CHUNK, count + 1))]
+                conn.execute(insert(model), as_rows(chunk))
@@ -0,0 +1,237 @@
+"""Bulk import and export of events and sponsor profiles as CSV or JSONL.
+
+Files are streamed a chunk of rows at a time, so memory stays flat however
+large they are. Every imported row is validated with the same form the web
+handlers use (EventForm / SponsorProfileForm). A chunk's valid rows are
+inserted with one executemany and committed. Under MATCHER_ASYNC each
+chunk's rows are queued as match jobs. Otherwise the matcher rescores once
+the import is done: the imported rows if they fit in one chunk, or the
+whole table, instead of reloading the catalog after every chunk.
+"""
+import csv
+import json
+import logging
+from collections import namedtuple
+from itertools import islice
+
+from flask import current_app
+from sqlalchemy import insert, select
+from werkzeug.datastructures import MultiDict
+from wtforms import SelectField
+
+import response_cache
+from app import db
+from forms import EventForm, SponsorProfileForm
+from match_jobs import schedule_rescore_many
+from replica import replica_reads
+from models import ClubProfile, Event, SponsorProfile, User
+
+# model, validating form, owner column, at most one row per owner, matcher entity type, response cache tags
+Kind = namedtuple('Kind', 'model form owner one_per_owner entity_type tags')
+
+KINDS = {
+    'events': Kind(Event, EventForm, 'club_id', False, 'event', lambda rows: ['events']),
+    # User.sponsor_profile is a scalar relationship: a second profile would be silently ignored
+    'sponsors': Kind(SponsorProfile, SponsorProfileForm, 'user_id', True, 'sponsor',
+                     lambda rows: ['sponsors', *{f"user:{row['user_id']}" for row in rows}]),
+}
+
+
+def fields(kind):
+    """Columns read on import and written on export, in file order"""
+    form = kind.form(formdata=None, meta={'csrf': False})
+    return [name for name in form._fields if name != 'submit']
+
+
+def detect_format(path, fmt=None):
+    """``fmt`` if given, otherwise guessed from the file extension"""
+    if fmt:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(f, fmt):
+    """Yield (line number, dict) for each record of an open file"""
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(f, 1):
+        if line.strip():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield number, record if isinstance(record, dict) else None
+
+
+def _owners(kind, ids):
+    """The subset of owner ids that exist: clubs for events, sponsor users for profiles"""
+    if kind.owner == 'club_id':
+        query = select(ClubProfile.id).where(ClubProfile.id.in_(ids))
+    else:
+        query = select(User.id).where(User.id.in_(ids), User.user_type == 'sponsor')
+    return set(db.session.execute(query).scalars())
+
+
+class Importer:
+    """Validates and inserts rows of one kind, a chunk at a time"""
+
+    # Rejections kept in memory for the summary; the rest only go to ``errors``
+    KEEP_REJECTED = 20
+    # Imported ids kept for the final rescore; a larger import rescores everything
+    RESCORE_IDS = 1000
+
+    def __init__(self, kind, owner_id=None, rescore=True, errors=None):
+        self.kind = kind
+        self.owner_id = owner_id
+        self.rescore = rescore
+        self.errors = errors
+        self.form = kind.form(formdata=None, meta={'csrf': False})
+        self.fields = fields(kind)
+        self.imported = 0
+        self.rejected = 0
+        self.first_rejected = []
+        # Ids left for finish() to rescore, or None to rescore every pair
+        self.pending = []
+
+    def reject(self, number, errors):
+        self.rejected += 1
+        if len(self.first_rejected) < self.KEEP_REJECTED:
+            self.first_rejected.append((number, errors))
+        if self.errors is not None:
+            self.errors.write(json.dumps({'line': number, 'errors': errors}) + '\n')
+
+    def validate(self, number, record):
+        """Form-validated column values of a record, or None after recording why it was rejected"""
+        if record is None:
+            self.reject(number, {'record': ['Not a JSON object.']})
+            return None
+        formdata = MultiDict([(name, str(value)) for name, value in record.items()
+                              if name in self.fields and value not in (None, '')])
+        self.form.process(formdata)
+        for field in self.form:
+            if isinstance(field, SelectField):
+                # A blank optional select (budget_range) is stored as NULL instead of failing its choices
+                field.validate_choice = field.name in formdata or field.flags.required
+        owner = record.get(self.kind.owner) or self.owner_id
+        errors = {} if self.form.validate() else dict(self.form.errors)
+        try:
+            owner = int(owner)
+        except (TypeError, ValueError):
+            errors[self.kind.owner] = ['A numeric owner id is required.']
+        if errors:
+            self.reject(number, errors)
+            return None
+        row = {name: self.form[name].data for name in self.fields}
+        row[self.kind.owner] = owner
+        return row
+
+    def import_chunk(self, records):
+        """Insert the valid rows of ``[(line number, record), ...]`` and commit them"""
+        rows, numbers = [], []
+        for number, record in records:
+            row = self.validate(number, record)
+            if row is not None:
+                rows.append(row)
+                numbers.append(number)
+        if not rows:
+            return []
+
+        model = self.kind.model
+        owners = _owners(self.kind, {row[self.kind.owner] for row in rows})
+        taken = set()
+        if self.kind.one_per_owner and owners:
+            owner_column = getattr(model, self.kind.owner)
+            taken = set(db.session.execute(select(owner_column).where(owner_column.in_(owners))).scalars())
+        valid = []
+        for number, row in zip(numbers, rows):
+            owner = row[self.kind.owner]
+            if owner not in owners:
+                self.reject(number, {self.kind.owner: [f'No such owner {owner}.']})
+            elif owner in taken:
+                self.reject(number, {self.kind.owner: [f'Owner {owner} already has a profile.']})
+            else:
+                valid.append(row)
+                if self.kind.one_per_owner:
+                    # A later row of this chunk for the same owner is a duplicate too
+                    taken.add(owner)
+        if not valid:
+            return []
+
+        ids = db.session.execute(insert(model).returning(model.id, sort_by_parameter_order=True),
+                                 valid).scalars().all()
+        db.session.commit()
+        # Core inserts skip the ORM flush that normally invalidates cached pages
+        response_cache.invalidate(*self.kind.tags(valid))
+        if self.rescore and current_app.config.get('MATCHER_ASYNC'):
+            schedule_rescore_many(self.kind.entity_type, ids)
+        elif self.rescore and self.pending is not None:
+            self.pending.extend(ids)
+            if len(self.pending) > self.RESCORE_IDS:
+                self.pending = None
+        db.session.expunge_all()
+        self.imported += len(ids)
+        return ids
+
+    def finish(self):
+        """Rescore what a synchronous import inserted, in one pass"""
+        if not self.rescore or current_app.config.get('MATCHER_ASYNC'):
+            return
+        if self.pending is None:
+            from ai_matcher import ai_matcher
+            ai_matcher.rescore_all()
+        elif self.pending:
+            schedule_rescore_many(self.kind.entity_type, self.pending)
+        self.pending = []
+
+
+def import_file(kind_name, f, fmt='csv', owner_id=None, chunk_size=1000, skip=0, rescore=True,
+                errors=None, echo=print):
+    """Import a CSV/JSONL stream of events or sponsor profiles; returns the Importer
+
+    ``skip`` records are passed over first, to resume after the last
+    committed chunk of an interrupted import.
+    """
+    importer = Importer(KINDS[kind_name], owner_id, rescore, errors)
+    records = islice(read_rows(f, fmt), skip, None)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        importer.import_chunk(chunk)
+        echo(f"{importer.imported} imported, {importer.rejected} rejected (through line {chunk[-1][0]})")
+    importer.finish()
+    for number, problems in importer.first_rejected:
+        logging.warning(f"Rejected line {number}: {problems}")
+    return importer
+
+
+def export_file(kind_name, f, fmt='csv', chunk_size=1000):
+    """Write every event or sponsor profile to an open text file, in id order; returns the row count"""
+    kind = KINDS[kind_name]
+    model = kind.model
+    names = ['id', kind.owner, *fields(kind)]
+    columns = [getattr(model, name) for name in names]
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(f)
+        writer.writerow(names)
+
+    last_id, written = 0, 0
+    while True:
+        # Keyset over the primary key; plain rows, so nothing piles up in the identity map
+        with replica_reads():
+            rows = db.session.execute(select(*columns).where(model.id > last_id)
+                                      .order_by(model.id).limit(chunk_size)).all()
+        if not rows:
+            return written
+        for row in rows:
+            if writer is not None:
+                writer.writerow(['' if value is None else value for value in row])
+            else:
+                record = dict(zip(names, row))
+                f.write(json.dumps(record, default=str) + '\n')
+        last_id = rows[-1][0]
+        written += len(rows)
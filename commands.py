@@ -0,0 +1,77 @@
+"""Flask CLI commands, e.g. ``flask --app main rematch-all``"""
+import os
+
+import click
+
+from app import app
+
+
+@app.cli.command('rematch-all')
+@click.option('--workdir', default=lambda: os.path.join(app.instance_path, 'rematch'), show_default='instance/rematch',
+              help='Where features and the checkpoint are kept.')
+@click.option('--processes', type=int, default=None, help='Pool size, defaults to the CPU count.')
+@click.option('--shard-size', type=int, default=200, show_default=True, help='Events scored per task.')
+@click.option('--top', type=int, default=None,
+              help='Store N candidate events per sponsor instead of MATCHER_CANDIDATE_BUDGET; needs candidate mode.')
+@click.option('--resume', is_flag=True, help='Continue an interrupted run from its checkpoint.')
+def rematch_all(workdir, processes, shard_size, top, resume):
+    """Rescore every event x sponsor pair on all cores"""
+    import rematch
+    from ai_matcher import ai_matcher
+    if top and not ai_matcher.candidate_budget:
+        # Without candidate mode a partial table looks incomplete and the next request rebuilds it in full
+        raise click.UsageError('--top needs MATCHER_CANDIDATE_BUDGET, which expects a partial score table')
+    rematch.run(workdir, processes, shard_size, top, resume, echo=click.echo)
+
+
+@app.cli.command('matcher-snapshot')
+@click.argument('directory', required=False)
+def matcher_snapshot(directory):
+    """Fit the matcher index and save it for web/worker processes to memory-map"""
+    from ai_matcher import ai_matcher
+    directory = directory or ai_matcher.snapshot
+    if not directory:
+        raise click.UsageError('Pass a directory or set MATCHER_SNAPSHOT')
+    ai_matcher.save_snapshot(directory)
+    click.echo(f"Saved matcher snapshot of {ai_matcher.index.fitted_size} documents to {directory}")
+
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(['events', 'sponsors']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Defaults to jsonl for .jsonl/.ndjson files, csv otherwise.')
+@click.option('--owner', 'owner_id', type=int, default=None,
+              help='Club profile id (events) or sponsor user id (sponsors) for rows without one.')
+@click.option('--chunk-size', type=int, default=1000, show_default=True, help='Rows validated and inserted per commit.')
+@click.option('--skip', type=int, default=0, help='Records to skip, to resume an interrupted import.')
+@click.option('--no-rescore', is_flag=True, help='Leave matching to a later rematch-all.')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False), default=None,
+              help='Write rejected line numbers and reasons here as JSONL.')
+def import_data(kind, path, fmt, owner_id, chunk_size, skip, no_rescore, errors_path):
+    """Stream events or sponsor profiles from a CSV/JSONL file into the database"""
+    import bulk_io
+    errors = open(errors_path, 'w') if errors_path else None
+    try:
+        with open(path, newline='', encoding='utf-8') as f:
+            importer = bulk_io.import_file(kind, f, bulk_io.detect_format(path, fmt), owner_id, chunk_size, skip,
+                                           not no_rescore, errors, echo=click.echo)
+    finally:
+        if errors is not None:
+            errors.close()
+    click.echo(f"Imported {importer.imported} {kind}, rejected {importer.rejected}")
+
+
+@app.cli.command('export-data')
+@click.argument('kind', type=click.Choice(['events', 'sponsors']))
+@click.argument('path', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Defaults to jsonl for .jsonl/.ndjson files, csv otherwise.')
+@click.option('--chunk-size', type=int, default=1000, show_default=True, help='Rows read per query.')
+def export_data(kind, path, fmt, chunk_size):
+    """Stream every event or sponsor profile to a CSV/JSONL file ('-' for stdout)"""
+    import bulk_io
+    with click.open_file(path, 'w', encoding='utf-8') as f:
+        written = bulk_io.export_file(kind, f, bulk_io.detect_format(path, fmt), chunk_size)
+    if path != '-':
+        click.echo(f"Exported {written} {kind} to {path}")
@@ -0,0 +1,82 @@
+"""Gunicorn settings for production: ``gunicorn -c gunicorn.conf.py main:app``
+
+Threaded workers (gthread), because notification long-polls and event
+streams keep a request open for minutes. They hold a thread, not a whole
+process. Every setting can be overridden from the environment.
+
+The app and the matcher snapshot are loaded once in the master before it
+forks, so workers share those pages copy-on-write and start instantly. With
+preloading, SIGHUP restarts workers gracefully but keeps the loaded code.
+To deploy new code without dropping requests, send SIGUSR2 to start a new
+master, then SIGTERM the old one. Alternatively, set GUNICORN_PRELOAD=0 so
+that SIGHUP reloads code too.
+"""
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+worker_class = 'gthread'
+# One process per core does the CPU work; threads cover requests waiting on the database or open streams
+workers = int(os.environ.get('WEB_CONCURRENCY', max(2, multiprocessing.cpu_count())))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Not the root logger: configuring it here would stop app.py from applying LOG_LEVEL
+log = logging.getLogger('gunicorn.error')
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1').lower() in ('1', 'true', 'yes')
+
+# The memory page cache invalidates only in the worker that committed; the others would serve stale pages
+if workers > 1 and os.environ.get('RESPONSE_CACHE') == 'memory':
+    log.warning("RESPONSE_CACHE=memory is per worker; using the filesystem cache shared by all workers")
+    os.environ['RESPONSE_CACHE'] = 'filesystem'
+
+# Recycle workers now and then so slow leaks cannot accumulate; jitter avoids restarting all at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# Behind a load balancer: keep idle connections open a little longer than its own idle timeout
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 75))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+
+
+def when_ready(server):
+    """After the app is preloaded and before any worker is forked"""
+    if not preload_app:
+        return
+    from app import app
+    from ai_matcher import ai_matcher
+    if ai_matcher.snapshot:
+        with app.app_context():
+            ai_matcher.load_snapshot()
+    # Objects allocated so far are never collected, so the GC does not dirty their shared pages
+    gc.freeze()
+    server.log.info(f"Preloaded app, forking {workers} workers x {threads} threads")
+
+
+def post_fork(server, worker):
+    """Connections opened by the master while preloading must not be shared with workers"""
+    if not preload_app:
+        return
+    from app import app, db
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    """End notification streams and long-polls on SIGTERM instead of waiting out graceful_timeout"""
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def close_streams(signum, frame):
+        from notifications import hub
+        hub.close()
+        handle_exit(signum, frame)
+    signal.signal(signal.SIGTERM, close_streams)
@@ -0,0 +1,117 @@
+"""Queue of "entity changed" jobs for the match score worker.
+
+With MATCHER_ASYNC on, write endpoints only enqueue a job and return;
+worker.py rescores in the background. Without it, the rescore runs inline
+as before, so a single-process setup needs no worker.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import insert
+
+from app import db
+from metrics import timed
+from models import Event, MatchJob, SponsorProfile
+
+MAX_ATTEMPTS = 5
+# How long a claimed job stays invisible to other workers unless its worker renews it
+LEASE = timedelta(minutes=10)
+
+
+def enqueue(entity_type, entity_id):
+    """Queue a rescore unless one is already pending for the same entity"""
+    pending = MatchJob.query.filter_by(entity_type=entity_type, entity_id=entity_id, status='pending').first()
+    if pending is None:
+        db.session.add(MatchJob(entity_type=entity_type, entity_id=entity_id))
+        db.session.commit()
+
+
+@timed('matcher')
+def schedule_rescore(entity_type, entity):
+    """Rescore an entity after it changed: queued when async, inline otherwise"""
+    if current_app.config.get('MATCHER_ASYNC'):
+        enqueue(entity_type, entity.id)
+        return
+
+    from ai_matcher import ai_matcher
+    if entity_type == 'event':
+        ai_matcher.refresh_event(entity)
+    else:
+        ai_matcher.refresh_sponsor(entity)
+
+
+@timed('matcher')
+def schedule_rescore_many(entity_type, entity_ids):
+    """Rescore a batch of new entities, e.g. one chunk of a bulk import"""
+    if not entity_ids:
+        return
+    if current_app.config.get('MATCHER_ASYNC'):
+        # New rows cannot have pending jobs yet, so skip enqueue()'s per-row check
+        db.session.execute(insert(MatchJob), [{'entity_type': entity_type, 'entity_id': entity_id}
+                                              for entity_id in entity_ids])
+        db.session.commit()
+        return
+
+    from ai_matcher import ai_matcher
+    if entity_type == 'event':
+        ai_matcher.refresh_events(Event.query.filter(Event.id.in_(entity_ids)).all())
+    else:
+        ai_matcher.refresh_sponsors(SponsorProfile.query.filter(SponsorProfile.id.in_(entity_ids)).all())
+
+
+def claim(limit):
+    """Lease up to ``limit`` runnable jobs, grouped into (entity_type, entity_ids, job_ids) batches.
+
+    Several jobs for the same entity collapse into one rescore.
+    """
+    now = datetime.utcnow()
+    query = (MatchJob.query
+             .filter(MatchJob.status.in_(['pending', 'running']), MatchJob.available_at <= now)
+             .order_by(MatchJob.id)
+             .limit(limit))
+    if db.engine.dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+
+    batches = {}
+    for job in query.all():
+        job.status = 'running'
+        job.attempts += 1
+        job.available_at = now + LEASE
+        entity_ids, job_ids = batches.setdefault(job.entity_type, ({}, []))
+        entity_ids[job.entity_id] = True
+        job_ids.append(job.id)
+    db.session.commit()
+    return [(entity_type, list(entity_ids), job_ids) for entity_type, (entity_ids, job_ids) in batches.items()]
+
+
+def renew(job_ids):
+    """Extend the lease of jobs still being worked on, so a long rescore is not claimed twice"""
+    if not job_ids:
+        return
+    (MatchJob.query.filter(MatchJob.id.in_(job_ids), MatchJob.status == 'running')
+     .update({MatchJob.available_at: datetime.utcnow() + LEASE}, synchronize_session=False))
+    db.session.commit()
+
+
+def complete(job_ids, error=None):
+    """Delete finished jobs, or schedule a retry with exponential backoff"""
+    jobs = MatchJob.query.filter(MatchJob.id.in_(job_ids)).all()
+    if error is None:
+        for job in jobs:
+            db.session.delete(job)
+    else:
+        now = datetime.utcnow()
+        for job in jobs:
+            job.last_error = str(error)
+            if job.attempts >= MAX_ATTEMPTS:
+                job.status = 'failed'
+                logging.error(f"Match job {job.id} ({job.entity_type} {job.entity_id}) failed: {error}")
+            else:
+                job.status = 'pending'
+                job.available_at = now + timedelta(seconds=min(2 ** job.attempts, 300))
+    db.session.commit()
+
+
+def queue_depth():
+    return MatchJob.query.filter(MatchJob.status != 'failed').count()
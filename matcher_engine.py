@@ -0,0 +1,466 @@
+"""Numeric side of the matcher: TF-IDF index, candidate retrieval and batch scoring.
+
+numpy, scipy and scikit-learn are only imported with this module, which
+AIMatchmaker loads on its first scoring call, so web processes that only
+read stored scores never pay for them.
+"""
+import json
+import math
+import os
+import re
+import shutil
+from datetime import datetime
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer, ENGLISH_STOP_WORDS
+
+from ai_matcher import (INDUSTRIES, LOCATION_KNOWN, LOCATION_MATCH, FeatureStore, event_text, location_matches,
+                        sponsor_text, theme_industries)
+
+
+def _save_csr(directory, name, matrix):
+    """Save a CSR matrix as one .npy file per part so each can be memory-mapped"""
+    for part in ('data', 'indices', 'indptr'):
+        np.save(os.path.join(directory, f'{name}.{part}.npy'), getattr(matrix, part))
+    return list(matrix.shape)
+
+
+def _load_csr(directory, name, shape, mmap_mode='r'):
+    parts = [np.load(os.path.join(directory, f'{name}.{part}.npy'), mmap_mode=mmap_mode)
+             for part in ('data', 'indices', 'indptr')]
+    return sp.csr_matrix(tuple(parts), shape=tuple(shape), copy=False)
+
+
+def _replace_directory(directory, write):
+    """Call ``write(path)`` on a scratch directory, then swap it in for ``directory``.
+
+    Processes that memory-mapped the old files keep reading them until they
+    reload; they are only unlinked, never overwritten.
+    """
+    scratch, old = f'{directory}.tmp', f'{directory}.old'
+    shutil.rmtree(scratch, ignore_errors=True)
+    os.makedirs(scratch)
+    write(scratch)
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(directory):
+        os.rename(directory, old)
+    os.rename(scratch, directory)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+class MatcherIndex:
+    """Corpus-wide TF-IDF index over every event and sponsor text.
+
+    The vocabulary and IDF weights are fitted once over all documents and each
+    entity keeps a sparse, L2-normalised row, so text similarity between an
+    event and a sponsor is a single sparse dot product.
+    """
+
+    TEXTS = {'event': event_text, 'sponsor': sponsor_text}
+
+    def __init__(self, max_features=1000):
+        self.max_features = max_features
+        self.vectorizer = None
+        self.fitted_size = 0
+        self.matrices = {}
+        # Fitted matrix row of each entity id, and the row version it was fitted at
+        self.rows = {'event': {}, 'sponsor': {}}
+        self.versions = {'event': {}, 'sponsor': {}}
+        # (version, vector) of entities transformed since the fit
+        self.extra = {'event': {}, 'sponsor': {}}
+
+    @property
+    def ready(self):
+        return self.vectorizer is not None
+
+    def needs_refit(self):
+        """Refit when missing or once more entities changed than were fitted"""
+        changed = len(self.extra['event']) + len(self.extra['sponsor'])
+        return not self.ready or changed > self.fitted_size
+
+    def fit(self, events, sponsors):
+        """Fit the vocabulary over all entities and store their vectors"""
+        texts = [event_text(e) for e in events] + [sponsor_text(s) for s in sponsors]
+        vectorizer = TfidfVectorizer(stop_words='english', max_features=self.max_features)
+        matrix = vectorizer.fit_transform(texts).tocsr()
+
+        self.vectorizer = vectorizer
+        self.fitted_size = len(texts)
+        self.matrices = {'event': matrix[:len(events)], 'sponsor': matrix[len(events):]}
+        self.rows = {
+            'event': {e.id: i for i, e in enumerate(events)},
+            'sponsor': {s.id: i for i, s in enumerate(sponsors)},
+        }
+        self.versions = {
+            'event': {e.id: e.version for e in events},
+            'sponsor': {s.id: s.version for s in sponsors},
+        }
+        self.extra = {'event': {}, 'sponsor': {}}
+
+    def invalidate(self, kind, entity_id):
+        """Drop the stored vector of an entity whose text changed"""
+        self.rows[kind].pop(entity_id, None)
+        self.extra[kind].pop(entity_id, None)
+
+    def _row(self, kind, entity):
+        """Fitted row of an entity, None if it was fitted at another version or not at all"""
+        row = self.rows[kind].get(entity.id)
+        if row is not None and self.versions[kind].get(entity.id) == entity.version:
+            return row
+        return None
+
+    def _extra(self, kind, entity):
+        entry = self.extra[kind].get(entity.id)
+        if entry is not None and entry[0] == entity.version:
+            return entry[1]
+        return None
+
+    def vector(self, kind, entity):
+        """Return the 1 x V TF-IDF row of an entity, transforming unseen versions once"""
+        row = self._row(kind, entity)
+        if row is not None:
+            return self.matrices[kind][row]
+
+        vector = self._extra(kind, entity)
+        if vector is None:
+            vector = self.vectorizer.transform([self.TEXTS[kind](entity)])
+            if entity.id is not None:
+                self.extra[kind][entity.id] = (entity.version, vector)
+        return vector
+
+    def vectors(self, kind, entities):
+        """Stack the TF-IDF rows of several entities into one CSR matrix"""
+        rows = [self._row(kind, e) for e in entities]
+        if None not in rows:
+            return self.matrices[kind][rows]
+
+        # Transform every unseen entity in one call before stacking
+        missing = [e for e, row in zip(entities, rows)
+                   if row is None and e.id is not None and self._extra(kind, e) is None]
+        if missing:
+            vectors = self.vectorizer.transform([self.TEXTS[kind](e) for e in missing])
+            for i, entity in enumerate(missing):
+                self.extra[kind][entity.id] = (entity.version, vectors[i])
+        return sp.vstack([self.vector(kind, e) for e in entities], format='csr')
+
+    def similarity(self, event, sponsor):
+        """Cosine similarity of an event and a sponsor (rows are unit length)"""
+        product = self.vector('event', event) @ self.vector('sponsor', sponsor).T
+        return float(product.sum())
+
+    SNAPSHOT_VERSION = 2
+
+    def save(self, directory):
+        """Write the fitted index as a snapshot other processes can memory-map"""
+        if not self.ready:
+            raise ValueError("Cannot save an unfitted matcher index")
+
+        def write(path):
+            vocabulary = sorted(self.vectorizer.vocabulary_, key=self.vectorizer.vocabulary_.get)
+            np.save(os.path.join(path, 'vocabulary.npy'), np.array(vocabulary, dtype=str))
+            np.save(os.path.join(path, 'idf.npy'), self.vectorizer.idf_)
+            shapes = {}
+            for kind in ('event', 'sponsor'):
+                ids = sorted(self.rows[kind], key=self.rows[kind].get)
+                np.save(os.path.join(path, f'{kind}_ids.npy'), np.array(ids, dtype=np.int64))
+                np.save(os.path.join(path, f'{kind}_versions.npy'),
+                        np.array([self.versions[kind].get(i, 0) for i in ids], dtype=np.int64))
+                shapes[kind] = _save_csr(path, kind, self.matrices[kind])
+            with open(os.path.join(path, 'index.json'), 'w') as f:
+                json.dump({
+                    'version': self.SNAPSHOT_VERSION,
+                    'max_features': self.max_features,
+                    'fitted_size': self.fitted_size,
+                    'shapes': shapes,
+                    'created_at': datetime.utcnow().isoformat(),
+                }, f)
+
+        _replace_directory(directory, write)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Open a saved snapshot; its arrays are memory-mapped read-only by default"""
+        with open(os.path.join(directory, 'index.json')) as f:
+            manifest = json.load(f)
+        if manifest['version'] != cls.SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported matcher snapshot version {manifest['version']}")
+
+        index = cls(max_features=manifest['max_features'])
+        vocabulary = np.load(os.path.join(directory, 'vocabulary.npy'))
+        vectorizer = TfidfVectorizer(stop_words='english', max_features=index.max_features,
+                                     vocabulary={term: i for i, term in enumerate(vocabulary.tolist())})
+        vectorizer.idf_ = np.load(os.path.join(directory, 'idf.npy'), mmap_mode=mmap_mode)
+        index.vectorizer = vectorizer
+        index.fitted_size = manifest['fitted_size']
+        for kind in ('event', 'sponsor'):
+            ids = np.load(os.path.join(directory, f'{kind}_ids.npy'), mmap_mode=mmap_mode)
+            versions = np.load(os.path.join(directory, f'{kind}_versions.npy'))
+            index.rows[kind] = {entity_id: i for i, entity_id in enumerate(ids.tolist())}
+            index.versions[kind] = dict(zip(ids.tolist(), versions.tolist()))
+            index.matrices[kind] = _load_csr(directory, kind, manifest['shapes'][kind], mmap_mode)
+        return index
+
+
+def _words(text):
+    """Lowercase content words of a free-text field"""
+    if not text:
+        return set()
+    return {w for w in re.findall(r'[a-z0-9]+', text.lower()) if w not in ENGLISH_STOP_WORDS}
+
+
+def event_terms(event):
+    """Retrieval terms of an event: content words, location and matched industries"""
+    terms = _words(event.tags) | _words(event.theme) | _words(event.target_audience) | _words(event.description)
+    terms |= {f'loc:{w}' for w in _words(event.location)}
+    mask = theme_industries(event.theme)
+    terms |= {f'industry:{industry}' for bit, industry in enumerate(INDUSTRIES) if mask >> bit & 1}
+    return terms
+
+
+def sponsor_terms(sponsor):
+    """Retrieval terms of a sponsor: content words, location and its industry"""
+    terms = _words(sponsor.target_demographics) | _words(sponsor.industry) | _words(sponsor.description)
+    terms |= {f'loc:{w}' for w in _words(sponsor.location)}
+    if sponsor.industry:
+        terms.add(f'industry:{sponsor.industry}')
+    return terms
+
+
+class CandidateIndex:
+    """Inverted index from retrieval terms to entity ids.
+
+    Stage one of two-stage retrieval: only the posting lists of the query
+    terms are touched, so finding a few hundred candidates does not depend
+    on the size of the catalog the way exhaustive scoring does.
+    """
+
+    TERMS = {'event': event_terms, 'sponsor': sponsor_terms}
+
+    def __init__(self, max_df=0.2):
+        # Terms found in more than this share of entities carry little signal
+        self.max_df = max_df
+        self.built = False
+        self.postings = {'event': {}, 'sponsor': {}}
+        self.terms = {'event': {}, 'sponsor': {}}
+
+    def build(self, events, sponsors):
+        """Index every entity from scratch"""
+        self.postings = {'event': {}, 'sponsor': {}}
+        self.terms = {'event': {}, 'sponsor': {}}
+        for event in events:
+            self.add('event', event)
+        for sponsor in sponsors:
+            self.add('sponsor', sponsor)
+        self.built = True
+
+    def add(self, kind, entity):
+        """Index an entity, replacing any terms it had before"""
+        self.remove(kind, entity.id)
+        terms = self.TERMS[kind](entity)
+        self.terms[kind][entity.id] = terms
+        postings = self.postings[kind]
+        for term in terms:
+            postings.setdefault(term, set()).add(entity.id)
+
+    def remove(self, kind, entity_id):
+        postings = self.postings[kind]
+        for term in self.terms[kind].pop(entity_id, ()):
+            posting = postings.get(term)
+            if posting is not None:
+                posting.discard(entity_id)
+                if not posting:
+                    del postings[term]
+
+    def search(self, kind, terms, budget):
+        """Ids of up to ``budget`` entities of ``kind`` sharing the most IDF-weighted terms.
+
+        Terms above ``max_df`` are skipped once the rarer ones have found
+        ``budget`` candidates, so a profile made only of common words still
+        gets candidates.
+        """
+        postings = self.postings[kind]
+        total = max(len(self.terms[kind]), 1)
+        weights = {}
+        # Rarest first, so common terms are only read to fill up the budget
+        for size, term in sorted((len(postings[t]), t) for t in terms if postings.get(t)):
+            if size > self.max_df * total and len(weights) >= budget:
+                break
+            posting = postings[term]
+            weight = math.log(1 + total / size)
+            for entity_id in posting:
+                weights[entity_id] = weights.get(entity_id, 0.0) + weight
+
+        if len(weights) <= budget:
+            return list(weights)
+        ids = np.fromiter(weights.keys(), dtype=np.int64, count=len(weights))
+        values = np.fromiter(weights.values(), dtype=np.float64, count=len(weights))
+        return ids[top_k(values, budget)].tolist()
+
+
+def top_k(scores, k):
+    """Indices of the k largest scores, best first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def _token_matrix(token_sets, vocabulary):
+    """Binary CSR matrix with one row per token set"""
+    indptr = [0]
+    indices = []
+    for tokens in token_sets:
+        indices.extend(vocabulary[t] for t in tokens)
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.float64)
+    return sp.csr_matrix((data, indices, indptr), shape=(len(token_sets), max(len(vocabulary), 1)))
+
+
+def _encode(values):
+    """Map values to dense ids; missing values become -1"""
+    ids = {}
+    codes = np.array([ids.setdefault(v, len(ids)) if v else -1 for v in values], dtype=np.intp)
+    return codes, list(ids)
+
+
+class MatchFeatures:
+    """Array form of everything the scorer reads from a set of events and sponsors.
+
+    Built once, the arrays can be scored in blocks of event rows, saved as
+    .npy files and memory-mapped read-only by other processes.
+    """
+
+    VERSION = 1
+    SPARSE = ('event_text', 'sponsor_text', 'event_audience', 'sponsor_audience')
+    DENSE = ('event_ids', 'sponsor_ids', 'text_ready', 'has_tags', 'has_demographics',
+             'event_location', 'sponsor_location', 'location_table',
+             'event_industries', 'sponsor_industry', 'footfall')
+
+    def __init__(self, **arrays):
+        self.__dict__.update(arrays)
+
+    @property
+    def shape(self):
+        return len(self.event_ids), len(self.sponsor_ids)
+
+    @classmethod
+    def build(cls, index, events, sponsors, store=None):
+        store = store or FeatureStore()
+        event_features = [store.get('event', e) for e in events]
+        sponsor_features = [store.get('sponsor', s) for s in sponsors]
+
+        # Text: TF-IDF rows from the corpus index
+        if index.ready:
+            event_text = index.vectors('event', events)
+            sponsor_text = index.vectors('sponsor', sponsors)
+        else:
+            event_text = sp.csr_matrix((len(events), 0))
+            sponsor_text = sp.csr_matrix((len(sponsors), 0))
+
+        # Audience: binary token matrices over a shared vocabulary
+        event_tokens = [f.audience for f in event_features]
+        sponsor_tokens = [f.audience for f in sponsor_features]
+        vocabulary = {}
+        for tokens in event_tokens + sponsor_tokens:
+            for token in tokens:
+                vocabulary.setdefault(token, len(vocabulary))
+
+        # Location: encoded ids into a table over distinct location pairs;
+        # the extra zero row/column is what a missing location (-1) selects
+        event_location, event_loc_values = _encode([f.location for f in event_features])
+        sponsor_location, sponsor_loc_values = _encode([f.location for f in sponsor_features])
+        location_table = np.zeros((len(event_loc_values) + 1, len(sponsor_loc_values) + 1))
+        for i, event_loc in enumerate(event_loc_values):
+            for j, sponsor_loc in enumerate(sponsor_loc_values):
+                location_table[i, j] = LOCATION_MATCH if location_matches(event_loc, sponsor_loc) else LOCATION_KNOWN
+
+        # Industry: which industries each theme mentions; -1 selects the all-False column
+        masks = np.array([f.industries for f in event_features], dtype=np.int64).reshape(-1, 1)
+        event_industries = np.zeros((len(events), len(INDUSTRIES) + 1), dtype=bool)
+        event_industries[:, :-1] = masks >> np.arange(len(INDUSTRIES)) & 1
+        sponsor_industry = np.array([f.industry.bit_length() - 1 for f in sponsor_features], dtype=np.intp)
+
+        return cls(
+            event_ids=np.array([e.id for e in events], dtype=np.int64),
+            sponsor_ids=np.array([s.id for s in sponsors], dtype=np.int64),
+            text_ready=np.array(index.ready),
+            event_text=event_text,
+            sponsor_text=sponsor_text,
+            has_tags=np.array([f.has_tags for f in event_features], dtype=bool),
+            has_demographics=np.array([f.has_demographics for f in sponsor_features], dtype=bool),
+            event_audience=_token_matrix(event_tokens, vocabulary),
+            sponsor_audience=_token_matrix(sponsor_tokens, vocabulary),
+            event_location=event_location,
+            sponsor_location=sponsor_location,
+            location_table=location_table,
+            event_industries=event_industries,
+            sponsor_industry=sponsor_industry,
+            footfall=np.array([f.footfall for f in event_features], dtype=np.float64),
+        )
+
+    def score(self, start=0, stop=None):
+        """Component arrays for event rows [start, stop) against every sponsor"""
+        rows = slice(start, stop)
+        has_tags = self.has_tags[rows]
+        shape = (len(has_tags), len(self.sponsor_ids))
+
+        # Tag similarity score (40% weight): one sparse matrix product
+        has_text = has_tags[:, None] & self.has_demographics[None, :]
+        if self.text_ready:
+            similarity = (self.event_text[rows] @ self.sponsor_text.T).toarray()
+            text = np.where(has_text, similarity * 0.4, 0.0)
+        else:
+            text = np.where(has_text, 0.1, 0.0)
+
+        # Audience overlap score (25% weight): shared tokens per pair
+        common = (self.event_audience[rows] @ self.sponsor_audience.T).toarray()
+        audience = np.minimum(common / 5, 1) * 0.25
+
+        # Location relevance score (20% weight)
+        location = self.location_table[self.event_location[rows]][:, self.sponsor_location]
+
+        # Industry relevance score (15% weight)
+        industry = np.where(self.event_industries[rows][:, self.sponsor_industry], 0.15, 0.0)
+
+        # Engagement bonus from expected footfall
+        footfall = np.broadcast_to(self.footfall[rows][:, None], shape)
+
+        total = np.minimum(text + audience + location + industry + footfall, 1.0)
+        return {
+            'text': text,
+            'audience': audience,
+            'location': location,
+            'industry': industry,
+            'footfall': footfall,
+            'total': total,
+        }
+
+    def save(self, directory):
+        """Write every array as a .npy file (sparse ones as their CSR parts)"""
+        os.makedirs(directory, exist_ok=True)
+        shapes = {}
+        for name in self.SPARSE:
+            shapes[name] = _save_csr(directory, name, getattr(self, name))
+        for name in self.DENSE:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(directory, 'features.json'), 'w') as f:
+            json.dump({'version': self.VERSION, 'shapes': shapes}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Load saved features, memory-mapped read-only by default"""
+        with open(os.path.join(directory, 'features.json')) as f:
+            manifest = json.load(f)
+        if manifest['version'] != cls.VERSION:
+            raise ValueError(f"Unsupported match features version {manifest['version']}")
+
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+                  for name in cls.DENSE}
+        for name in cls.SPARSE:
+            arrays[name] = _load_csr(directory, name, manifest['shapes'][name], mmap_mode)
+        return cls(**arrays)
@@ -0,0 +1,133 @@
+"""Conversations and unread counters for direct messages.
+
+Every message belongs to the Conversation of its sender/recipient pair.
+Each side of a conversation has a ConversationParticipant row holding its
+unread count and the time of the latest message, so an inbox page is one
+index range scan over the participant rows. It does not scan the message
+history. The counters are only changed here, when a message is sent or
+marked read.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
+
+import notifications
+from app import db
+from models import Conversation, ConversationParticipant, Message
+
+
+def get_conversation(user_id, other_id, create=True):
+    """The conversation between two users, created with both participants if needed"""
+    low, high = sorted((user_id, other_id))
+    conversation = Conversation.query.filter_by(user_low_id=low, user_high_id=high).first()
+    if conversation is not None or not create:
+        return conversation
+
+    try:
+        with db.session.begin_nested():
+            conversation = Conversation(user_low_id=low, user_high_id=high)
+            db.session.add(conversation)
+            db.session.flush()
+            db.session.add_all([ConversationParticipant(conversation_id=conversation.id, user_id=uid)
+                                for uid in {low, high}])
+    except IntegrityError:
+        # Another request created it first
+        conversation = Conversation.query.filter_by(user_low_id=low, user_high_id=high).one()
+    return conversation
+
+
+def send_message(sender_id, recipient_id, subject, content, event_id=None):
+    """Store a message and update its conversation's pointer and counters; the caller commits"""
+    conversation = get_conversation(sender_id, recipient_id)
+    message = Message(
+        sender_id=sender_id,
+        recipient_id=recipient_id,
+        subject=subject,
+        content=content,
+        event_id=event_id,
+        conversation_id=conversation.id,
+        created_at=datetime.utcnow(),
+    )
+    db.session.add(message)
+    db.session.flush()
+
+    conversation.last_message_id = message.id
+    conversation.last_message_at = message.created_at
+    participants = ConversationParticipant.query.filter_by(conversation_id=conversation.id)
+    participants.update({ConversationParticipant.last_message_at: message.created_at},
+                        synchronize_session=False)
+    # Increment in SQL so concurrent sends to the same user are all counted
+    if recipient_id != sender_id:
+        participants.filter_by(user_id=recipient_id).update(
+            {ConversationParticipant.unread_count: ConversationParticipant.unread_count + 1},
+            synchronize_session=False)
+        notifications.notify_on_commit(recipient_id)
+    return message
+
+
+def mark_read(message):
+    """Mark a received message read and decrement its recipient's unread count once"""
+    if message.read:
+        return
+    # Flip the flag in SQL so that of two concurrent requests only one decrements
+    flipped = (Message.query.filter_by(id=message.id, read=False)
+               .update({Message.read: True}, synchronize_session=False))
+    set_committed_value(message, 'read', True)
+    if not flipped:
+        return
+    if message.conversation_id is not None and message.recipient_id != message.sender_id:
+        (ConversationParticipant.query
+         .filter_by(conversation_id=message.conversation_id, user_id=message.recipient_id)
+         .filter(ConversationParticipant.unread_count > 0)
+         .update({ConversationParticipant.unread_count: ConversationParticipant.unread_count - 1},
+                 synchronize_session=False))
+        # Other open tabs update their unread badge
+        notifications.notify_on_commit(message.recipient_id)
+
+
+def unread_total(user_id):
+    """Unread messages of a user across all conversations"""
+    return (db.session.query(func.coalesce(func.sum(ConversationParticipant.unread_count), 0))
+            .filter(ConversationParticipant.user_id == user_id)
+            .scalar())
+
+
+def recount(conversation):
+    """Recompute a conversation's pointer and both unread counts from its messages"""
+    last = (Message.query.filter_by(conversation_id=conversation.id)
+            .order_by(Message.created_at.desc(), Message.id.desc()).first())
+    conversation.last_message_id = last.id if last else None
+    conversation.last_message_at = last.created_at if last else None
+    for participant in conversation.participants:
+        participant.last_message_at = conversation.last_message_at
+        participant.unread_count = (Message.query
+                                    .filter_by(conversation_id=conversation.id,
+                                               recipient_id=participant.user_id, read=False)
+                                    .filter(Message.sender_id != participant.user_id)
+                                    .count())
+
+
+def backfill(batch_size=1000):
+    """Thread messages written before conversations existed; safe to rerun"""
+    threaded = 0
+    while True:
+        messages = (Message.query.filter(Message.conversation_id.is_(None))
+                    .order_by(Message.id).limit(batch_size).all())
+        if not messages:
+            break
+        touched = {}
+        for message in messages:
+            conversation = get_conversation(message.sender_id, message.recipient_id)
+            message.conversation_id = conversation.id
+            touched[conversation.id] = conversation
+        db.session.flush()
+        for conversation in touched.values():
+            recount(conversation)
+        db.session.commit()
+        threaded += len(messages)
+    if threaded:
+        logging.info(f"Threaded {threaded} messages into conversations")
+    return threaded
@@ -0,0 +1,314 @@
+"""Per-request timing, Prometheus metrics and an opt-in profiler.
+
+Every request is split into time spent in SQL (engine cursor events), in
+the matcher (``@timed('matcher')`` entry points) and rendering templates
+(Flask's template signals). The split is recorded in per-endpoint
+histograms served as Prometheus text on ``/metrics``, and returned to the
+browser in a ``Server-Timing`` header. ``/metrics`` requires the
+METRICS_TOKEN as a bearer token; without one it only answers scrapes from
+the same host.
+
+Requests are profiled with cProfile when PROFILE_SAMPLE_RATE selects them,
+or when they send ``X-Profile`` with the PROFILE_TOKEN. Profiles are written
+to PROFILE_DIR for ``python -m pstats`` or snakeviz.
+
+Metrics are kept per process. Under gunicorn each worker reports its own.
+"""
+import cProfile
+import hmac
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from io import StringIO
+
+from flask import (Response, abort, before_render_template, current_app, g, has_request_context, request,
+                   template_rendered)
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+import query_budget
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNTS = (1, 2, 5, 10, 20, 50, 100)
+# Scrapers allowed without METRICS_TOKEN
+LOCAL_ADDRESSES = {'127.0.0.1', '::1'}
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label value"""
+
+    def __init__(self, name, description, label, buckets=SECONDS):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {label: ([*counts], total) for label, (counts, total) in self._series.items()}
+        for label, (counts, total) in sorted(series.items()):
+            labels = f'{self.label}="{label}"'
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values"""
+
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *values):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            labels = ','.join(f'{name}="{v}"' for name, v in zip(self.labels, key))
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return lines
+
+
+requests_total = Counter('http_requests_total', 'Requests handled', ('endpoint', 'method', 'status'))
+request_seconds = Histogram('http_request_duration_seconds', 'Time to build the response', 'endpoint')
+db_seconds = Histogram('http_request_db_seconds', 'Time spent executing SQL per request', 'endpoint')
+queries = Histogram('http_request_queries', 'SQL statements per request', 'endpoint', COUNTS)
+matcher_seconds = Histogram('http_request_matcher_seconds', 'Time spent in the matcher per request', 'endpoint')
+template_seconds = Histogram('http_request_template_seconds', 'Time spent rendering templates per request',
+                             'endpoint')
+pool_wait_seconds = Histogram('db_pool_checkout_wait_seconds', 'Time to get a pooled connection', 'engine',
+                              (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10))
+pool_timeouts = Counter('db_pool_timeouts_total', 'Checkouts that gave up waiting for a connection', ('engine',))
+METRICS = [requests_total, request_seconds, db_seconds, queries, matcher_seconds, template_seconds,
+           pool_wait_seconds, pool_timeouts]
+
+# Functions returning extra exposition lines, called on every scrape
+_collectors = []
+
+
+def register_collector(collect):
+    """Add ``collect()`` lines (gauges read at scrape time) to /metrics"""
+    _collectors.append(collect)
+
+
+def gauges(prefix, values):
+    """Exposition lines for a dict of numbers, e.g. ``gauges('matcher_memo', memo.stats())``"""
+    lines = []
+    for name, value in values.items():
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines.append(f"{prefix}_{name} {value}")
+    return lines
+
+
+def timed(component):
+    """Add a function's duration to the request's ``component`` time; nested calls count once"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not has_request_context() or component in g.get('metrics_active', ()):
+                return function(*args, **kwargs)
+            g.setdefault('metrics_active', set()).add(component)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                g.metrics_active.discard(component)
+                timings = g.setdefault('metrics_timings', {})
+                timings[component] = timings.get(component, 0) + time.perf_counter() - started
+        return wrapper
+    return decorator
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long each checkout waited, to show when DB_POOL_SIZE is too small"""
+
+    name = 'primary'
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.name = self.name
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            pool_timeouts.inc(self.name)
+            raise
+        finally:
+            pool_wait_seconds.observe(self.name, time.perf_counter() - started)
+
+
+def _pool_gauges(engines):
+    lines = []
+    for name, engine in engines.items():
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            label = name or 'primary'
+            lines.append(f'db_pool_size{{engine="{label}"}} {pool.size()}')
+            lines.append(f'db_pool_checked_out{{engine="{label}"}} {pool.checkedout()}')
+            lines.append(f'db_pool_overflow{{engine="{label}"}} {max(0, pool.overflow())}')
+    return lines
+
+
+def init_app(app, engines):
+    """Time requests, SQL and templates, and serve /metrics; ``engines`` maps bind keys to engines"""
+    app.config.setdefault('METRICS_TOKEN', None)
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+    app.config.setdefault('PROFILE_TOKEN', None)
+    app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+    app.config.setdefault('SLOW_REQUEST_MS', 1000)
+    # Endpoints that hold requests open on purpose
+    app.config.setdefault('SLOW_REQUEST_IGNORE', {'notifications_poll', 'notifications_stream'})
+
+    for key, engine in engines.items():
+        if isinstance(engine.pool, TimedQueuePool):
+            engine.pool.name = key or 'primary'
+        if not event.contains(engine, 'before_cursor_execute', _before_cursor):
+            event.listen(engine, 'before_cursor_execute', _before_cursor)
+            event.listen(engine, 'after_cursor_execute', _after_cursor)
+    register_collector(lambda: _pool_gauges(engines))
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', _metrics_view)
+
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_started'] = time.perf_counter()
+
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.metrics_db = g.get('metrics_db', 0) + time.perf_counter() - conn.info['metrics_started']
+
+
+def _before_render(app, template, context, **extra):
+    if has_request_context():
+        g.setdefault('metrics_render_started', []).append(time.perf_counter())
+
+
+def _after_render(app, template, context, **extra):
+    if has_request_context() and g.get('metrics_render_started'):
+        started = g.metrics_render_started.pop()
+        # Only the outermost render, so included templates are not counted twice
+        if not g.metrics_render_started:
+            timings = g.setdefault('metrics_timings', {})
+            timings['template'] = timings.get('template', 0) + time.perf_counter() - started
+
+
+def _should_profile(app):
+    token = app.config['PROFILE_TOKEN']
+    header = request.headers.get('X-Profile')
+    if token and header and hmac.compare_digest(header, token):
+        return True
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_db = 0
+    g.metrics_timings = {}
+    g.metrics_queries = query_budget.query_count()
+    if request.endpoint != 'metrics' and _should_profile(current_app):
+        g.metrics_profile = cProfile.Profile()
+        g.metrics_profile.enable()
+
+
+def _save_profile(profile, directory):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint}-{os.getpid()}.prof")
+    profile.dump_stats(path)
+    summary = StringIO()
+    pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(15)
+    logging.info(f"Profiled {request.method} {request.path} to {path}\n{summary.getvalue()}")
+    return path
+
+
+def _finish_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None or request.endpoint == 'metrics':
+        return response
+    profile = g.pop('metrics_profile', None)
+    if profile is not None:
+        profile.disable()
+        path = _save_profile(profile, current_app.config['PROFILE_DIR'])
+        if request.headers.get('X-Profile'):
+            response.headers['X-Profile-File'] = os.path.basename(path)
+
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or 'unmatched'
+    timings = g.get('metrics_timings', {})
+    db_time = g.get('metrics_db', 0)
+    statements = query_budget.query_count() - g.get('metrics_queries', 0)
+
+    requests_total.inc(endpoint, request.method, str(response.status_code))
+    request_seconds.observe(endpoint, elapsed)
+    db_seconds.observe(endpoint, db_time)
+    queries.observe(endpoint, statements)
+    matcher_seconds.observe(endpoint, timings.get('matcher', 0))
+    template_seconds.observe(endpoint, timings.get('template', 0))
+
+    response.headers['Server-Timing'] = ', '.join(
+        f'{name};dur={seconds * 1000:.1f}'
+        for name, seconds in (('db', db_time), ('matcher', timings.get('matcher', 0)),
+                              ('template', timings.get('template', 0)), ('total', elapsed)))
+    if (elapsed * 1000 > current_app.config['SLOW_REQUEST_MS']
+            and endpoint not in current_app.config['SLOW_REQUEST_IGNORE']):
+        logging.warning(f"Slow request {request.method} {request.path}: {elapsed * 1000:.0f} ms, "
+                        f"db {db_time * 1000:.0f} ms in {statements} queries, "
+                        f"matcher {timings.get('matcher', 0) * 1000:.0f} ms, "
+                        f"template {timings.get('template', 0) * 1000:.0f} ms")
+    return response
+
+
+def _is_local():
+    # A request relayed by a proxy on the same host is not local
+    return request.remote_addr in LOCAL_ADDRESSES and 'X-Forwarded-For' not in request.headers
+
+
+def _metrics_view():
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+    elif not _is_local():
+        abort(403)
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    for collect in _collectors:
+        lines.extend(collect())
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
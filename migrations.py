@@ -0,0 +1,79 @@
+"""Idempotent schema upgrades for databases created by older versions.
+
+``db.create_all()`` only creates missing tables, so anything added to an
+existing table (columns and indexes) is brought in here. It runs at startup
+and only issues DDL for what is actually missing.
+"""
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateIndex
+
+
+def missing_columns(engine, metadata):
+    """Columns declared on the models but absent from their existing tables"""
+    inspector = inspect(engine)
+    missing = []
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend(column for column in table.columns if column.name not in existing)
+    return missing
+
+
+def add_column_ddl(engine, column):
+    """ALTER TABLE statement adding ``column``; NOT NULL needs a server default"""
+    preparer = engine.dialect.identifier_preparer
+    ddl = (f"ALTER TABLE {preparer.format_table(column.table)} "
+           f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=engine.dialect)}")
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    return ddl
+
+
+def add_columns(engine, metadata):
+    """Add every missing declared column"""
+    columns = missing_columns(engine, metadata)
+    for column in columns:
+        logging.info(f"Adding column {column.table.name}.{column.name}")
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(add_column_ddl(engine, column)))
+        except DBAPIError:
+            # Another worker may have added it first; anything else is a real failure
+            if column.name not in {c['name'] for c in inspect(engine).get_columns(column.table.name)}:
+                raise
+    return columns
+
+
+def missing_indexes(engine, metadata):
+    """Indexes declared on the models but absent from the database"""
+    inspector = inspect(engine)
+    missing = []
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in existing)
+    return missing
+
+
+def create_indexes(engine, metadata):
+    """Create every missing declared index"""
+    indexes = missing_indexes(engine, metadata)
+    with engine.begin() as conn:
+        for index in indexes:
+            logging.info(f"Creating index {index.name} on {index.table.name}")
+            # IF NOT EXISTS: another worker may be running the same upgrade
+            conn.execute(CreateIndex(index, if_not_exists=True))
+    return indexes
+
+
+def upgrade(engine, metadata):
+    """Bring an existing database up to the current models"""
+    add_columns(engine, metadata)
+    create_indexes(engine, metadata)
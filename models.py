@@ -32,6 +32,13 @@ class ClubProfile(db.Model):
     description = db.Column(db.Text)
     contact_person = db.Column(db.String(100))
     phone = db.Column(db.String(20))
+    # Bumped by every ORM update, so a save that lost a race to another edit fails instead of overwriting it
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    __table_args__ = (
+        db.Index('ix_club_profile_user_id', 'user_id'),
+    )
+    __mapper_args__ = {'version_id_col': version}
     
     # Relationships
     events = db.relationship('Event', backref='club', lazy=True)
@@ -48,6 +55,14 @@ class SponsorProfile(db.Model):
     target_demographics = db.Column(db.String(200))
     contact_person = db.Column(db.String(100))
     phone = db.Column(db.String(20))
+    # Bumped by every ORM update; cached match scores are keyed by it
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_sponsor_profile_user_id', 'user_id'),
+    )
+    __mapper_args__ = {'version_id_col': version}
 
 class Event(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -66,6 +81,16 @@ class Event(db.Model):
     past_engagement_stats = db.Column(db.Text)
     tags = db.Column(db.String(500))  # Comma-separated tags
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped by every ORM update; cached match scores are keyed by it
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Club dashboards filter by club; search pages newest first by (created_at, id)
+    __table_args__ = (
+        db.Index('ix_event_club_id', 'club_id'),
+        db.Index('ix_event_created_at', 'created_at', 'id'),
+    )
+    __mapper_args__ = {'version_id_col': version}
     
     # Relationships
     interests = db.relationship('SponsorInterest', backref='event', lazy=True)
@@ -78,6 +103,12 @@ class SponsorInterest(db.Model):
     message = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Duplicate-interest checks and the sponsor dashboard's recent interests
+    __table_args__ = (
+        db.Index('ix_sponsor_interest_sponsor_event', 'sponsor_id', 'event_id'),
+        db.Index('ix_sponsor_interest_sponsor_created', 'sponsor_id', 'created_at'),
+    )
+    
     # Relationships
     sponsor = db.relationship('SponsorProfile', backref='interests')
 
@@ -90,6 +121,100 @@ class Message(db.Model):
     read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Inbox and sent lists are read newest first per user
+    __table_args__ = (
+        db.Index('ix_message_recipient_created', 'recipient_id', 'created_at'),
+        db.Index('ix_message_sender_created', 'sender_id', 'created_at'),
+        db.Index('ix_message_conversation_created', 'conversation_id', 'created_at', 'id'),
+    )
+    
     # Relationship to link messages about specific events
     event_id = db.Column(db.Integer, db.ForeignKey('event.id'))
     event = db.relationship('Event', backref='messages')
+    
+    # Thread this message belongs to; set by messaging.send_message
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'))
+    conversation = db.relationship('Conversation', foreign_keys=[conversation_id], backref='messages')
+
+class Conversation(db.Model):
+    """Thread between two users; keeps a pointer to its latest message"""
+    id = db.Column(db.Integer, primary_key=True)
+    # The pair is stored ordered so each pair has exactly one row
+    user_low_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_high_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    last_message_id = db.Column(db.Integer)
+    last_message_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_low_id', 'user_high_id'),
+    )
+    
+    # Relationships
+    user_low = db.relationship('User', foreign_keys=[user_low_id])
+    user_high = db.relationship('User', foreign_keys=[user_high_id])
+    last_message = db.relationship('Message', primaryjoin='foreign(Conversation.last_message_id) == Message.id',
+                                   viewonly=True)
+    participants = db.relationship('ConversationParticipant', backref='conversation')
+    
+    def other_user(self, user_id):
+        return self.user_high if user_id == self.user_low_id else self.user_low
+
+class ConversationParticipant(db.Model):
+    """One user's side of a conversation: unread count and inbox position"""
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    unread_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Copy of the conversation's, so the inbox is one index range scan
+    last_message_at = db.Column(db.DateTime)
+    
+    # Inboxes are read newest conversation first per user
+    __table_args__ = (
+        db.UniqueConstraint('conversation_id', 'user_id'),
+        db.Index('ix_conversation_participant_user_last', 'user_id', 'last_message_at', 'id'),
+    )
+    
+    # Relationships
+    user = db.relationship('User')
+
+class MatchScore(db.Model):
+    """Precomputed match score of an event/sponsor pair with its breakdown"""
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
+    sponsor_id = db.Column(db.Integer, db.ForeignKey('sponsor_profile.id'), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    text_score = db.Column(db.Float, default=0)
+    audience_score = db.Column(db.Float, default=0)
+    location_score = db.Column(db.Float, default=0)
+    industry_score = db.Column(db.Float, default=0)
+    footfall_score = db.Column(db.Float, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Dashboards read the top-k of one row or column ordered by score
+    __table_args__ = (
+        db.UniqueConstraint('event_id', 'sponsor_id'),
+        db.Index('ix_match_score_sponsor_score', 'sponsor_id', 'score'),
+        db.Index('ix_match_score_event_score', 'event_id', 'score'),
+    )
+    
+    # Relationships
+    event = db.relationship('Event')
+    sponsor = db.relationship('SponsorProfile')
+
+class MatchJob(db.Model):
+    """Queued request to rescore an event, a sponsor profile or everything ('all')"""
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(20), nullable=False)  # 'event', 'sponsor' or 'all'
+    entity_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'running' or 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # When a pending job may run; for a running job, when its lease expires
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_match_job_status_available', 'status', 'available_at'),
+        db.Index('ix_match_job_entity', 'entity_type', 'entity_id', 'status'),
+    )
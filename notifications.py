@@ -0,0 +1,180 @@
+"""New-message notifications for long-poll and Server-Sent Events clients.
+
+A browser keeps one request open (``/api/notifications`` long-poll, or the
+``/api/notifications/stream`` event stream) instead of reloading its
+dashboard to find out about new messages. The request wakes up as soon as
+a message to its user is committed in this process: ``messaging`` calls
+``notify_on_commit`` and the session's after_commit hook publishes to the
+in-process hub. Messages committed by other processes are picked up by
+re-checking the database every NOTIFY_CHECK_INTERVAL seconds.
+
+No database connection is held while a request waits, but a worker thread
+is. At most NOTIFY_MAX_WAITERS requests per process wait at once, so open
+tabs cannot take every thread. Beyond that, streams are refused with a 503
+and long-polls answer immediately, both with a Retry-After that tells the
+browser to fall back to short polls.
+"""
+import json
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
+
+import messaging
+from app import db
+from models import Message
+
+
+class NotificationHub:
+    """Per-user publish counters that waiting requests block on"""
+
+    def __init__(self):
+        self._versions = {}
+        self._condition = threading.Condition()
+        self.closed = False
+
+    def version(self, user_id):
+        with self._condition:
+            return self._versions.get(user_id, 0)
+
+    def publish(self, user_ids):
+        with self._condition:
+            for user_id in user_ids:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._condition.notify_all()
+
+    def close(self):
+        """Wake every waiting request for good, so a worker shutting down is not held by open streams"""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def wait(self, user_id, version, timeout):
+        """Block until ``user_id`` is published past ``version``; False on timeout or close"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._versions.get(user_id, 0) == version and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return self._versions.get(user_id, 0) != version
+
+
+hub = NotificationHub()
+
+
+def init_app(app):
+    """Read the timing settings and publish to waiting requests after each commit"""
+    app.config.setdefault('NOTIFY_TIMEOUT', 25)
+    app.config.setdefault('NOTIFY_CHECK_INTERVAL', 5)
+    app.config.setdefault('NOTIFY_STREAM_LIFETIME', 300)
+    app.config.setdefault('NOTIFY_MAX_WAITERS', 2)
+    app.config.setdefault('NOTIFY_RETRY_AFTER', 15)
+    app.extensions['notification_slots'] = threading.BoundedSemaphore(app.config['NOTIFY_MAX_WAITERS'])
+    if not event.contains(Session, 'after_commit', _publish):
+        event.listen(Session, 'after_commit', _publish)
+        event.listen(Session, 'after_rollback', _discard)
+
+
+def reserve():
+    """Claim a waiting slot without blocking; returns its release function, or None when all are taken"""
+    slots = current_app.extensions['notification_slots']
+    return slots.release if slots.acquire(blocking=False) else None
+
+
+def notify_on_commit(user_id):
+    """Wake ``user_id``'s waiting requests once the current transaction commits"""
+    db.session.info.setdefault('notify_users', set()).add(user_id)
+
+
+def _publish(session):
+    user_ids = session.info.pop('notify_users', None)
+    if user_ids:
+        hub.publish(user_ids)
+
+
+def _discard(session):
+    session.info.pop('notify_users', None)
+
+
+def check(user_id, since=None, limit=5):
+    """Unread total and headers of the messages received after message id ``since``
+
+    Without ``since`` only the id of the latest received message is looked
+    up, so a client starts from "now" instead of being sent its history.
+    """
+    query = Message.query.filter(Message.recipient_id == user_id)
+    if since is None:
+        latest = query.order_by(Message.id.desc()).with_entities(Message.id).first()
+        received = []
+        last_id = latest[0] if latest else 0
+    else:
+        received = (query.options(joinedload(Message.sender))
+                    .filter(Message.id > since)
+                    .order_by(Message.id.desc()).limit(limit).all())
+        last_id = received[0].id if received else since
+    return {
+        'last_id': last_id,
+        'unread_total': messaging.unread_total(user_id),
+        'messages': [{
+            'id': message.id,
+            'sender': message.sender.username,
+            'subject': message.subject,
+            'conversation_id': message.conversation_id,
+            'created_at': message.created_at.isoformat(),
+        } for message in received],
+    }
+
+
+def _changes(user_id, since, unread, timeout):
+    """Yield the state each time it differs from what the client has, until ``timeout``"""
+    interval = current_app.config['NOTIFY_CHECK_INTERVAL']
+    deadline = time.monotonic() + timeout
+    while True:
+        version = hub.version(user_id)
+        state = check(user_id, since)
+        # Return the connection to the pool before waiting
+        db.session.remove()
+        if since is None or state['messages'] or state['unread_total'] != unread:
+            yield state
+            since, unread = state['last_id'], state['unread_total']
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or hub.closed:
+            return
+        hub.wait(user_id, version, min(interval, remaining))
+
+
+def wait(user_id, since=None, unread=None, timeout=None):
+    """Long-poll: the first change after ``since``/``unread``, or the current state at the timeout"""
+    limit = current_app.config['NOTIFY_TIMEOUT']
+    timeout = limit if timeout is None else max(0, min(timeout, limit))
+    for state in _changes(user_id, since, unread, timeout):
+        return state
+    state = check(user_id, since)
+    db.session.remove()
+    return state
+
+
+def stream(user_id, since=None):
+    """Server-Sent Events: a ``messages`` event per change, keepalive comments in between
+
+    The stream ends after NOTIFY_STREAM_LIFETIME seconds, or when the hub
+    is closed at shutdown; EventSource reconnects and resumes from the ``id``
+    of the last event it received.
+    """
+    timeout = current_app.config['NOTIFY_TIMEOUT']
+    lifetime = current_app.config['NOTIFY_STREAM_LIFETIME']
+    yield "retry: 3000\n\n"
+    deadline = time.monotonic() + lifetime
+    unread = None
+    while time.monotonic() < deadline and not hub.closed:
+        for state in _changes(user_id, since, unread, min(timeout, deadline - time.monotonic())):
+            since, unread = state['last_id'], state['unread_total']
+            yield f"id: {since}\nevent: messages\ndata: {json.dumps(state)}\n\n"
+            break
+        else:
+            # Keeps proxies from closing an idle connection
+            yield ": keepalive\n\n"
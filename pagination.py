@@ -0,0 +1,47 @@
+"""Keyset (seek) pagination.
+
+Pages are fetched with ``WHERE (sort columns) < (last row's values)`` instead
+of OFFSET, so every page is one bounded index range scan and memory per
+request is bounded by the page size, however large the result set is.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+def encode_cursor(values):
+    """Opaque, URL-safe cursor for the sort values of the last row of a page"""
+    payload = [{'dt': v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Sort values from a cursor, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return [datetime.fromisoformat(v['dt']) if isinstance(v, dict) else v for v in payload]
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        return None
+
+
+def keyset_page(query, columns, cursor=None, limit=20):
+    """Fetch one page of ``query`` ordered descending by ``columns``.
+
+    The last column must be unique (usually the primary key) so the order is
+    total. The query must select the sort columns as its trailing entities.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    values = decode_cursor(cursor)
+    if values is not None and len(values) == len(columns):
+        query = query.filter(tuple_(*columns) < tuple_(*values))
+
+    rows = query.order_by(*(column.desc() for column in columns)).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(list(rows[-1])[-len(columns):])
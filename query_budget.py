@@ -0,0 +1,76 @@
+"""Per-view SQL query budgets.
+
+Every statement sent to the database inside an app context is counted. A
+view decorated with ``@query_budget(n)`` that issues more than ``n``
+statements (including lazy loads while its template renders) raises
+QueryBudgetExceeded when QUERY_BUDGET_ENFORCE is on, which defaults to
+on in testing (read per request, so setting TESTING after the app is built
+still counts), and logs a warning otherwise. An N+1 regression therefore
+fails the test suite instead of slowly showing up in production.
+
+Statements run inside ``unbudgeted()`` (one-off maintenance such as the
+matcher's score backfill, whose size grows with the catalog) are left out.
+"""
+import logging
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+
+def init_app(app, engine):
+    """Start counting the statements executed on ``engine``"""
+    if not event.contains(engine, 'before_cursor_execute', _count_query):
+        event.listen(engine, 'before_cursor_execute', _count_query)
+
+
+def query_count():
+    """Statements executed so far in the current app context"""
+    return g.get('query_count', 0)
+
+
+def _unbudgeted_count():
+    return g.get('unbudgeted_count', 0) if has_app_context() else 0
+
+
+@contextmanager
+def unbudgeted():
+    """Leave the statements executed inside out of the current view's budget"""
+    if not has_app_context():
+        yield
+        return
+    start = query_count()
+    try:
+        yield
+    finally:
+        g.unbudgeted_count = _unbudgeted_count() + query_count() - start
+
+
+def query_budget(max_queries):
+    """Declare how many SQL statements a view may execute"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            start, exempt = query_count(), _unbudgeted_count()
+            response = view(*args, **kwargs)
+            used = query_count() - start - (_unbudgeted_count() - exempt)
+            if used > max_queries:
+                message = f"{request.endpoint} executed {used} queries, budget is {max_queries}"
+                if current_app.config.get('QUERY_BUDGET_ENFORCE', current_app.testing):
+                    raise QueryBudgetExceeded(message)
+                logging.warning(message)
+            return response
+
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
@@ -0,0 +1,172 @@
+"""Full rescoring of every event x sponsor pair on all cores.
+
+Used after changing the matching weights or INDUSTRY_KEYWORDS. The corpus
+index is refitted, the features of every entity are written once as .npy
+files, and shards of event rows are scored by a process pool whose workers
+memory-map those files read-only instead of receiving pickled ORM objects.
+Each shard replaces its rows with one bulk insert and is checkpointed, so an
+interrupted run resumes where it stopped.
+
+In candidate mode the run stores the same pairs as ``rescore_all``: each
+sponsor's candidate events, chosen once up front and saved next to the
+features.
+"""
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import scipy.sparse as sp
+from sqlalchemy import insert
+
+# The app first, so this module can be imported on its own without a circular import
+from app import app, db
+from ai_matcher import COMPONENTS, ai_matcher
+from matcher_engine import MatchFeatures
+from models import Event, SponsorProfile, MatchScore
+
+CHECKPOINT = 'checkpoint.json'
+# Event x sponsor pairs to store in candidate mode
+CANDIDATES = 'candidates.npz'
+COLUMNS = {
+    'total': 'score',
+    'text': 'text_score',
+    'audience': 'audience_score',
+    'location': 'location_score',
+    'industry': 'industry_score',
+    'footfall': 'footfall_score',
+}
+
+# Features memory-mapped, and candidate pairs loaded, once per pool process
+_features = None
+_candidates = None
+
+
+def _init_worker(workdir):
+    global _features, _candidates
+    with app.app_context():
+        # Connections inherited through fork must not be shared with the parent
+        db.engine.dispose(close=False)
+    _features = MatchFeatures.load(os.path.join(workdir, 'features'))
+    path = os.path.join(workdir, CANDIDATES)
+    _candidates = sp.load_npz(path).tocsr() if os.path.exists(path) else None
+
+
+def candidate_pairs(events, sponsors, budget):
+    """Boolean events x sponsors matrix of each sponsor's candidate events, as rescore_all stores them"""
+    rows = {event.id: i for i, event in enumerate(events)}
+    event_rows, columns = [], []
+    for j, sponsor in enumerate(sponsors):
+        for event_id in ai_matcher.candidate_events(sponsor, budget):
+            event_rows.append(rows[event_id])
+            columns.append(j)
+    return sp.csr_matrix((np.ones(len(columns), dtype=bool), (event_rows, columns)),
+                         shape=(len(events), len(sponsors)))
+
+
+def score_rows(features, start, components, candidates=None):
+    """MatchScore rows for a block of scored event rows; only the ``candidates`` pairs when given"""
+    count, sponsors = components['total'].shape
+    if candidates is not None:
+        block = candidates[start:start + count].tocoo()
+        event_rows, columns = block.row, block.col
+    else:
+        event_rows = np.repeat(np.arange(count), sponsors)
+        columns = np.tile(np.arange(sponsors), count)
+
+    values = [components[name][event_rows, columns].tolist() for name in COMPONENTS]
+    keys = [COLUMNS[name] for name in COMPONENTS]
+    event_ids = features.event_ids[start + event_rows].tolist()
+    sponsor_ids = features.sponsor_ids[columns].tolist()
+    now = datetime.utcnow()
+    return [
+        dict(zip(keys, scores), event_id=event_id, sponsor_id=sponsor_id, updated_at=now)
+        for event_id, sponsor_id, *scores in zip(event_ids, sponsor_ids, *values)
+    ]
+
+
+def score_shard(shard, start, stop):
+    """Runs in a pool process: score event rows [start, stop) and replace their stored rows"""
+    rows = score_rows(_features, start, _features.score(start, stop), _candidates)
+    with app.app_context():
+        event_ids = _features.event_ids[start:stop].tolist()
+        MatchScore.query.filter(MatchScore.event_id.in_(event_ids)).delete(synchronize_session=False)
+        if rows:
+            db.session.execute(insert(MatchScore), rows)
+        db.session.commit()
+    return shard, len(rows)
+
+
+def _save_checkpoint(path, checkpoint):
+    # Write-then-rename so a crash never leaves a torn checkpoint
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
+
+
+def prepare(workdir, shard_size, top):
+    """Refit the index, save every entity's features and start a checkpoint"""
+    events = Event.query.order_by(Event.id).all()
+    sponsors = SponsorProfile.query.order_by(SponsorProfile.id).all()
+    if events and sponsors:
+        ai_matcher.index.fit(events, sponsors)
+    MatchFeatures.build(ai_matcher.index, events, sponsors).save(os.path.join(workdir, 'features'))
+    budget = top or ai_matcher.candidate_budget
+    path = os.path.join(workdir, CANDIDATES)
+    if budget:
+        ai_matcher.candidates.build(events, sponsors)
+        sp.save_npz(path, candidate_pairs(events, sponsors, budget))
+    elif os.path.exists(path):
+        os.remove(path)
+    return {
+        'created_at': datetime.utcnow().isoformat(),
+        'events': len(events),
+        'sponsors': len(sponsors),
+        'shard_size': shard_size,
+        # Candidate events stored per sponsor, None for every pair
+        'budget': budget,
+        'done': [],
+    }
+
+
+def run(workdir, processes=None, shard_size=200, top=None, resume=False, echo=print):
+    """Rescore everything, resuming from ``workdir``'s checkpoint when asked to"""
+    if top and not ai_matcher.candidate_budget:
+        raise ValueError("top needs candidate mode: ensure_scores rebuilds a partial table otherwise")
+    os.makedirs(workdir, exist_ok=True)
+    path = os.path.join(workdir, CHECKPOINT)
+    if resume and os.path.exists(path):
+        with open(path) as f:
+            checkpoint = json.load(f)
+        echo(f"Resuming: {len(checkpoint['done'])} shards already done")
+    else:
+        checkpoint = prepare(workdir, shard_size, top)
+        _save_checkpoint(path, checkpoint)
+
+    size = checkpoint['shard_size']
+    shards = math.ceil(checkpoint['events'] / size)
+    done = set(checkpoint['done'])
+    pending = [shard for shard in range(shards) if shard not in done]
+    echo(f"{checkpoint['events']} events x {checkpoint['sponsors']} sponsors: "
+         f"{len(pending)} of {shards} shards to score")
+
+    started = time.perf_counter()
+    pairs = 0
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(workdir,)) as pool:
+        futures = [pool.submit(score_shard, shard, shard * size, min((shard + 1) * size, checkpoint['events']))
+                   for shard in pending]
+        for future in as_completed(futures):
+            shard, written = future.result()
+            checkpoint['done'].append(shard)
+            _save_checkpoint(path, checkpoint)
+            pairs += written
+            elapsed = time.perf_counter() - started
+            echo(f"shard {shard} done ({len(checkpoint['done'])}/{shards}), "
+                 f"{pairs / elapsed:,.0f} pairs/s")
+
+    elapsed = time.perf_counter() - started
+    echo(f"Stored {pairs:,} scores in {elapsed:.1f}s")
+    return pairs
@@ -0,0 +1,150 @@
+"""Read replica routing with bounded staleness.
+
+With DATABASE_REPLICA_URL set, SELECTs issued inside ``replica_reads()``
+(or by views decorated with ``@read_replica``) run on the replica engine:
+read-only pages, matcher feature loads and bulk exports. Everything else
+stays on the primary:
+
+- flushes and INSERT/UPDATE/DELETE, and every read of a transaction that
+  has already written, so a request sees its own uncommitted rows;
+- all reads of a browser session for REPLICA_STALENESS seconds after one
+  of its requests committed a write (creating an event, sending a message,
+  expressing interest...), so users read their own writes;
+- all reads while the replica's measured lag exceeds REPLICA_STALENESS,
+  or while the replica cannot be reached.
+
+Lag is measured on PostgreSQL standbys at most every
+REPLICA_LAG_CHECK_INTERVAL seconds. Other backends, such as two SQLite
+files used to try the routing locally, are taken to be current. Without a
+replica everything runs on the primary.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, session as browser_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+
+REPLICA = 'replica'
+
+# Seconds the standby is behind: 0 once it has replayed everything it received, NULL on a primary
+_LAG_QUERIES = {
+    'postgresql': "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                  "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END",
+}
+
+
+def measure_lag(engine):
+    """Seconds ``engine`` trails its primary; infinite when it cannot be reached"""
+    query = _LAG_QUERIES.get(engine.dialect.name)
+    if query is None:
+        return 0.0
+    try:
+        with engine.connect() as conn:
+            lag = conn.execute(text(query)).scalar()
+    except SQLAlchemyError as e:
+        logging.warning(f"Read replica unavailable, reading from the primary: {e}")
+        return float('inf')
+    return float(lag or 0)
+
+
+class LagProbe:
+    """The replica's lag, measured at most once per ``interval`` seconds by one thread"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lag = 0.0
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def current(self, engine):
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.interval:
+            return self.lag
+        # Other threads keep the last value instead of queueing behind the check
+        if self._lock.acquire(blocking=False):
+            try:
+                self._checked = now
+                self.lag = measure_lag(engine)
+            finally:
+                self._lock.release()
+        return self.lag
+
+
+class RoutingSession(Session):
+    """Session sending the reads of ``replica_reads()`` blocks to the replica when it is fresh enough"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                self.info['replica_wrote'] = True
+            elif self._use_replica():
+                if has_request_context():
+                    # The page may trail recent commits; response_cache checks this
+                    g.replica_used = True
+                return self._db.engines[REPLICA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self):
+        if not self.info.get('replica_reads') or self.info.get('replica_wrote'):
+            return False
+        engine = self._db.engines.get(REPLICA)
+        if engine is None:
+            return False
+        if primary_until() > time.time():
+            return False
+        return current_app.extensions['replica'].current(engine) <= current_app.config['REPLICA_STALENESS']
+
+
+def primary_until():
+    """Wall-clock time until which the current browser session reads from the primary"""
+    if has_request_context():
+        return browser_session.get('primary_until', 0)
+    return 0
+
+
+def init_app(app):
+    """Read the staleness settings and pin writers to the primary after each commit"""
+    app.config.setdefault('REPLICA_STALENESS', 5)
+    app.config.setdefault('REPLICA_LAG_CHECK_INTERVAL', 1)
+    app.extensions['replica'] = LagProbe(app.config['REPLICA_LAG_CHECK_INTERVAL'])
+    if REPLICA in app.config.get('SQLALCHEMY_BINDS', {}) and not event.contains(RoutingSession, 'after_commit', _pin_writer):
+        event.listen(RoutingSession, 'after_commit', _pin_writer)
+        event.listen(RoutingSession, 'after_rollback', _discard)
+
+
+def _pin_writer(session):
+    if session.info.pop('replica_wrote', False) and has_request_context():
+        browser_session['primary_until'] = time.time() + current_app.config['REPLICA_STALENESS']
+
+
+def _discard(session):
+    session.info.pop('replica_wrote', None)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Send the block's reads to the replica, or with ``enabled=False`` keep them on the primary"""
+    if not has_app_context():
+        yield
+        return
+    info = current_app.extensions['sqlalchemy'].session.info
+    previous = info.get('replica_reads', False)
+    info['replica_reads'] = enabled
+    try:
+        yield
+    finally:
+        info['replica_reads'] = previous
+
+
+def read_replica(view):
+    """Run a read-only view's queries on the replica"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,296 @@
+"""Caching of rendered pages for read-mostly views.
+
+``@cached(tags=...)`` stores a view's 200 responses keyed by URL and
+viewer and answers repeat requests from the stored body, or with a 304
+when the browser's ETag/Last-Modified still match. Pages show the
+username in the navbar and user-type specific content, so logged-in
+viewers get their own variant while anonymous visitors share one.
+
+Every entry is keyed by the current generation of the tags it depends on,
+plus any ``vary`` values the view reads itself.
+Committing a change to a registered model bumps its tags
+(``invalidate_on_commit``), so stale entries are never read again and age
+out of the backend. A page read from the replica is not stored while one of
+its tags is younger than REPLICA_STALENESS, because the replica may not
+have the change yet.
+
+RESPONSE_CACHE selects the backend: 'filesystem' (the default, shared by
+every process on the host, under RESPONSE_CACHE_DIR), 'memory' (per-process
+LRU with TTL; tag bumps reach only the committing process, so it suits a
+single worker) or 'none'.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Model class -> function returning the tags a changed instance invalidates
+_tag_sources = {}
+_backend = None
+
+
+class MemoryCache:
+    """Thread-safe in-process LRU whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Tag generations are never evicted, or an old entry could become current again
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generations(self, tags):
+        with self._lock:
+            return [self._tags.get(tag, '0') for tag in tags]
+
+    def bump(self, tag):
+        with self._lock:
+            self._tags[tag] = _generation()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+
+class FileSystemCache:
+    """Entries and tag generations as files, shared by all processes on the host"""
+
+    PRUNE_EVERY = 200
+
+    def __init__(self, directory, ttl=300):
+        self.directory = directory
+        self.ttl = ttl
+        self._sets = 0
+        os.makedirs(os.path.join(directory, 'entries'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'tags'), exist_ok=True)
+
+    def _path(self, kind, name):
+        return os.path.join(self.directory, kind, hashlib.sha1(name.encode()).hexdigest())
+
+    def _write(self, path, data):
+        # Write-then-rename so readers never see a partial file
+        fd, scratch = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(scratch, path)
+
+    def get(self, key):
+        try:
+            with open(self._path('entries', key), 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires < time.time():
+            return None
+        return value
+
+    def set(self, key, value):
+        self._write(self._path('entries', key), pickle.dumps((time.time() + self.ttl, value)))
+        self._sets += 1
+        if self._sets % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """Delete expired entries"""
+        directory = os.path.join(self.directory, 'entries')
+        now = time.time()
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) + self.ttl < now:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def generations(self, tags):
+        values = []
+        for tag in tags:
+            try:
+                with open(self._path('tags', tag)) as f:
+                    values.append(f.read())
+            except OSError:
+                values.append('0')
+        return values
+
+    def bump(self, tag):
+        self._write(self._path('tags', tag), _generation().encode())
+
+    def clear(self):
+        for kind in ('entries', 'tags'):
+            directory = os.path.join(self.directory, kind)
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+
+
+def _generation():
+    """A new tag generation: bump time, then random bits so bumps in the same instant differ"""
+    return f'{time.time():.3f}-{os.urandom(4).hex()}'
+
+
+def _bumped_at(generation):
+    try:
+        return float(generation.split('-')[0])
+    except ValueError:
+        # Never bumped ('0'), or written before generations carried a time
+        return 0.0
+
+
+def _settled(generations, seconds):
+    """Whether every tag was last bumped more than ``seconds`` ago"""
+    cutoff = time.time() - seconds
+    return all(_bumped_at(generation) < cutoff for generation in generations)
+
+
+def init_app(app):
+    """Create the backend selected by RESPONSE_CACHE and start tracking commits"""
+    global _backend
+    app.config.setdefault('RESPONSE_CACHE', 'filesystem')
+    app.config.setdefault('RESPONSE_CACHE_TTL', 300)
+    app.config.setdefault('RESPONSE_CACHE_SIZE', 1024)
+    app.config.setdefault('RESPONSE_CACHE_DIR', os.path.join(app.instance_path, 'response_cache'))
+
+    kind = app.config['RESPONSE_CACHE']
+    if kind == 'memory':
+        _backend = MemoryCache(app.config['RESPONSE_CACHE_SIZE'], app.config['RESPONSE_CACHE_TTL'])
+    elif kind == 'filesystem':
+        _backend = FileSystemCache(app.config['RESPONSE_CACHE_DIR'], app.config['RESPONSE_CACHE_TTL'])
+    elif kind == 'none':
+        _backend = None
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE backend {kind!r}")
+    app.extensions['response_cache'] = _backend
+
+    if not event.contains(Session, 'after_flush', _collect_tags):
+        event.listen(Session, 'after_flush', _collect_tags)
+        event.listen(Session, 'after_commit', _bump_tags)
+        event.listen(Session, 'after_rollback', _discard_tags)
+
+
+def invalidate_on_commit(model, tags):
+    """Bump ``tags(instance)`` whenever a changed ``model`` row is committed"""
+    _tag_sources[model] = tags
+
+
+def invalidate(*tags):
+    """Bump tags by hand, e.g. after a bulk update that bypasses the ORM"""
+    if _backend is not None:
+        for tag in tags:
+            _backend.bump(tag)
+
+
+def _collect_tags(session, flush_context):
+    # Ids of new rows are only known after the flush
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        source = _tag_sources.get(type(obj))
+        if source is not None:
+            session.info.setdefault('response_cache_tags', set()).update(source(obj))
+
+
+def _bump_tags(session):
+    tags = session.info.pop('response_cache_tags', None)
+    if tags:
+        invalidate(*tags)
+
+
+def _discard_tags(session):
+    session.info.pop('response_cache_tags', None)
+
+
+def _viewer():
+    if current_user.is_authenticated:
+        return f'{current_user.user_type}:{current_user.id}', [f'user:{current_user.id}']
+    return 'anonymous', []
+
+
+def _respond(entry, hit, anonymous):
+    response = current_app.response_class(entry['body'], mimetype=entry['mimetype'])
+    response.set_etag(entry['etag'])
+    response.last_modified = entry['last_modified']
+    # Browsers must revalidate, which costs them a 304 at most
+    response.cache_control.no_cache = True
+    if anonymous:
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    response.vary.add('Cookie')
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response.make_conditional(request)
+
+
+def cached(tags=None, vary=None):
+    """Cache a GET view's page; ``tags(**view_args)`` names what it depends on.
+
+    ``vary(**view_args)`` returns extra key parts read on every request, for
+    content whose writers bump no tag here (bulk writes by the worker or the
+    rematch CLI, possibly on another host).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            backend = _backend
+            # Pending flash messages would be rendered into (and consumed by) the page
+            if backend is None or request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            variant, viewer_tags = _viewer()
+            names = [*(tags(**kwargs) if tags else ()), *viewer_tags]
+            generations = backend.generations(names)
+            key = '|'.join([request.full_path, variant, *(f'{n}={g}' for n, g in zip(names, generations)),
+                            *(vary(**kwargs) if vary else ())])
+
+            entry = backend.get(key)
+            if entry is not None:
+                return _respond(entry, True, not viewer_tags)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough or session.modified:
+                return response
+            if g.get('replica_used') and not _settled(generations, current_app.config.get('REPLICA_STALENESS', 0)):
+                return response
+            body = response.get_data()
+            entry = {
+                'body': body,
+                'mimetype': response.mimetype,
+                'etag': hashlib.md5(body).hexdigest(),
+                'last_modified': datetime.now(timezone.utc).replace(microsecond=0),
+            }
+            try:
+                backend.set(key, entry)
+            except OSError as e:
+                logging.warning(f"Could not store cached response: {e}")
+            return _respond(entry, False, not viewer_tags)
+
+        return wrapper
+    return decorator
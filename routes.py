@@ -1,10 +1,21 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context, abort
 from flask_login import login_user, logout_user, login_required, current_user
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.exc import StaleDataError
 from app import app, db
-from models import User, ClubProfile, SponsorProfile, Event, Message, SponsorInterest
+from models import User, ClubProfile, SponsorProfile, Event, Message, SponsorInterest, MatchScore, Conversation, ConversationParticipant
 from forms import LoginForm, RegistrationForm, ClubProfileForm, SponsorProfileForm, EventForm, MessageForm, SearchForm
 from ai_matcher import ai_matcher
+from search import get_backend as get_search_backend
+from match_jobs import schedule_rescore
+import messaging
+import notifications
+from pagination import keyset_page
+from query_budget import query_budget
+from response_cache import cached
+from replica import read_replica, replica_reads
 from datetime import datetime
+import json
 
 @app.route('/')
 def index():
@@ -85,7 +96,9 @@ def dashboard():
         return redirect(url_for('sponsor_dashboard'))
 
 @app.route('/club/dashboard')
+@query_budget(12)
 @login_required
+@read_replica
 def club_dashboard():
     """Club dashboard"""
     if current_user.user_type != 'club':
@@ -111,7 +124,9 @@ def club_dashboard():
         })
     
     # Get recent messages
-    messages = Message.query.filter_by(recipient_id=current_user.id).order_by(Message.created_at.desc()).limit(5).all()
+    messages = (Message.query.options(selectinload(Message.sender))
+                .filter_by(recipient_id=current_user.id)
+                .order_by(Message.created_at.desc()).limit(5).all())
     
     return render_template('club_dashboard.html', 
                          club_profile=club_profile, 
@@ -120,7 +135,9 @@ def club_dashboard():
                          messages=messages)
 
 @app.route('/sponsor/dashboard')
+@query_budget(12)
 @login_required
+@read_replica
 def sponsor_dashboard():
     """Sponsor dashboard"""
     if current_user.user_type != 'sponsor':
@@ -134,13 +151,19 @@ def sponsor_dashboard():
         return redirect(url_for('create_sponsor_profile'))
     
     # Get AI recommendations
-    recommendations = ai_matcher.get_event_recommendations(sponsor_profile, limit=5)
+    recommendations = ai_matcher.get_event_recommendations(sponsor_profile, limit=5,
+                                                           options=[selectinload(Event.club)])
     
     # Get sponsor interests
-    interests = SponsorInterest.query.filter_by(sponsor_id=sponsor_profile.id).order_by(SponsorInterest.created_at.desc()).limit(5).all()
+    interests = (SponsorInterest.query
+                 .options(selectinload(SponsorInterest.event).selectinload(Event.club).selectinload(ClubProfile.user))
+                 .filter_by(sponsor_id=sponsor_profile.id)
+                 .order_by(SponsorInterest.created_at.desc()).limit(5).all())
     
     # Get recent messages
-    messages = Message.query.filter_by(recipient_id=current_user.id).order_by(Message.created_at.desc()).limit(5).all()
+    messages = (Message.query.options(selectinload(Message.sender))
+                .filter_by(recipient_id=current_user.id)
+                .order_by(Message.created_at.desc()).limit(5).all())
     
     return render_template('sponsor_dashboard.html', 
                          sponsor_profile=sponsor_profile, 
@@ -148,6 +171,9 @@ def sponsor_dashboard():
                          interests=interests,
                          messages=messages)
 
+# Shown when a profile changed between loading the form's row and saving it
+STALE_PROFILE = 'Your profile was changed by someone else while you were editing. Reload it and make your changes again.'
+
 @app.route('/club/profile', methods=['GET', 'POST'])
 @login_required
 def create_club_profile():
@@ -181,7 +207,12 @@ def create_club_profile():
             )
             db.session.add(club_profile)
         
-        db.session.commit()
+        try:
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            flash(STALE_PROFILE, 'warning')
+            return redirect(url_for('create_club_profile'))
         flash('Club profile saved successfully!', 'success')
         return redirect(url_for('club_dashboard'))
     
@@ -235,7 +266,13 @@ def create_sponsor_profile():
             )
             db.session.add(sponsor_profile)
         
-        db.session.commit()
+        try:
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            flash(STALE_PROFILE, 'warning')
+            return redirect(url_for('create_sponsor_profile'))
+        schedule_rescore('sponsor', sponsor_profile)
         flash('Sponsor profile saved successfully!', 'success')
         return redirect(url_for('sponsor_dashboard'))
     
@@ -286,95 +323,349 @@ def create_event():
         
         db.session.add(event)
         db.session.commit()
+        schedule_rescore('event', event)
         flash('Event created successfully!', 'success')
         return redirect(url_for('club_dashboard'))
     
     return render_template('create_event.html', form=form, title='Create Event')
 
+def _stored_score_version(event_id):
+    """Key part for the viewing sponsor's stored score, which bulk rescoring rewrites without bumping tags"""
+    sponsor = current_user.sponsor_profile if current_user.user_type == 'sponsor' else None
+    if sponsor is None:
+        return []
+    stored = db.session.query(MatchScore.score, MatchScore.updated_at).filter_by(
+        event_id=event_id, sponsor_id=sponsor.id).first()
+    return [f'score={stored.score!r}@{stored.updated_at}' if stored else 'score=none']
+
 @app.route('/event/<int:event_id>')
+@query_budget(7)
 @login_required
+@cached(tags=lambda event_id: ['events', f'event:{event_id}'], vary=_stored_score_version)
+@read_replica
 def event_details(event_id):
     """View event details"""
-    event = Event.query.get_or_404(event_id)
+    event = Event.query.options(joinedload(Event.club).joinedload(ClubProfile.user)).get_or_404(event_id)
     
     # Get AI recommendations if current user is a sponsor
     recommendations = []
-    if current_user.user_type == 'sponsor' and current_user.sponsor_profile:
-        score = ai_matcher.calculate_match_score(event, current_user.sponsor_profile)
-        explanations = ai_matcher.get_match_explanation(event, current_user.sponsor_profile)
+    sponsor = current_user.sponsor_profile if current_user.user_type == 'sponsor' else None
+    if sponsor:
+        # The stored score, so this page agrees with the dashboard ranking
+        breakdown = ai_matcher.stored_breakdown(event, sponsor)
         recommendations = {
-            'score': score,
-            'percentage': int(score * 100),
-            'explanations': explanations
+            'score': breakdown.total,
+            'percentage': int(breakdown.total * 100),
+            'explanations': breakdown.explain(sponsor.industry)
         }
     
     return render_template('event_details.html', event=event, recommendations=recommendations)
 
 @app.route('/sponsor/<int:sponsor_id>')
+@query_budget(3)
 @login_required
+@cached(tags=lambda sponsor_id: [f'sponsor:{sponsor_id}'])
 def sponsor_details(sponsor_id):
     """View sponsor details"""
-    sponsor = SponsorProfile.query.get_or_404(sponsor_id)
+    sponsor = SponsorProfile.query.options(joinedload(SponsorProfile.user)).get_or_404(sponsor_id)
     return render_template('sponsor_details.html', sponsor=sponsor)
 
-@app.route('/search/events', methods=['GET', 'POST'])
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+def _search_form():
+    """Search form bound to the query string so result pages can be linked"""
+    return SearchForm(request.args, meta={'csrf': False})
+
+def _search_query(form, sponsor_id):
+    """Filtered event query plus its descending sort columns.
+
+    Sponsors with a profile get events ordered by their stored match score,
+    keyword searches by relevance, everything else newest first. Event.id
+    is always the tie-breaker so the order is total for keyset paging.
+    """
+    query = db.session.query(Event).options(selectinload(Event.club).selectinload(ClubProfile.user))
+    if form.location.data:
+        query = query.filter(Event.location.ilike(f"%{form.location.data}%"))
+    if form.theme.data:
+        query = query.filter(Event.theme.ilike(f"%{form.theme.data}%"))
+    if form.min_footfall.data:
+        query = query.filter(Event.expected_footfall >= form.min_footfall.data)
+    
+    rank = None
+    if form.keyword.data:
+        query, rank = get_search_backend().apply(query, form.keyword.data)
+    
+    if sponsor_id:
+        ai_matcher.ensure_scores()
+        score = db.func.coalesce(MatchScore.score, 0.0)
+        query = query.outerjoin(
+            MatchScore,
+            (MatchScore.event_id == Event.id) & (MatchScore.sponsor_id == sponsor_id)
+        )
+        columns = [score, Event.id]
+    elif rank is not None:
+        columns = [rank, Event.id]
+    else:
+        columns = [Event.created_at, Event.id]
+    
+    return query.add_columns(*columns), columns
+
+def _search_page(form, sponsor_id, cursor, limit):
+    """One page of search results and the cursor of the next page"""
+    query, columns = _search_query(form, sponsor_id)
+    rows, next_cursor = keyset_page(query, columns, cursor, limit)
+    
+    if sponsor_id:
+        events = [{
+            'event': row[0],
+            'score': row[1],
+            'percentage': int(row[1] * 100)
+        } for row in rows]
+    else:
+        events = [row[0] for row in rows]
+    return events, next_cursor
+
+def _event_json(event, score=None):
+    data = {
+        'id': event.id,
+        'name': event.name,
+        'theme': event.theme,
+        'location': event.location,
+        'event_date': event.event_date.isoformat() if event.event_date else None,
+        'expected_footfall': event.expected_footfall,
+        'target_audience': event.target_audience,
+        'tags': event.tags,
+        'url': url_for('event_details', event_id=event.id),
+    }
+    if score is not None:
+        data['score'] = score
+        data['percentage'] = int(score * 100)
+    return data
+
+def _page_json(events):
+    return [_event_json(e['event'], e['score']) if isinstance(e, dict) else _event_json(e) for e in events]
+
+def _sponsor_id():
+    """Id of the current sponsor's profile, None if it is not set up yet"""
+    return current_user.sponsor_profile.id if current_user.sponsor_profile else None
+
+def _page_size():
+    limit = request.args.get('limit', SEARCH_PAGE_SIZE, type=int)
+    return max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+
+@app.route('/search/events', methods=['GET'])
+@query_budget(10)
 @login_required
+@read_replica
 def search_events():
     """Search events (for sponsors)"""
     if current_user.user_type != 'sponsor':
         flash('Access denied. Sponsors only.', 'error')
         return redirect(url_for('index'))
     
-    form = SearchForm()
+    form = _search_form()
     events = []
+    next_url = None
+    searched = 'submit' in request.args or 'cursor' in request.args
+    
+    if searched and form.validate():
+        events, next_cursor = _search_page(form, _sponsor_id(), request.args.get('cursor'), SEARCH_PAGE_SIZE)
+        if next_cursor:
+            args = request.args.to_dict()
+            args['cursor'] = next_cursor
+            next_url = url_for('search_events', **args)
+    
+    return render_template('search_events.html', form=form, events=events,
+                           searched=searched, next_url=next_url)
+
+@app.route('/api/search/events')
+@login_required
+@read_replica
+def search_events_json():
+    """One page of event search results as JSON"""
+    if current_user.user_type != 'sponsor':
+        return jsonify({'error': 'Sponsors only'}), 403
     
-    if form.validate_on_submit():
-        query = Event.query
-        
-        if form.keyword.data:
-            keyword = f"%{form.keyword.data}%"
-            query = query.filter(
-                Event.name.ilike(keyword) |
-                Event.description.ilike(keyword) |
-                Event.theme.ilike(keyword) |
-                Event.tags.ilike(keyword)
-            )
-        
-        if form.location.data:
-            location = f"%{form.location.data}%"
-            query = query.filter(Event.location.ilike(location))
-        
-        if form.theme.data:
-            theme = f"%{form.theme.data}%"
-            query = query.filter(Event.theme.ilike(theme))
-        
-        if form.min_footfall.data:
-            query = query.filter(Event.expected_footfall >= form.min_footfall.data)
-        
-        events = query.order_by(Event.created_at.desc()).all()
-        
-        # Add match scores if sponsor has profile
-        if current_user.sponsor_profile:
-            events_with_scores = []
+    form = _search_form()
+    if not form.validate():
+        return jsonify({'errors': form.errors}), 400
+    
+    events, next_cursor = _search_page(form, _sponsor_id(), request.args.get('cursor'), _page_size())
+    return jsonify({'events': _page_json(events), 'next_cursor': next_cursor})
+
+@app.route('/api/search/events/stream')
+@login_required
+def search_events_stream():
+    """All event search results as newline-delimited JSON, fetched page by page"""
+    if current_user.user_type != 'sponsor':
+        return jsonify({'error': 'Sponsors only'}), 403
+    
+    form = _search_form()
+    if not form.validate():
+        return jsonify({'errors': form.errors}), 400
+    sponsor_id = _sponsor_id()
+    limit = _page_size()
+    
+    def generate():
+        cursor = request.args.get('cursor')
+        while True:
+            # Per page, so the flag is not left set between yields
+            with replica_reads():
+                events, cursor = _search_page(form, sponsor_id, cursor, limit)
+            for data in _page_json(events):
+                yield json.dumps(data) + '\n'
+            # Release the page before fetching the next so memory stays bounded
             for event in events:
-                score = ai_matcher.calculate_match_score(event, current_user.sponsor_profile)
-                events_with_scores.append({
-                    'event': event,
-                    'score': score,
-                    'percentage': int(score * 100)
-                })
-            events = sorted(events_with_scores, key=lambda x: x['score'], reverse=True)
+                db.session.expunge(event['event'] if isinstance(event, dict) else event)
+            if not cursor:
+                break
     
-    return render_template('search_events.html', form=form, events=events)
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+INBOX_PAGE_SIZE = 20
+
+def _user_options(loader):
+    """Also load the profile the templates show next to a loaded user's name"""
+    return [loader.selectinload(User.club_profile), loader.selectinload(User.sponsor_profile)]
+
+def _inbox_page(user_id, cursor, limit):
+    """One page of a user's conversations, most recently active first"""
+    conversation = joinedload(ConversationParticipant.conversation)
+    query = (db.session.query(ConversationParticipant, ConversationParticipant.last_message_at,
+                              ConversationParticipant.id)
+             .options(conversation.joinedload(Conversation.last_message),
+                      *_user_options(conversation.selectinload(Conversation.user_low)),
+                      *_user_options(conversation.selectinload(Conversation.user_high)))
+             .filter(ConversationParticipant.user_id == user_id,
+                     ConversationParticipant.last_message_at.isnot(None)))
+    rows, next_cursor = keyset_page(query, [ConversationParticipant.last_message_at, ConversationParticipant.id],
+                                    cursor, limit)
+    return [row[0] for row in rows], next_cursor
+
+def _thread_page(conversation_id, cursor, limit):
+    """One page of a conversation's messages, newest first"""
+    query = (db.session.query(Message, Message.created_at, Message.id)
+             .options(*_user_options(selectinload(Message.sender)))
+             .filter(Message.conversation_id == conversation_id))
+    rows, next_cursor = keyset_page(query, [Message.created_at, Message.id], cursor, limit)
+    return [row[0] for row in rows], next_cursor
+
+def _conversation_or_404(conversation_id):
+    """A conversation the current user takes part in"""
+    conversation = Conversation.query.get_or_404(conversation_id)
+    if current_user.id not in (conversation.user_low_id, conversation.user_high_id):
+        abort(404)
+    return conversation
+
+def _message_json(message):
+    return {
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'recipient_id': message.recipient_id,
+        'subject': message.subject,
+        'content': message.content,
+        'read': message.read,
+        'created_at': message.created_at.isoformat(),
+    }
+
+def _conversation_json(participant):
+    conversation = participant.conversation
+    other = conversation.other_user(current_user.id)
+    last = conversation.last_message
+    return {
+        'id': conversation.id,
+        'with': {'id': other.id, 'username': other.username},
+        'unread_count': participant.unread_count,
+        'last_message': {
+            'id': last.id,
+            'sender_id': last.sender_id,
+            'subject': last.subject,
+            'snippet': last.content[:150],
+            'created_at': last.created_at.isoformat(),
+        } if last else None,
+        'url': url_for('conversation_details', conversation_id=conversation.id),
+    }
 
 @app.route('/messages')
+@query_budget(10)
 @login_required
 def messages():
-    """View messages"""
-    sent_messages = Message.query.filter_by(sender_id=current_user.id).order_by(Message.created_at.desc()).all()
-    received_messages = Message.query.filter_by(recipient_id=current_user.id).order_by(Message.created_at.desc()).all()
-    
-    return render_template('messages.html', sent_messages=sent_messages, received_messages=received_messages)
+    """Inbox: conversations, most recently active first"""
+    participants, next_cursor = _inbox_page(current_user.id, request.args.get('cursor'), INBOX_PAGE_SIZE)
+    next_url = url_for('messages', cursor=next_cursor) if next_cursor else None
+    return render_template('messages.html', participants=participants, next_url=next_url,
+                           unread_total=messaging.unread_total(current_user.id))
+
+@app.route('/messages/<int:conversation_id>')
+@query_budget(10)
+@login_required
+def conversation_details(conversation_id):
+    """Messages of one conversation, newest first"""
+    conversation = _conversation_or_404(conversation_id)
+    messages, next_cursor = _thread_page(conversation.id, request.args.get('cursor'), INBOX_PAGE_SIZE)
+    next_url = url_for('conversation_details', conversation_id=conversation.id, cursor=next_cursor) if next_cursor else None
+    return render_template('conversation.html', conversation=conversation,
+                           other=conversation.other_user(current_user.id),
+                           messages=messages, next_url=next_url)
+
+@app.route('/api/messages/conversations')
+@login_required
+def conversations_json():
+    """One page of the inbox as JSON"""
+    participants, next_cursor = _inbox_page(current_user.id, request.args.get('cursor'), _page_size())
+    return jsonify({'conversations': [_conversation_json(p) for p in participants],
+                    'unread_total': messaging.unread_total(current_user.id),
+                    'next_cursor': next_cursor})
+
+@app.route('/api/messages/<int:conversation_id>')
+@login_required
+def conversation_json(conversation_id):
+    """One page of a conversation's messages as JSON"""
+    conversation = _conversation_or_404(conversation_id)
+    messages, next_cursor = _thread_page(conversation.id, request.args.get('cursor'), _page_size())
+    return jsonify({'messages': [_message_json(m) for m in messages], 'next_cursor': next_cursor})
+
+@app.route('/api/notifications')
+@login_required
+def notifications_poll():
+    """Long-poll for new messages; answers as soon as there is one or after NOTIFY_TIMEOUT"""
+    since = request.args.get('since', type=int)
+    unread = request.args.get('unread', type=int)
+    release = notifications.reserve()
+    if release is None:
+        # Every waiting slot is taken: answer now and have the client poll again later
+        response = jsonify(notifications.wait(current_user.id, since=since, unread=unread, timeout=0))
+        response.headers['Retry-After'] = str(app.config['NOTIFY_RETRY_AFTER'])
+        return response
+    try:
+        return jsonify(notifications.wait(current_user.id, since=since, unread=unread,
+                                          timeout=request.args.get('timeout', type=float)))
+    finally:
+        release()
+
+@app.route('/api/notifications/stream')
+@login_required
+def notifications_stream():
+    """New messages and the unread count as Server-Sent Events"""
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    release = notifications.reserve()
+    if release is None:
+        # EventSource gives up on a 503 and the page falls back to polling
+        response = jsonify({'error': 'Too many open notification streams'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(app.config['NOTIFY_RETRY_AFTER'])
+        return response
+    response = Response(stream_with_context(notifications.stream(current_user.id, since)),
+                        mimetype='text/event-stream')
+    # Runs even if the client goes away before the stream starts
+    response.call_on_close(release)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/message/send/<int:recipient_id>', methods=['GET', 'POST'])
 @login_required
@@ -384,17 +675,10 @@ def send_message(recipient_id):
     form = MessageForm()
     
     if form.validate_on_submit():
-        message = Message(
-            sender_id=current_user.id,
-            recipient_id=recipient_id,
-            subject=form.subject.data,
-            content=form.content.data
-        )
-        
-        db.session.add(message)
+        message = messaging.send_message(current_user.id, recipient_id, form.subject.data, form.content.data)
         db.session.commit()
         flash('Message sent successfully!', 'success')
-        return redirect(url_for('messages'))
+        return redirect(url_for('conversation_details', conversation_id=message.conversation_id))
     
     return render_template('messages.html', form=form, recipient=recipient)
 
@@ -404,9 +688,11 @@ def mark_message_read(message_id):
     """Mark message as read"""
     message = Message.query.get_or_404(message_id)
     if message.recipient_id == current_user.id:
-        message.read = True
+        messaging.mark_read(message)
         db.session.commit()
     
+    if message.conversation_id:
+        return redirect(url_for('conversation_details', conversation_id=message.conversation_id))
     return redirect(url_for('messages'))
 
 @app.route('/interest/express/<int:event_id>')
@@ -445,6 +731,8 @@ def express_interest(event_id):
     return redirect(url_for('event_details', event_id=event_id))
 
 @app.route('/sponsors')
+@cached(tags=lambda: ['sponsors'])
+@read_replica
 def sponsors_showcase():
     """Public page showing sample sponsors with their requirements"""
     # Get sample sponsors from the database or create sample data
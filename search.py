@@ -0,0 +1,163 @@
+"""Full-text search backends for events.
+
+PostgreSQL keeps a generated ``tsvector`` column with a GIN index, SQLite an
+FTS5 table maintained by triggers; both are updated by the database on every
+write. Any other database falls back to the original ILIKE scan.
+"""
+import logging
+import re
+
+from sqlalchemy import Float, Integer, cast, func, literal_column, text
+
+from models import Event
+
+
+class SearchBackend:
+    """Fallback backend: unindexed, unranked substring match"""
+
+    name = 'like'
+
+    def install(self, engine):
+        """Create whatever index structures the backend needs (idempotent)"""
+
+    def apply(self, query, keyword):
+        """Filter an Event query by keyword; returns (query, rank or None)"""
+        pattern = f"%{keyword}%"
+        query = query.filter(
+            Event.name.ilike(pattern) |
+            Event.description.ilike(pattern) |
+            Event.theme.ilike(pattern) |
+            Event.tags.ilike(pattern)
+        )
+        return query, None
+
+    def search_ids(self, session, keyword, limit=None):
+        """Ids of the events matching keyword, most relevant first"""
+        query, rank = self.apply(session.query(Event.id), keyword)
+        if rank is not None:
+            query = query.order_by(rank.desc(), Event.id.desc())
+        else:
+            query = query.order_by(Event.id.desc())
+        if limit:
+            query = query.limit(limit)
+        return [event_id for event_id, in query]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Generated tsvector column with a GIN index, ranked with ts_rank"""
+
+    name = 'postgresql'
+
+    DDL = [
+        """
+        ALTER TABLE event ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(theme, '') || ' ' || coalesce(tags, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'C')
+        ) STORED
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_event_search_vector ON event USING GIN (search_vector)",
+    ]
+
+    def install(self, engine):
+        with engine.begin() as conn:
+            for statement in self.DDL:
+                conn.execute(text(statement))
+
+    def apply(self, query, keyword):
+        vector = literal_column('event.search_vector')
+        tsquery = func.websearch_to_tsquery('english', keyword)
+        # ts_rank is float4; as float8 it survives the JSON keyset cursor exactly, so pages never repeat rows
+        rank = cast(func.ts_rank(vector, tsquery), Float(53))
+        return query.filter(vector.op('@@')(tsquery)), rank
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """External-content FTS5 table kept in sync by triggers, ranked with bm25"""
+
+    name = 'sqlite'
+
+    COLUMNS = 'name, description, theme, tags'
+    DDL = [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS event_fts USING fts5(
+            {COLUMNS}, content='event', content_rowid='id', tokenize='porter unicode61'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS event_fts_insert AFTER INSERT ON event BEGIN
+            INSERT INTO event_fts(rowid, {COLUMNS})
+            VALUES (new.id, new.name, new.description, new.theme, new.tags);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS event_fts_delete AFTER DELETE ON event BEGIN
+            INSERT INTO event_fts(event_fts, rowid, {COLUMNS})
+            VALUES ('delete', old.id, old.name, old.description, old.theme, old.tags);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS event_fts_update AFTER UPDATE ON event BEGIN
+            INSERT INTO event_fts(event_fts, rowid, {COLUMNS})
+            VALUES ('delete', old.id, old.name, old.description, old.theme, old.tags);
+            INSERT INTO event_fts(rowid, {COLUMNS})
+            VALUES (new.id, new.name, new.description, new.theme, new.tags);
+        END
+        """,
+    ]
+
+    def install(self, engine):
+        with engine.begin() as conn:
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'event_fts'"
+            )).first()
+            for statement in self.DDL:
+                conn.execute(text(statement))
+            if not exists:
+                # Index the events written before the FTS table existed
+                conn.execute(text("INSERT INTO event_fts(event_fts) VALUES ('rebuild')"))
+
+    def apply(self, query, keyword):
+        terms = re.findall(r'\w+', keyword)
+        if not terms:
+            return super().apply(query, keyword)
+
+        # Quote every term so user input is never parsed as FTS syntax; prefix-match each
+        match = ' '.join(f'"{term}"*' for term in terms)
+        matches = (text("SELECT rowid AS id, bm25(event_fts) AS rank FROM event_fts WHERE event_fts MATCH :match")
+                   .bindparams(match=match)
+                   .columns(id=Integer, rank=Float)
+                   .subquery('event_fts_match'))
+        # bm25 is lower for better matches
+        return query.join(matches, matches.c.id == Event.id), -matches.c.rank
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+_backend = None
+
+
+def backend_for(engine):
+    return BACKENDS.get(engine.dialect.name, SearchBackend)()
+
+
+def install(engine):
+    """Pick the backend for this engine and create its index structures"""
+    global _backend
+    backend = backend_for(engine)
+    try:
+        backend.install(engine)
+    except Exception as e:
+        # e.g. SQLite built without FTS5 or PostgreSQL older than 12
+        logging.warning(f"Full-text search unavailable on {engine.dialect.name}, using ILIKE: {e}")
+        backend = SearchBackend()
+    _backend = backend
+    return backend
+
+
+def get_backend():
+    """The installed backend, or the ILIKE fallback before install() ran"""
+    return _backend or SearchBackend()
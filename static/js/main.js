@@ -10,6 +10,7 @@ document.addEventListener('DOMContentLoaded', function() {
     initializeSearchFilters();
     initializeMatchScoreAnimations();
     initializeMessageSystem();
+    initializeNotifications();
     
     console.log('SponsorSync initialized successfully');
 });
@@ -416,6 +417,78 @@ function copyToClipboard(text) {
     });
 }
 
+/**
+ * Live unread count and new-message toasts, without reloading the page.
+ * Uses Server-Sent Events, or a long-poll loop where EventSource is missing or
+ * the server has no stream slot left.
+ */
+function initializeNotifications() {
+    const link = document.getElementById('messages-nav');
+    if (!link) {
+        return;
+    }
+
+    let lastId = null;
+    let unread = null;
+
+    function handle(state) {
+        // The first answer only sets the starting point; older messages are not toasted
+        const announce = lastId !== null;
+        lastId = state.last_id;
+        unread = state.unread_total;
+        updateBadgeCount('.unread-badge', unread);
+        if (announce) {
+            state.messages.forEach(function(message) {
+                showToast(`New message from <strong>${escapeHtml(message.sender)}</strong>: ${escapeHtml(message.subject)}`, 'info');
+            });
+        }
+    }
+
+    function poll() {
+        const params = new URLSearchParams();
+        if (lastId !== null) {
+            params.set('since', lastId);
+            params.set('unread', unread);
+        }
+        fetch(`${link.dataset.notificationsPoll}?${params}`, {credentials: 'same-origin'})
+            .then(function(response) {
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+                // The server is out of waiting slots: short-poll at the pace it asks for
+                const retryAfter = parseInt(response.headers.get('Retry-After'), 10);
+                return response.json().then(function(state) {
+                    handle(state);
+                    setTimeout(poll, retryAfter > 0 ? retryAfter * 1000 : 0);
+                });
+            })
+            .catch(function() {
+                setTimeout(poll, 10000);
+            });
+    }
+
+    if (window.EventSource) {
+        const source = new EventSource(link.dataset.notificationsStream);
+        source.addEventListener('messages', function(e) {
+            handle(JSON.parse(e.data));
+        });
+        source.addEventListener('error', function() {
+            // Closed for good (e.g. a 503 when the server has no stream slot left); transient drops reconnect
+            if (source.readyState === EventSource.CLOSED) {
+                poll();
+            }
+        });
+        return;
+    }
+    poll();
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
 /**
  * Dynamic badge count updates
  */
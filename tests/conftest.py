@@ -0,0 +1,113 @@
+"""Test fixtures: the app on a throwaway SQLite file, emptied after every test."""
+import os
+import sys
+import tempfile
+from datetime import date
+
+# The app is built at import time from the environment
+_tmp = tempfile.mkdtemp(prefix='sponsorsync-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ.pop('DATABASE_REPLICA_URL', None)
+os.environ.setdefault('SESSION_SECRET', 'test')
+os.environ['RESPONSE_CACHE'] = 'memory'
+os.environ['MATCHER_ASYNC'] = ''
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from app import app as flask_app, db as _db  # noqa: E402
+import models  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    """The app, with its tables emptied afterwards.
+
+    No app context is held across requests, so each request gets its own
+    session and ``g`` as in production; use ``with app.app_context()`` to
+    touch the database from a test.
+    """
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    yield flask_app
+    with flask_app.app_context():
+        for table in reversed(_db.metadata.sorted_tables):
+            _db.session.execute(table.delete())
+        _db.session.commit()
+    _reset_caches()
+
+
+def _reset_caches():
+    import response_cache
+    import user_cache
+    from ai_matcher import ai_matcher
+    ai_matcher.memo.clear()
+    ai_matcher.features.clear()
+    ai_matcher._index = None
+    ai_matcher._candidates = None
+    ai_matcher._scores_checked = False
+    if response_cache._backend is not None:
+        response_cache._backend.clear()
+    user_cache.cache.clear()
+
+
+@pytest.fixture
+def db(app):
+    return _db
+
+
+def save(obj):
+    """Commit a new row in its own app context; its column attributes stay readable afterwards"""
+    with flask_app.app_context():
+        _db.session.add(obj)
+        _db.session.commit()
+        _db.session.refresh(obj)
+    return obj
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, user_id):
+    """Log ``client`` in as user ``user_id`` without going through the login form"""
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+@pytest.fixture
+def make_club(db):
+    def make(name='club', location='Pune'):
+        user = models.User(username=name, email=f'{name}@example.com', user_type='club')
+        user.set_password('secret')
+        club = models.ClubProfile(user=user, club_name=f'{name} society', university='State University',
+                                  location=location)
+        return save(club)
+    return make
+
+
+@pytest.fixture
+def make_sponsor(db):
+    def make(name='sponsor', industry='technology', location='Pune', demographics='students developers'):
+        user = models.User(username=name, email=f'{name}@example.com', user_type='sponsor')
+        user.set_password('secret')
+        sponsor = models.SponsorProfile(user=user, company_name=f'{name} inc', industry=industry,
+                                        location=location, target_demographics=demographics,
+                                        description='We fund student technology and coding events')
+        return save(sponsor)
+    return make
+
+
+@pytest.fixture
+def make_event(db):
+    def make(club, name='Hackathon', theme='tech hackathon', footfall=300, **fields):
+        event = models.Event(club_id=club.id, name=name, theme=theme, expected_footfall=footfall,
+                             location=fields.pop('location', 'Pune'), event_date=date(2030, 1, 1),
+                             tags=fields.pop('tags', 'coding ai startup'),
+                             target_audience=fields.pop('target_audience', 'students developers'),
+                             description=fields.pop('description', 'A weekend of coding and software'),
+                             **fields)
+        return save(event)
+    return make
@@ -0,0 +1,66 @@
+import io
+import json
+
+import bulk_io
+from ai_matcher import ai_matcher
+from conftest import save
+from models import Event, MatchScore, SponsorProfile, User
+
+
+def _jsonl(records):
+    return io.StringIO(''.join(json.dumps(record) + '\n' for record in records))
+
+
+def _import(app, kind, records, **options):
+    with app.app_context():
+        return bulk_io.import_file(kind, _jsonl(records), 'jsonl', echo=lambda line: None, **options)
+
+
+def test_import_across_chunks_rescores_once(app, monkeypatch, make_club, make_sponsor):
+    club = make_club()
+    make_sponsor('techco')
+    make_sponsor('bank', industry='finance')
+    calls = []
+    refresh_events = ai_matcher.refresh_events
+    monkeypatch.setattr(ai_matcher, 'refresh_events', lambda events: calls.append(len(events)) or
+                        refresh_events(events))
+    records = [{'name': f'Hackathon {i}', 'tags': 'coding', 'location': 'Pune'} for i in range(7)]
+    importer = _import(app, 'events', records, owner_id=club.id, chunk_size=3)
+    assert (importer.imported, importer.rejected) == (7, 0)
+    assert calls == [7]
+    with app.app_context():
+        assert Event.query.count() == 7
+        assert MatchScore.query.count() == 7 * 2
+
+
+def test_large_import_rebuilds_scores_once(app, monkeypatch, make_club, make_sponsor):
+    club = make_club()
+    make_sponsor()
+    monkeypatch.setattr(bulk_io.Importer, 'RESCORE_IDS', 4)
+    calls = []
+    rescore_all = ai_matcher.rescore_all
+    monkeypatch.setattr(ai_matcher, 'rescore_all', lambda: calls.append(1) or rescore_all())
+    monkeypatch.setattr(ai_matcher, 'refresh_events', lambda events: calls.append('per-chunk refresh'))
+    importer = _import(app, 'events', [{'name': f'Talk {i}'} for i in range(9)], owner_id=club.id, chunk_size=2)
+    assert importer.imported == 9
+    assert calls == [1]
+    with app.app_context():
+        assert Event.query.count() == 9
+        assert MatchScore.query.count() == 9
+
+
+def test_one_sponsor_profile_per_owner(app, make_sponsor):
+    existing = make_sponsor('acme')
+    fresh = save(User(username='newco', email='newco@example.com', user_type='sponsor'))
+    row = {'company_name': 'Newco', 'industry': 'technology', 'location': 'Pune'}
+    importer = _import(app, 'sponsors', [
+        dict(row, user_id=existing.user_id),
+        dict(row, user_id=fresh.id),
+        dict(row, user_id=fresh.id, company_name='Newco again'),  # same chunk
+        dict(row),  # --owner, in a later chunk
+    ], owner_id=fresh.id, chunk_size=3, rescore=False)
+    assert (importer.imported, importer.rejected) == (1, 3)
+    assert [number for number, _ in importer.first_rejected] == [1, 3, 4]
+    assert all('already has a profile' in errors['user_id'][0] for _, errors in importer.first_rejected)
+    with app.app_context():
+        assert SponsorProfile.query.filter_by(user_id=fresh.id).count() == 1
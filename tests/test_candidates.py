@@ -0,0 +1,38 @@
+from types import SimpleNamespace
+
+from ai_matcher import ai_matcher
+from matcher_engine import CandidateIndex
+from models import MatchScore, SponsorProfile
+
+
+def _event(id, tags, location='Pune'):
+    return SimpleNamespace(id=id, tags=tags, theme='', target_audience='', description='', location=location)
+
+
+def test_rare_terms_rank_first():
+    index = CandidateIndex(max_df=0.5)
+    index.build([_event(1, 'coding robots'), _event(2, 'coding'), _event(3, 'coding'), _event(4, 'dance')], [])
+    # 'coding' is in 3 of 4 events; 'robots' alone fills a budget of one
+    assert index.search('event', {'coding', 'robots'}, 1) == [1]
+    assert sorted(index.search('event', {'coding', 'robots'}, 3)) == [1, 2, 3]
+
+
+def test_common_terms_fill_the_budget():
+    index = CandidateIndex(max_df=0.2)
+    index.build([_event(i, 'coding ai') for i in range(1, 7)], [])
+    assert sorted(index.search('event', {'coding', 'loc:pune'}, 10)) == [1, 2, 3, 4, 5, 6]
+    assert len(index.search('event', {'coding'}, 2)) == 2
+
+
+def test_sponsor_with_only_common_terms_gets_scores(app, db, monkeypatch, make_club, make_sponsor, make_event):
+    monkeypatch.setattr(ai_matcher, 'candidate_budget', 3)
+    club = make_club()
+    # Every event shares all of the sponsor's terms, so each is above max_df
+    for i in range(6):
+        make_event(club, name=f'Hackathon {i}')
+    sponsor = make_sponsor()
+    with app.app_context():
+        sponsor = db.session.get(SponsorProfile, sponsor.id)
+        assert len(ai_matcher.candidate_events(sponsor)) == 3
+        ai_matcher.rescore_sponsor(sponsor)
+        assert MatchScore.query.filter_by(sponsor_id=sponsor.id).count() == 3
@@ -0,0 +1,113 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+import match_jobs
+from models import MatchJob
+
+
+@pytest.fixture
+def queue(app):
+    app.config['MATCHER_ASYNC'] = True
+    with app.app_context():
+        yield match_jobs
+    app.config['MATCHER_ASYNC'] = False
+
+
+def test_pending_job_per_entity_is_not_duplicated(queue, db):
+    queue.enqueue('event', 1)
+    queue.enqueue('event', 1)
+    queue.enqueue('event', 2)
+    assert MatchJob.query.count() == 2
+
+
+def test_claim_collapses_jobs_for_the_same_entity(queue, db):
+    # Bulk imports insert without the pending check
+    queue.schedule_rescore_many('sponsor', [3, 4])
+    queue.schedule_rescore_many('sponsor', [3])
+    queue.enqueue('event', 1)
+    batches = {entity_type: (entity_ids, job_ids) for entity_type, entity_ids, job_ids in queue.claim(10)}
+    assert sorted(batches['sponsor'][0]) == [3, 4]
+    assert len(batches['sponsor'][1]) == 3
+    assert batches['event'][0] == [1]
+
+
+def test_claimed_jobs_are_leased_until_they_expire(queue, db):
+    queue.enqueue('event', 1)
+    [(_, _, job_ids)] = queue.claim(10)
+    assert queue.claim(10) == []
+
+    # The worker holding the lease died: the job runs again once the lease is over
+    job = db.session.get(MatchJob, job_ids[0])
+    assert job.available_at > datetime.utcnow() + queue.LEASE - timedelta(minutes=1)
+    job.available_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    [(_, _, again)] = queue.claim(10)
+    assert again == job_ids
+    assert db.session.get(MatchJob, job_ids[0]).attempts == 2
+
+
+def test_failed_jobs_back_off_then_give_up(queue, db):
+    queue.enqueue('event', 1)
+    for attempt in range(1, queue.MAX_ATTEMPTS + 1):
+        [(_, _, job_ids)] = queue.claim(10)
+        queue.complete(job_ids, error=RuntimeError('boom'))
+        job = db.session.get(MatchJob, job_ids[0])
+        assert job.attempts == attempt
+        assert job.last_error == 'boom'
+        if attempt < queue.MAX_ATTEMPTS:
+            assert job.status == 'pending'
+            delay = (job.available_at - datetime.utcnow()).total_seconds()
+            assert 2 ** attempt - 5 < delay <= 2 ** attempt
+            assert queue.claim(10) == []
+            job.available_at = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+    assert job.status == 'failed'
+    assert queue.claim(10) == []
+    assert queue.queue_depth() == 0
+
+
+def test_completed_jobs_are_removed(queue, db):
+    queue.enqueue('event', 1)
+    [(_, _, job_ids)] = queue.claim(10)
+    queue.complete(job_ids)
+    assert MatchJob.query.count() == 0
+
+
+def test_renewed_lease_is_not_claimed_again(queue, db):
+    queue.enqueue('all', 0)
+    [(_, _, job_ids)] = queue.claim(10)
+    job = db.session.get(MatchJob, job_ids[0])
+    job.available_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    queue.renew(job_ids)
+    assert queue.claim(10) == []
+    assert db.session.get(MatchJob, job_ids[0]).attempts == 1
+
+
+def test_worker_keeps_a_long_job_leased(app, db, monkeypatch):
+    import worker
+
+    # Threads instead of processes, and a rescore that outlives several leases
+    monkeypatch.setattr(worker, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(match_jobs, 'LEASE', timedelta(seconds=0.6))
+    seen = []
+
+    def slow_rescore(entity_type, entity_ids):
+        for _ in range(4):
+            time.sleep(0.4)
+            with app.app_context():
+                # What a second worker polling now would get
+                seen.append(match_jobs.claim(10))
+        return len(entity_ids)
+    monkeypatch.setattr(worker, 'rescore', slow_rescore)
+
+    with app.app_context():
+        match_jobs.enqueue('all', 0)
+    worker.run(processes=1, batch_size=10, poll_interval=0.05, once=True)
+
+    assert seen == [[], [], [], []]
+    with app.app_context():
+        assert MatchJob.query.count() == 0
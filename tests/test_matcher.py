@@ -0,0 +1,156 @@
+import pytest
+from sqlalchemy import update
+
+from ai_matcher import ai_matcher
+from conftest import login
+from models import Event, MatchScore, SponsorProfile
+
+
+def test_event_details_shows_the_stored_score(app, db, client, make_club, make_sponsor, make_event):
+    club = make_club()
+    sponsor = make_sponsor()
+    event = make_event(club)
+    with app.app_context():
+        ai_matcher.rescore_all()
+        db.session.execute(update(MatchScore).values(score=0.42, text_score=0.0, audience_score=0.0,
+                                                     location_score=0.0, industry_score=0.42,
+                                                     footfall_score=0.0))
+        db.session.commit()
+    page = login(client, sponsor.user_id).get(f'/event/{event.id}').get_data(as_text=True)
+    assert '42%' in page
+    assert 'Event theme aligns with technology industry' in page
+    assert 'Geographic proximity' not in page
+
+
+def test_event_details_scores_live_before_rescoring(app, db, client, make_club, make_sponsor, make_event):
+    club = make_club()
+    sponsor = make_sponsor()
+    event = make_event(club)
+    with app.app_context():
+        db.session.execute(MatchScore.__table__.delete())
+        db.session.commit()
+        expected = ai_matcher.calculate_match_score(event, db.session.get(SponsorProfile, sponsor.id))
+    page = login(client, sponsor.user_id).get(f'/event/{event.id}').get_data(as_text=True)
+    assert f'{int(expected * 100)}%' in page
+
+
+def _varied_catalog(make_club, make_sponsor, make_event):
+    clubs = [make_club('coders', 'Pune'), make_club('athletes', 'Delhi')]
+    sponsors = [make_sponsor('techco'),
+                make_sponsor('bank', industry='finance', location='Mumbai', demographics='professionals'),
+                make_sponsor('gym', industry='sports', location='Delhi', demographics='students athletes'),
+                make_sponsor('blank', industry='other', location='', demographics='')]
+    events = [make_event(clubs[0], name='Hackathon'),
+              make_event(clubs[0], name='Fintech meetup', theme='finance startup', footfall=80,
+                         tags='fintech banking', target_audience='professionals'),
+              make_event(clubs[1], name='Marathon', theme='sports run', footfall=1200, location='Delhi',
+                         tags='running fitness', target_audience='students athletes',
+                         description='City marathon'),
+              make_event(clubs[1], name='Quiet evening', theme='', footfall=0, location='', tags='',
+                         target_audience='', description='')]
+    return events, sponsors
+
+
+
+def test_batch_scores_match_per_pair_scores(app, db, make_club, make_sponsor, make_event):
+    events, sponsors = _varied_catalog(make_club, make_sponsor, make_event)
+    with app.app_context():
+        events = [db.session.get(Event, e.id) for e in events]
+        sponsors = [db.session.get(SponsorProfile, s.id) for s in sponsors]
+        components = ai_matcher.score_components(events, sponsors)
+        ai_matcher.memo.clear()
+        for i, event in enumerate(events):
+            for j, sponsor in enumerate(sponsors):
+                live = ai_matcher.score_breakdown(event, sponsor)
+                assert components['total'][i, j] == pytest.approx(live.total, abs=1e-9)
+                for name in ('text', 'audience', 'location', 'industry', 'footfall'):
+                    assert components[name][i, j] == pytest.approx(getattr(live, name), abs=1e-9)
+        assert (ai_matcher.score_matrix(events, sponsors) == components['total']).all()
+
+
+def test_refresh_keeps_stored_scores_in_step_with_edits(app, db, make_club, make_sponsor, make_event):
+    events, sponsors = _varied_catalog(make_club, make_sponsor, make_event)
+    with app.app_context():
+        ai_matcher.rescore_all()
+        sponsor = db.session.get(SponsorProfile, sponsors[1].id)
+        sponsor.industry = 'sports'
+        sponsor.location = 'Delhi'
+        db.session.commit()
+        ai_matcher.refresh_sponsor(sponsor)
+        ai_matcher.memo.clear()
+        for event in events:
+            row = MatchScore.query.filter_by(event_id=event.id, sponsor_id=sponsor.id).one()
+            live = ai_matcher.calculate_match_score(db.session.get(Event, event.id), sponsor)
+            assert row.score == pytest.approx(live, abs=1e-9)
+
+
+def test_stored_scores_match_per_pair_scores(app, db, monkeypatch, make_club, make_sponsor, make_event):
+    events, sponsors = _varied_catalog(make_club, make_sponsor, make_event)
+    # Several blocks per rescore, as in a large import
+    monkeypatch.setattr(type(ai_matcher), 'STORE_BLOCK', 5)
+    with app.app_context():
+        ai_matcher.rescore_all()
+        stored = {(row.event_id, row.sponsor_id): row for row in MatchScore.query.all()}
+        assert len(stored) == len(events) * len(sponsors)
+        ai_matcher.memo.clear()
+        for event in events:
+            for sponsor in sponsors:
+                row = stored[event.id, sponsor.id]
+                live = ai_matcher.score_breakdown(db.session.get(Event, event.id),
+                                                  db.session.get(SponsorProfile, sponsor.id))
+                assert row.score == pytest.approx(live.total, abs=1e-9)
+                for name in ('text', 'audience', 'location', 'industry', 'footfall'):
+                    assert getattr(row, f'{name}_score') == pytest.approx(getattr(live, name), abs=1e-9)
+
+
+
+def test_snapshot_round_trip_matches_the_fitted_index(app, db, tmp_path, make_club, make_sponsor, make_event):
+    from matcher_engine import MatcherIndex
+    events, sponsors = _varied_catalog(make_club, make_sponsor, make_event)
+    with app.app_context():
+        events = [db.session.get(Event, e.id) for e in events]
+        sponsors = [db.session.get(SponsorProfile, s.id) for s in sponsors]
+        ai_matcher.save_snapshot(str(tmp_path / 'index'))
+        loaded = MatcherIndex.load(str(tmp_path / 'index'))
+        assert loaded.fitted_size == ai_matcher.index.fitted_size == len(events) + len(sponsors)
+        for event in events:
+            for sponsor in sponsors:
+                assert loaded.similarity(event, sponsor) == pytest.approx(ai_matcher.index.similarity(event, sponsor))
+
+        # A row saved at another version is transformed again instead of read from the snapshot
+        events[0].version += 1
+        assert loaded._row('event', events[0]) is None
+        assert loaded.similarity(events[0], sponsors[0]) == pytest.approx(
+            ai_matcher.index.similarity(events[0], sponsors[0]))
+
+
+def test_snapshot_is_loaded_instead_of_fitting(app, db, tmp_path, monkeypatch, make_club, make_sponsor, make_event):
+    _varied_catalog(make_club, make_sponsor, make_event)
+    directory = str(tmp_path / 'index')
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['matcher-snapshot', directory])
+    assert result.exit_code == 0, result.output
+    assert 'Saved matcher snapshot of 8 documents' in result.output
+
+    ai_matcher._index = None
+    monkeypatch.setattr(ai_matcher, 'snapshot', directory)
+    monkeypatch.setattr(ai_matcher, '_catalog', lambda: pytest.fail('fitted instead of loading the snapshot'))
+    with app.app_context():
+        ai_matcher.ensure_index()
+    assert ai_matcher.index.fitted_size == 8
+    # Read-only memory maps of the snapshot files, not copies
+    assert not ai_matcher.index.matrices['event'].data.flags.writeable
+
+
+def test_unreadable_snapshot_is_skipped(app, tmp_path, caplog, make_club, make_sponsor, make_event):
+    _varied_catalog(make_club, make_sponsor, make_event)
+    directory = tmp_path / 'index'
+    with app.app_context():
+        ai_matcher.save_snapshot(str(directory))
+    manifest = (directory / 'index.json').read_text().replace('"version": 2', '"version": 1')
+    (directory / 'index.json').write_text(manifest)
+
+    ai_matcher._index = None
+    assert not ai_matcher.load_snapshot(str(directory))
+    assert 'Unsupported matcher snapshot version 1' in caplog.text
+    assert not ai_matcher.load_snapshot(str(tmp_path / 'missing'))
@@ -0,0 +1,63 @@
+import messaging
+from models import ConversationParticipant, Message
+
+
+def _unread(db, conversation_id, user_id):
+    return db.session.query(ConversationParticipant.unread_count).filter_by(
+        conversation_id=conversation_id, user_id=user_id).scalar()
+
+
+def test_send_and_mark_read_keep_unread_counts(app, db, make_club, make_sponsor):
+    club, sponsor = make_club(), make_sponsor()
+    with app.app_context():
+        first = messaging.send_message(sponsor.user_id, club.user_id, 'Hi', 'Interested in your event')
+        messaging.send_message(sponsor.user_id, club.user_id, 'Again', 'Any news?')
+        messaging.send_message(club.user_id, sponsor.user_id, 'Re: Hi', 'Yes, let us talk')
+        db.session.commit()
+        conversation_id = first.conversation_id
+        assert messaging.unread_total(club.user_id) == 2
+        assert messaging.unread_total(sponsor.user_id) == 1
+
+        messaging.mark_read(first)
+        messaging.mark_read(first)
+        db.session.commit()
+        assert _unread(db, conversation_id, club.user_id) == 1
+        assert _unread(db, conversation_id, sponsor.user_id) == 1
+
+
+def test_concurrent_mark_read_decrements_once(app, db, make_club, make_sponsor):
+    club, sponsor = make_club(), make_sponsor()
+    with app.app_context():
+        message = messaging.send_message(sponsor.user_id, club.user_id, 'Hi', 'Interested in your event')
+        messaging.send_message(sponsor.user_id, club.user_id, 'Again', 'Any news?')
+        db.session.commit()
+        message_id, conversation_id = message.id, message.conversation_id
+
+    # Two tabs open the same unread message; each request has its own session
+    with app.app_context():
+        first = db.session.get(Message, message_id)
+        with app.app_context():
+            second = db.session.get(Message, message_id)
+            messaging.mark_read(second)
+            db.session.commit()
+        messaging.mark_read(first)
+        db.session.commit()
+
+    with app.app_context():
+        assert db.session.get(Message, message_id).read
+        assert _unread(db, conversation_id, club.user_id) == 1
+        assert messaging.unread_total(club.user_id) == 1
+
+
+def test_recount_repairs_counters(app, db, make_club, make_sponsor):
+    club, sponsor = make_club(), make_sponsor()
+    with app.app_context():
+        message = messaging.send_message(sponsor.user_id, club.user_id, 'Hi', 'Interested in your event')
+        db.session.commit()
+        conversation = message.conversation
+        conversation.participants[0].unread_count = 7
+        conversation.participants[1].unread_count = 7
+        messaging.recount(conversation)
+        db.session.commit()
+        assert messaging.unread_total(club.user_id) == 1
+        assert messaging.unread_total(sponsor.user_id) == 0
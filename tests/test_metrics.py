@@ -0,0 +1,31 @@
+from flask import g
+
+from ai_matcher import ai_matcher
+from models import Event
+
+
+def test_metrics_local_only_without_token(app, client):
+    assert client.get('/metrics').status_code == 200
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.5'}).status_code == 403
+    assert client.get('/metrics', headers={'X-Forwarded-For': '203.0.113.5'}).status_code == 403
+
+
+def test_metrics_token_required_when_set(app, client):
+    app.config['METRICS_TOKEN'] = 'scrape'
+    try:
+        assert client.get('/metrics').status_code == 401
+        response = client.get('/metrics', headers={'Authorization': 'Bearer scrape'},
+                              environ_base={'REMOTE_ADDR': '203.0.113.5'})
+        assert response.status_code == 200
+    finally:
+        app.config['METRICS_TOKEN'] = None
+
+
+def test_rescoring_counts_as_matcher_time(app, db, make_club, make_sponsor, make_event):
+    club = make_club()
+    make_sponsor()
+    event = make_event(club)
+    with app.test_request_context('/'):
+        g.metrics_timings = {}
+        ai_matcher.refresh_events([db.session.get(Event, event.id)])
+        assert g.metrics_timings['matcher'] > 0
@@ -0,0 +1,101 @@
+import sqlite3
+
+import pytest
+from flask import Flask
+from sqlalchemy import inspect
+
+import messaging
+import migrations
+import search
+from app import bootstrap, configure, db
+from models import ClubProfile, Event, Message
+
+# The tables as the first release created them, before any column or index was added
+BASELINE = """
+CREATE TABLE user (
+    id INTEGER PRIMARY KEY, username VARCHAR(64) NOT NULL UNIQUE, email VARCHAR(120) NOT NULL UNIQUE,
+    password_hash VARCHAR(256), user_type VARCHAR(20) NOT NULL, created_at DATETIME
+);
+CREATE TABLE club_profile (
+    id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id), club_name VARCHAR(100) NOT NULL,
+    university VARCHAR(100) NOT NULL, location VARCHAR(100) NOT NULL, description TEXT,
+    contact_person VARCHAR(100), phone VARCHAR(20)
+);
+CREATE TABLE sponsor_profile (
+    id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id), company_name VARCHAR(100) NOT NULL,
+    industry VARCHAR(50) NOT NULL, location VARCHAR(100) NOT NULL, description TEXT, website VARCHAR(200),
+    budget_range VARCHAR(50), target_demographics VARCHAR(200), contact_person VARCHAR(100), phone VARCHAR(20)
+);
+CREATE TABLE event (
+    id INTEGER PRIMARY KEY, club_id INTEGER NOT NULL REFERENCES club_profile (id), name VARCHAR(200) NOT NULL,
+    description TEXT, theme VARCHAR(100), event_date DATE, location VARCHAR(200), expected_footfall INTEGER,
+    target_audience VARCHAR(200), sponsor_requirements TEXT, monetary_requirement VARCHAR(50),
+    material_requirement TEXT, marketing_requirement TEXT, past_engagement_stats TEXT, tags VARCHAR(500),
+    created_at DATETIME
+);
+CREATE TABLE sponsor_interest (
+    id INTEGER PRIMARY KEY, sponsor_id INTEGER NOT NULL REFERENCES sponsor_profile (id),
+    event_id INTEGER NOT NULL REFERENCES event (id), interest_level VARCHAR(20), message TEXT, created_at DATETIME
+);
+CREATE TABLE message (
+    id INTEGER PRIMARY KEY, sender_id INTEGER NOT NULL REFERENCES user (id),
+    recipient_id INTEGER NOT NULL REFERENCES user (id), subject VARCHAR(200), content TEXT NOT NULL,
+    read BOOLEAN, created_at DATETIME, event_id INTEGER REFERENCES event (id)
+);
+INSERT INTO user VALUES (1, 'club', 'club@example.com', NULL, 'club', '2024-01-01 00:00:00');
+INSERT INTO user VALUES (2, 'sponsor', 'sponsor@example.com', NULL, 'sponsor', '2024-01-01 00:00:00');
+INSERT INTO club_profile VALUES (1, 1, 'Robotics society', 'State University', 'Pune', NULL, NULL, NULL);
+INSERT INTO sponsor_profile VALUES (1, 2, 'Sponsor inc', 'technology', 'Pune', NULL, NULL, NULL, NULL, NULL, NULL);
+INSERT INTO event (id, club_id, name, theme, tags, created_at)
+    VALUES (1, 1, 'Robotics Summit', 'tech', 'robots', '2024-01-02 00:00:00');
+INSERT INTO message VALUES (1, 2, 1, 'Hi', 'Interested', 0, '2024-01-03 00:00:00', 1);
+INSERT INTO message VALUES (2, 2, 1, 'Again', 'Any news?', 0, '2024-01-04 00:00:00', NULL);
+"""
+
+
+@pytest.fixture
+def baseline_app(tmp_path, monkeypatch):
+    """An app started on a database written by the first release"""
+    path = tmp_path / 'baseline.db'
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE)
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{path}")
+    app = Flask(__name__)
+    configure(app)
+    db.init_app(app)
+    with app.app_context():
+        bootstrap(app)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def test_startup_upgrades_a_baseline_database(baseline_app):
+    with baseline_app.app_context():
+        assert migrations.missing_columns(db.engine, db.metadata) == []
+        assert migrations.missing_indexes(db.engine, db.metadata) == []
+        assert 'ix_event_club_id' in {index['name'] for index in inspect(db.engine).get_indexes('event')}
+
+        # Added NOT NULL columns take their server default on existing rows
+        event = db.session.get(Event, 1)
+        assert event.version == 1
+        assert db.session.get(ClubProfile, 1).version == 1
+        event.name = 'Robotics Summit 2024'
+        db.session.commit()
+        assert event.version == 2
+
+        # Old messages are threaded into one conversation with its unread count
+        messages = Message.query.order_by(Message.id).all()
+        assert {m.conversation_id for m in messages} == {messages[0].conversation_id} != {None}
+        assert messages[0].conversation.last_message_id == 2
+        assert messaging.unread_total(1) == 2
+
+        # Events written before the FTS table existed are searchable
+        assert search.get_backend().search_ids(db.session, 'robotics') == [1]
+
+
+def test_upgrade_is_idempotent(baseline_app):
+    with baseline_app.app_context():
+        assert migrations.add_columns(db.engine, db.metadata) == []
+        assert migrations.create_indexes(db.engine, db.metadata) == []
+        bootstrap(baseline_app)
@@ -0,0 +1,17 @@
+import threading
+
+from notifications import NotificationHub
+
+
+def test_closing_the_hub_wakes_waiting_requests():
+    hub = NotificationHub()
+    woke = threading.Event()
+
+    def waiter():
+        hub.wait(1, hub.version(1), timeout=30)
+        woke.set()
+    threading.Thread(target=waiter, daemon=True).start()
+    hub.close()
+    assert woke.wait(2)
+    # Later waits return at once instead of holding the thread
+    assert hub.wait(1, hub.version(1), timeout=30) is False
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from ai_matcher import ai_matcher
+from conftest import login, save
+from models import MatchScore, User
+from pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    values = [0.1 + 0.2, datetime(2030, 1, 1, 12, 30, 15, 123456), 7]
+    assert decode_cursor(encode_cursor(values)) == values
+    assert decode_cursor('not a cursor') is None
+
+
+def _pages(client, limit, **args):
+    ids, scores, cursor = [], [], None
+    while True:
+        params = dict(args, limit=limit)
+        if cursor:
+            params['cursor'] = cursor
+        data = client.get('/api/search/events', query_string=params).get_json()
+        ids += [e['id'] for e in data['events']]
+        scores += [e.get('score') for e in data['events']]
+        cursor = data['next_cursor']
+        if cursor is None:
+            return ids, scores
+
+
+def test_pages_cover_tied_scores_once(app, db, client, make_club, make_sponsor, make_event):
+    club = make_club()
+    sponsor = make_sponsor()
+    # Three groups of identical events, so most sort keys tie on score
+    events = [make_event(club, name=f'Hackathon {i}') for i in range(7)]
+    events += [make_event(club, name=f'Meetup {i}', theme='finance', footfall=50, tags='banking',
+                          target_audience='bankers', description='Talks') for i in range(6)]
+    events += [make_event(club, name=f'Other {i}', theme='', footfall=0, tags='', target_audience='',
+                          description='', location='') for i in range(5)]
+    with app.app_context():
+        ai_matcher.rescore_all()
+        assert len({row.score for row in MatchScore.query.all()}) == 3
+    login(client, sponsor.user_id)
+
+    for limit in (1, 4, 5, 7, 100):
+        ids, scores = _pages(client, limit)
+        assert sorted(ids) == sorted(e.id for e in events)
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_keyword_pages_cover_tied_ranks_once(app, client, make_club, make_event):
+    club = make_club()
+    events = [make_event(club, name=f'Hackathon {i}') for i in range(9)]
+    make_event(club, name='Marathon', theme='sports', tags='running', description='A city run')
+    # Without a sponsor profile results are ordered by relevance, equal for identical events
+    user = save(User(username='browser', email='browser@example.com', user_type='sponsor'))
+    login(client, user.id)
+    for limit in (1, 4, 100):
+        ids, _ = _pages(client, limit, keyword='hackathon')
+        assert sorted(ids) == sorted(e.id for e in events)
@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+from conftest import login
+from models import ClubProfile, SponsorProfile
+
+
+@pytest.fixture
+def concurrent_edit():
+    """Bump a profile's version just before the request flushes, as another save would"""
+    def bump(session, flush_context, instances):
+        for obj in session.dirty:
+            if isinstance(obj, (ClubProfile, SponsorProfile)):
+                model = type(obj)
+                session.execute(update(model).where(model.id == obj.id).values(version=model.version + 1),
+                                execution_options={'synchronize_session': False})
+    event.listen(Session, 'before_flush', bump)
+    yield
+    event.remove(Session, 'before_flush', bump)
+
+
+def test_concurrent_profile_edit_asks_for_reload(app, db, client, make_sponsor, concurrent_edit):
+    sponsor = make_sponsor()
+    login(client, sponsor.user_id)
+    response = client.post('/sponsor/profile', data={'company_name': 'Renamed inc', 'industry': 'finance',
+                                                     'location': 'Pune', 'budget_range': '1k_5k'})
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/sponsor/profile')
+    with client.session_transaction() as session:
+        assert 'changed by someone else' in session['_flashes'][0][1]
+    with app.app_context():
+        assert db.session.get(SponsorProfile, sponsor.id).company_name == 'sponsor inc'
+
+
+def test_concurrent_club_profile_edit_asks_for_reload(app, db, client, make_club, concurrent_edit):
+    club = make_club()
+    login(client, club.user_id)
+    response = client.post('/club/profile', data={'club_name': 'Renamed society', 'university': 'State University',
+                                                  'location': 'Pune'})
+    assert response.headers['Location'].endswith('/club/profile')
+    with client.session_transaction() as session:
+        assert 'changed by someone else' in session['_flashes'][0][1]
+    with app.app_context():
+        assert db.session.get(ClubProfile, club.id).club_name == 'club society'
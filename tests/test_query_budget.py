@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import select
+
+from ai_matcher import ai_matcher
+from conftest import login
+from query_budget import QueryBudgetExceeded, query_budget
+
+
+@query_budget(1)
+def _two_queries(db):
+    db.session.execute(select(1))
+    db.session.execute(select(1))
+    return 'ok'
+
+
+def test_over_budget_raises_in_testing(app, db):
+    # TESTING is set after the app was built at import time
+    app.config.pop('QUERY_BUDGET_ENFORCE', None)
+    with app.test_request_context('/'):
+        with pytest.raises(QueryBudgetExceeded, match='executed 2 queries, budget is 1'):
+            _two_queries(db)
+
+
+def test_over_budget_only_warns_when_not_enforced(app, db, caplog):
+    app.config['QUERY_BUDGET_ENFORCE'] = False
+    try:
+        with app.test_request_context('/'):
+            assert _two_queries(db) == 'ok'
+    finally:
+        app.config.pop('QUERY_BUDGET_ENFORCE')
+    assert 'budget is 1' in caplog.text
+
+
+def test_dashboards_stay_within_budget(app, client, make_club, make_sponsor, make_event):
+    club = make_club()
+    sponsor = make_sponsor()
+    for i in range(5):
+        make_event(club, name=f'Event {i}')
+    with app.app_context():
+        # As after the rescoring that saving rows schedules
+        ai_matcher.rescore_all()
+    assert login(client, club.user_id).get('/club/dashboard').status_code == 200
+    assert login(app.test_client(), sponsor.user_id).get('/sponsor/dashboard').status_code == 200
+
+
+def test_first_dashboard_visit_backfills_within_budget(app, client, make_club, make_sponsor, make_event):
+    club = make_club()
+    sponsor = make_sponsor()
+    for i in range(5):
+        make_event(club, name=f'Event {i}')
+    # No rescore_all: the first visit rebuilds the score table inside the request
+    assert login(client, sponsor.user_id).get('/sponsor/dashboard').status_code == 200
+    with app.app_context():
+        assert len(ai_matcher.get_event_recommendations(sponsor, limit=10)) == 5
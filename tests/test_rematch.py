@@ -0,0 +1,39 @@
+import pytest
+
+import rematch
+from ai_matcher import ai_matcher
+from models import MatchScore
+
+
+def _stored(db):
+    return {(row.event_id, row.sponsor_id): row.score for row in MatchScore.query.all()}
+
+
+def _catalog(make_club, make_sponsor, make_event):
+    club = make_club()
+    make_sponsor('techco')
+    make_sponsor('bank', industry='finance', location='Mumbai', demographics='professionals bankers')
+    make_sponsor('gym', industry='sports', location='Delhi', demographics='students athletes')
+    for i in range(4):
+        make_event(club, name=f'Hackathon {i}')
+    make_event(club, name='Fintech meetup', theme='finance', tags='banking fintech', target_audience='bankers')
+    make_event(club, name='Marathon', theme='sports run', tags='running', location='Delhi',
+               target_audience='athletes', description='City run')
+
+
+@pytest.mark.parametrize('budget', [None, 2])
+def test_rematch_stores_the_rows_rescore_all_stores(app, db, tmp_path, monkeypatch, budget,
+                                                    make_club, make_sponsor, make_event):
+    monkeypatch.setattr(ai_matcher, 'candidate_budget', budget)
+    _catalog(make_club, make_sponsor, make_event)
+    with app.app_context():
+        ai_matcher.rescore_all()
+        expected = _stored(db)
+        MatchScore.query.delete()
+        db.session.commit()
+        rematch.run(str(tmp_path), processes=1, shard_size=4, echo=lambda line: None)
+        stored = _stored(db)
+    assert len(expected) == (3 * 2 if budget else 6 * 3)
+    assert stored.keys() == expected.keys()
+    for pair, score in expected.items():
+        assert stored[pair] == pytest.approx(score, abs=1e-9)
@@ -0,0 +1,83 @@
+import pytest
+from flask import Flask, jsonify
+from sqlalchemy import event, insert
+
+import replica
+from app import bootstrap, configure, db
+from models import User
+
+
+def _add_user(engine, username):
+    with engine.begin() as conn:
+        conn.execute(insert(User).values(username=username, email=f'{username}@example.com', user_type='club'))
+
+
+@pytest.fixture
+def replica_app(tmp_path, monkeypatch):
+    """An app whose replica is a second SQLite file holding different rows than the primary"""
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'primary.db'}")
+    monkeypatch.setenv('DATABASE_REPLICA_URL', f"sqlite:///{tmp_path / 'replica.db'}")
+    app = Flask(__name__)
+    configure(app)
+    app.config.update(TESTING=True)
+    db.init_app(app)
+    with app.app_context():
+        bootstrap(app)
+        db.metadata.create_all(db.engines[replica.REPLICA])
+        _add_user(db.engine, 'primary')
+        _add_user(db.engines[replica.REPLICA], 'replica')
+
+    @app.route('/users')
+    @replica.read_replica
+    def users():
+        return jsonify(sorted(u.username for u in User.query))
+
+    @app.route('/signup/<username>', methods=['POST'])
+    def signup(username):
+        db.session.add(User(username=username, email=f'{username}@example.com', user_type='club'))
+        db.session.commit()
+        return '', 204
+
+    yield app
+    # The listeners are registered on the session class, shared with the other tests' app
+    event.remove(replica.RoutingSession, 'after_commit', replica._pin_writer)
+    event.remove(replica.RoutingSession, 'after_rollback', replica._discard)
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def test_reads_outside_read_replica_use_the_primary(replica_app):
+    with replica_app.app_context():
+        assert [u.username for u in User.query] == ['primary']
+        with replica.replica_reads():
+            assert [u.username for u in User.query] == ['replica']
+
+
+def test_reads_after_a_write_in_the_transaction_use_the_primary(replica_app):
+    with replica_app.app_context(), replica.replica_reads():
+        db.session.add(User(username='unsaved', email='unsaved@example.com', user_type='club'))
+        # Autoflush writes the row first, so the read must see it
+        assert sorted(u.username for u in User.query) == ['primary', 'unsaved']
+
+
+def test_writer_reads_the_primary_within_the_staleness_window(replica_app, monkeypatch):
+    writer, other = replica_app.test_client(), replica_app.test_client()
+    assert writer.get('/users').get_json() == ['replica']
+    assert writer.post('/signup/newbie').status_code == 204
+
+    assert writer.get('/users').get_json() == ['newbie', 'primary']
+    assert other.get('/users').get_json() == ['replica']
+
+    now = replica.time.time()
+    monkeypatch.setattr(replica.time, 'time', lambda: now + replica_app.config['REPLICA_STALENESS'] + 1)
+    assert writer.get('/users').get_json() == ['replica']
+
+
+def test_lagging_replica_is_skipped(replica_app, monkeypatch):
+    replica_app.extensions['replica'] = replica.LagProbe(0)
+    monkeypatch.setattr(replica, 'measure_lag', lambda engine: replica_app.config['REPLICA_STALENESS'] + 1)
+    assert replica_app.test_client().get('/users').get_json() == ['primary']
+
+    monkeypatch.setattr(replica, 'measure_lag', lambda engine: 0.0)
+    assert replica_app.test_client().get('/users').get_json() == ['replica']
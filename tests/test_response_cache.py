@@ -0,0 +1,90 @@
+from datetime import datetime
+
+from sqlalchemy import update
+
+import response_cache
+from ai_matcher import ai_matcher
+from conftest import login
+from models import MatchScore, SponsorProfile
+
+
+def _login(client, user_id):
+    login(client, user_id)
+    # The first request after logging in updates the session, and such responses are not stored
+    client.get('/')
+    return client
+
+
+def _page(client, sponsor_id):
+    response = client.get(f'/sponsor/{sponsor_id}')
+    return response.headers.get('X-Cache'), response.get_data(as_text=True)
+
+
+def test_committing_a_profile_invalidates_its_page(app, db, client, make_sponsor):
+    sponsor = make_sponsor('acme')
+    _login(client, sponsor.user_id)
+    assert _page(client, sponsor.id)[0] == 'MISS'
+    assert _page(client, sponsor.id)[0] == 'HIT'
+
+    with app.app_context():
+        db.session.get(SponsorProfile, sponsor.id).company_name = 'Acme Renamed'
+        db.session.commit()
+    status, body = _page(client, sponsor.id)
+    assert status == 'MISS'
+    assert 'Acme Renamed' in body
+
+
+def test_rollback_keeps_the_page_and_bulk_updates_invalidate_by_hand(app, db, client, make_sponsor):
+    sponsor = make_sponsor('acme')
+    _login(client, sponsor.user_id)
+    _page(client, sponsor.id)
+
+    with app.app_context():
+        db.session.get(SponsorProfile, sponsor.id).company_name = 'Never saved'
+        db.session.flush()
+        db.session.rollback()
+    assert _page(client, sponsor.id)[0] == 'HIT'
+
+    # Core updates bypass the session's change tracking
+    with app.app_context():
+        db.session.execute(update(SponsorProfile).values(company_name='Bulk renamed'))
+        db.session.commit()
+    assert _page(client, sponsor.id)[0] == 'HIT'
+    with app.app_context():
+        response_cache.invalidate(f'sponsor:{sponsor.id}')
+    status, body = _page(client, sponsor.id)
+    assert status == 'MISS'
+    assert 'Bulk renamed' in body
+
+
+def test_filesystem_bumps_reach_every_process(tmp_path):
+    # Two workers on one host, each with its own backend over the same directory
+    first = response_cache.FileSystemCache(str(tmp_path))
+    second = response_cache.FileSystemCache(str(tmp_path))
+    before = second.generations(['sponsor:1', 'events'])
+    first.bump('sponsor:1')
+    after = second.generations(['sponsor:1', 'events'])
+    assert after[0] != before[0]
+    assert after[1] == before[1]
+
+    first.set('page', {'body': b'cached'})
+    assert second.get('page') == {'body': b'cached'}
+
+
+def test_rewritten_score_is_not_served_from_cache(app, db, client, make_club, make_sponsor, make_event):
+    event = make_event(make_club())
+    sponsor = make_sponsor()
+    with app.app_context():
+        ai_matcher.rescore_all()
+    _login(client, sponsor.user_id)
+    assert client.get(f'/event/{event.id}').headers['X-Cache'] == 'MISS'
+    assert client.get(f'/event/{event.id}').headers['X-Cache'] == 'HIT'
+
+    # As the worker or the rematch CLI would, with a bulk write that bumps no tag
+    with app.app_context():
+        db.session.execute(update(MatchScore).values(score=0.78, updated_at=datetime.utcnow()))
+        db.session.commit()
+    response = client.get(f'/event/{event.id}')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert '78%' in response.get_data(as_text=True)
+    assert client.get(f'/event/{event.id}').headers['X-Cache'] == 'HIT'
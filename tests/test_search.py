@@ -0,0 +1,72 @@
+from sqlalchemy import text
+
+import search
+from conftest import login, save
+from models import Event, User
+
+
+def _ids(db, keyword):
+    return search.get_backend().search_ids(db.session, keyword)
+
+
+def test_sqlite_backend_is_installed(app, db):
+    with app.app_context():
+        assert search.get_backend().name == 'sqlite'
+
+
+def test_matches_stems_and_prefixes_ranked(app, db, make_club, make_event):
+    club = make_club()
+    in_name = make_event(club, name='Robotics Summit', theme='engineering', tags='hardware')
+    in_description = make_event(club, name='Spring Fest', theme='culture', tags='music',
+                                description='A festival with a small robotics corner')
+    make_event(club, name='Poetry Night', theme='literature', tags='writing', description='Readings')
+    with app.app_context():
+        # "robot" prefix-matches "robotics"; the name is weighted above the description
+        assert _ids(db, 'robot') == [in_name.id, in_description.id]
+        assert _ids(db, 'festivals') == [in_description.id]
+
+
+def test_index_follows_updates_and_deletes(app, db, make_club, make_event):
+    event = make_event(make_club(), name='Robotics Summit')
+    with app.app_context():
+        db.session.get(Event, event.id).name = 'Chess Open'
+        db.session.commit()
+        assert _ids(db, 'robotics') == []
+        assert _ids(db, 'chess') == [event.id]
+        db.session.delete(db.session.get(Event, event.id))
+        db.session.commit()
+        assert _ids(db, 'chess') == []
+
+
+def test_fts_syntax_in_keywords_is_not_parsed(app, db, make_club, make_event):
+    event = make_event(make_club(), name='Robotics Summit')
+    with app.app_context():
+        assert _ids(db, 'robot* "summit') == [event.id]
+        # Operators are searched for as plain words
+        assert _ids(db, 'robotics AND NEAR(summit') == []
+        # Nothing FTS can match: the substring fallback
+        assert _ids(db, '***') == []
+
+
+def test_install_indexes_existing_events(app, db, make_club, make_event):
+    event = make_event(make_club(), name='Robotics Summit')
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(text("DROP TABLE event_fts"))
+            for trigger in ('insert', 'delete', 'update'):
+                conn.execute(text(f"DROP TRIGGER event_fts_{trigger}"))
+        search.install(db.engine)
+        assert _ids(db, 'robotics') == [event.id]
+
+
+def test_search_page_ranks_by_relevance(app, client, make_club, make_event):
+    club = make_club()
+    make_event(club, name='Spring Fest', theme='culture', tags='music',
+               description='A festival with a small robotics corner')
+    make_event(club, name='Robotics Summit', theme='engineering', tags='hardware')
+    # A sponsor without a profile yet gets keyword results by relevance, not by match score
+    user = User(username='browser', email='browser@example.com', user_type='sponsor')
+    user.set_password('secret')
+    user = save(user)
+    response = login(client, user.id).get('/api/search/events?keyword=robotics')
+    assert [e['name'] for e in response.get_json()['events']] == ['Robotics Summit', 'Spring Fest']
@@ -0,0 +1,47 @@
+import time
+
+import pytest
+from sqlalchemy import update
+
+import user_cache
+from conftest import login
+from models import User
+
+
+@pytest.fixture
+def cached_users(app):
+    user_cache.cache.ttl = 60
+    yield user_cache.cache
+    user_cache.cache.ttl = app.config['USER_CACHE_TTL']
+
+
+def _rename_elsewhere(app, db, user_id, username):
+    # A Core UPDATE is invisible to this process's cache, as a commit in another worker would be
+    with app.app_context():
+        db.session.execute(update(User).where(User.id == user_id).values(username=username))
+        db.session.commit()
+
+
+def test_cached_user_served_until_its_browser_commits(app, db, client, cached_users, make_club):
+    club = make_club('alice')
+    login(client, club.user_id)
+    assert b'alice' in client.get('/club/dashboard').data
+
+    _rename_elsewhere(app, db, club.user_id, 'alicia')
+    assert b'alicia' not in client.get('/club/dashboard').data
+
+    # The stamp another worker leaves in the browser session after committing the edit
+    with client.session_transaction() as session:
+        session['user_changed_at'] = time.time()
+    assert b'alicia' in client.get('/club/dashboard').data
+
+
+def test_commit_in_request_stamps_browser_session(app, db, client, cached_users, make_club):
+    club = make_club('bob')
+    login(client, club.user_id)
+    client.get('/club/dashboard')
+    response = client.post('/club/profile', data={'club_name': 'Bob society', 'university': 'State University',
+                                                  'location': 'Mumbai', 'description': 'Coding club'})
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        assert session['user_changed_at'] > 0
@@ -0,0 +1,151 @@
+"""Loading the logged-in user, with an optional per-process cache.
+
+Nearly every view reads ``current_user.club_profile`` or
+``current_user.sponsor_profile``, so the user comes back with both profiles
+in one query instead of one query for the user and a lazy load per profile.
+
+With USER_CACHE_TTL set, GET and HEAD requests skip even that query. The
+loaded user is kept in this process for up to that many seconds and merged
+into each request's session without touching the database. Entries are
+dropped when the user or one of their profiles is committed in this process,
+and at logout. Other requests always load from the database, so a profile
+edit never starts from a cached row.
+
+Such a commit also stamps the browser session with its time. Every process
+reloads that browser's user when its cached copy is older than the stamp, so
+users see their own edits on their next page whichever worker serves it.
+Edits made from other browser sessions show up within USER_CACHE_TTL seconds.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import has_request_context, request, session as browser_session
+from flask_login import user_logged_out
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
+
+from app import db
+from models import ClubProfile, SponsorProfile, User
+
+
+class UserCache:
+    """Bounded LRU of detached users whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, ttl=0, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        # Bumped by every invalidation, so a load that raced one is not stored
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    @property
+    def epoch(self):
+        return self._epoch
+
+    def get(self, user_id, changed_at=0):
+        """The cached user, unless it expired or was loaded before ``changed_at`` (wall-clock time)"""
+        with self._lock:
+            item = self._entries.get(user_id)
+            if item is None:
+                return None
+            expires, loaded_at, user = item
+            if expires < time.monotonic() or loaded_at <= changed_at:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user, epoch, loaded_at):
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._entries[user_id] = (time.monotonic() + self.ttl, loaded_at, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            self._epoch += 1
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+
+cache = UserCache()
+
+
+def init_app(app):
+    """Size the cache and drop users whose rows are committed or who log out"""
+    app.config.setdefault('USER_CACHE_TTL', 0)
+    app.config.setdefault('USER_CACHE_SIZE', 1024)
+    cache.ttl = app.config['USER_CACHE_TTL']
+    cache.max_size = app.config['USER_CACHE_SIZE']
+    cache.clear()
+    user_logged_out.connect(_logged_out, app)
+    if not event.contains(Session, 'after_flush', _collect_users):
+        event.listen(Session, 'after_flush', _collect_users)
+        event.listen(Session, 'after_commit', _invalidate)
+        event.listen(Session, 'after_rollback', _discard)
+
+
+def _query(user_id):
+    return db.session.get(User, user_id,
+                          options=[joinedload(User.club_profile), joinedload(User.sponsor_profile)])
+
+
+def _detached_copy(user):
+    """A copy of ``user`` and its loaded profiles owned by no session, so no request can expire it"""
+    scratch = Session()
+    try:
+        return scratch.merge(user, load=False)
+    finally:
+        scratch.close()
+
+
+def load_user(user_id):
+    """The user with both profiles, from the cache on GET and HEAD requests when it is enabled"""
+    if not cache.ttl or not has_request_context() or request.method not in ('GET', 'HEAD'):
+        return _query(user_id)
+    cached = cache.get(user_id, browser_session.get('user_changed_at', 0))
+    if cached is not None:
+        return db.session.merge(cached, load=False)
+    epoch = cache.epoch
+    # Taken before the query, so a commit racing it leaves the copy older than its stamp
+    loaded_at = time.time()
+    user = _query(user_id)
+    if user is not None:
+        cache.set(user_id, _detached_copy(user), epoch, loaded_at)
+    return user
+
+
+def _collect_users(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, User):
+            session.info.setdefault('user_cache_ids', set()).add(obj.id)
+        elif isinstance(obj, (ClubProfile, SponsorProfile)):
+            session.info.setdefault('user_cache_ids', set()).add(obj.user_id)
+
+
+def _invalidate(session):
+    user_ids = session.info.pop('user_cache_ids', None)
+    if user_ids:
+        cache.invalidate(user_ids)
+        if has_request_context():
+            # Tells the other workers serving this browser that their copy is stale
+            browser_session['user_changed_at'] = time.time()
+
+
+def _discard(session):
+    session.info.pop('user_cache_ids', None)
+
+
+def _logged_out(app, user):
+    if user is not None and user.is_authenticated:
+        cache.invalidate([user.id])
@@ -0,0 +1,106 @@
+"""Background worker that drains the match job queue.
+
+Claimed jobs are grouped by entity type and rescored in batches on a
+process pool. At most two batches per process are in flight, so the worker
+never claims more than it can work on (backpressure). Leases of batches in
+flight are renewed every third of match_jobs.LEASE, so a rescore_all that
+runs for hours is never claimed by a second worker, while jobs left
+unfinished by a crashed worker become claimable again once their lease
+expires.
+
+    python worker.py --processes 4 --batch-size 50
+"""
+import argparse
+import logging
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from app import app, db
+import match_jobs
+
+stopping = False
+
+
+def _init_process():
+    # Connections inherited through fork must not be shared with the parent
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def rescore(entity_type, entity_ids):
+    """Runs in a pool process: rescore a batch of changed entities"""
+    from ai_matcher import ai_matcher
+    from models import Event, SponsorProfile
+
+    with app.app_context():
+        if entity_type == 'all':
+            ai_matcher.rescore_all()
+        elif entity_type == 'event':
+            ai_matcher.refresh_events(Event.query.filter(Event.id.in_(entity_ids)).all())
+        elif entity_type == 'sponsor':
+            ai_matcher.refresh_sponsors(SponsorProfile.query.filter(SponsorProfile.id.in_(entity_ids)).all())
+        else:
+            raise ValueError(f"Unknown match job type: {entity_type}")
+    return len(entity_ids)
+
+
+def run(processes, batch_size, poll_interval, once=False):
+    in_flight = {}
+    renewed = time.monotonic()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_process) as pool:
+        while not stopping or in_flight:
+            # Claim only while there is spare capacity
+            while not stopping and len(in_flight) < processes * 2:
+                with app.app_context():
+                    batches = match_jobs.claim(batch_size)
+                if not batches:
+                    break
+                for entity_type, entity_ids, job_ids in batches:
+                    in_flight[pool.submit(rescore, entity_type, entity_ids)] = (entity_type, job_ids)
+
+            if not in_flight:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                entity_type, job_ids = in_flight.pop(future)
+                error = future.exception()
+                if error is not None:
+                    logging.warning(f"Rescoring {entity_type} batch failed: {error}")
+                else:
+                    logging.info(f"Rescored {future.result()} {entity_type} entities")
+                with app.app_context():
+                    match_jobs.complete(job_ids, error)
+
+            # Heartbeat: keep the leases of running batches from expiring under them
+            if in_flight and time.monotonic() - renewed > match_jobs.LEASE.total_seconds() / 3:
+                with app.app_context():
+                    match_jobs.renew([job_id for _, job_ids in in_flight.values() for job_id in job_ids])
+                renewed = time.monotonic()
+
+
+def _stop(signum, frame):
+    global stopping
+    stopping = True
+    logging.info("Stopping after the batches in flight")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drain the match job queue")
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=50, help='jobs claimed per poll')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds between polls when idle')
+    parser.add_argument('--once', action='store_true', help='exit when the queue is empty')
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    run(args.processes, args.batch_size, args.poll_interval, args.once)
+
+
+if __name__ == '__main__':
+    main()